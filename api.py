@@ -0,0 +1,635 @@
+"""
+Local HTTP API around the highlighter, for tools that do not use the Streamlit UI.
+
+    python api.py --port 8080 --workers 4 --index ~/.cache/pdf_highlighter/document_index.sqlite3
+
+POST /jobs takes one PDF as the request body, with a Content-Length or chunked
+transfer encoding, and streams it straight to disk. The keyword selection is
+given as query parameters: keyword (repeatable), preset (repeatable, a key of
+keywords.ALL_KEYWORDS) and all=1, plus optional filename and save_mode. Once
+the upload completes the job is queued for highlighting, and the 202 response
+lists its URLs:
+
+    GET    /jobs/<id>              status as JSON
+    GET    /jobs/<id>/pdf          highlighted PDF
+    GET    /jobs/<id>/report       keyword report workbook
+    GET    /jobs/<id>/occurrences  {keyword: [page numbers]} as JSON
+    DELETE /jobs/<id>              discard a finished job and its files
+    GET    /presets                preset keyword lists
+
+Result requests of an unfinished job are answered at once with 202 and the
+job's status, unless they ask to wait for it with ?wait=SECONDS. Results are
+streamed from disk in chunks.
+
+Jobs run on a persistent pool of worker processes. A free worker takes the
+oldest job of the client with the fewest running jobs, and among those of the
+client that started a job longest ago, so clients take turns and one with many
+large files cannot hold every worker while others wait. Clients are told apart
+by an X-Client-Id header, or else by their address. Limits keep one client
+from starving the others:
+- at most max_connections requests are served at once; further connections wait in the listen backlog;
+- each client may hold at most max_client_waits connections waiting for a
+  result; its further result requests do not wait;
+- uploads are read only as fast as they are written to disk, so a fast sender
+  is throttled by TCP flow control instead of being buffered in memory;
+- beyond max_uploads concurrent uploads, max_client_jobs unfinished jobs of one
+  client or max_queued waiting jobs, uploads are refused with 503 or 429 and a
+  Retry-After header, before the body is read (clients sending
+  "Expect: 100-continue" never send it).
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+from batch import FileResult, default_worker_count, new_pool, submit_file
+from highlighter import SAVE_FULL, SAVE_MODES, new_scan_stats
+from instrumentation import configure_metrics_log, log_metrics
+from keywords import ALL_KEYWORDS, select_keywords
+from page_cache import PageCache
+from repair import PdfRepairer, file_limits
+from reports import generate_csv_report, report_filename
+
+DEFAULT_ROOT = os.path.expanduser("~/.cache/pdf_highlighter/api")
+
+TRANSFER_CHUNK_SIZE = 1024 * 1024  # Bytes read from or written to a socket at a time
+MAX_HEADER_LINE = 65536
+RESULT_WAIT_SECONDS = 300  # Longest a result request waits for its job when asked to
+RETRY_AFTER_SECONDS = 5
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Job states
+JOB_UPLOADING = "uploading"
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class ApiError(Exception):
+    """
+    A request that cannot be served, answered with the given HTTP status.
+    Requests refused for load carry a retry_after in seconds.
+    """
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Job:
+    """
+    One uploaded PDF and its results. keyword_occurrences, page_hits, scan_stats
+    and messages are those of batch.FileResult once the job has finished.
+    """
+
+    def __init__(self, job_id, client, filename, keywords, save_mode, directory):
+        self.job_id = job_id
+        self.client = client
+        self.filename = filename
+        self.keywords = frozenset(keywords)
+        self.save_mode = save_mode
+        self.directory = directory
+        self.input_path = os.path.join(directory, "input.pdf")
+        self.output_path = None
+        self.state = JOB_UPLOADING
+        self.created = time.time()
+        self.finished_at = None
+        self.upload_bytes = 0
+        self.attempts = 0
+        self.keyword_occurrences = None
+        self.page_hits = None
+        self.scan_stats = new_scan_stats()
+        self.messages = []
+        self.error = None
+        self.finished = threading.Event()
+        self.report_lock = threading.Lock()
+
+    def describe(self):
+        """
+        Return the job's status as a JSON-serializable dict.
+        """
+        base = f"/jobs/{self.job_id}"
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "state": self.state,
+            "keywords": sorted(self.keywords),
+            "save_mode": self.save_mode,
+            "upload_bytes": self.upload_bytes,
+            "error": self.error,
+            "messages": [{"level": level, "message": message} for level, message in self.messages],
+            "scan_stats": self.scan_stats,
+            "links": {"status": base, "pdf": f"{base}/pdf", "report": f"{base}/report",
+                      "occurrences": f"{base}/occurrences"},
+        }
+
+
+class HighlightService:
+    """
+    Admission, scheduling and results of the HTTP API's jobs.
+    :param root: Directory holding every job's upload and results.
+    :param max_workers: Number of worker processes (defaults to the CPU count).
+    :param index_path: Document index database used by the workers, if any.
+    :param repair: Repair callable for damaged PDFs (see batch.highlight_files_parallel).
+    :param limits: Resource limits for each file's worker process (see batch.highlight_files_parallel).
+    :param page_cache: page_cache.PageCache used by the workers, if any.
+    :param max_uploads: Uploads accepted at the same time.
+    :param max_client_jobs: Unfinished jobs (uploading, queued or running) allowed per client.
+    :param max_client_waits: Result requests of one client allowed to wait for their job at once.
+    :param max_queued: Jobs allowed to wait for a worker.
+    :param max_upload_bytes: Largest PDF accepted.
+    :param ttl_seconds: Finished jobs are deleted this long after they end.
+    """
+
+    def __init__(self, root, max_workers=None, index_path=None, repair=None, limits=None, page_cache=None,
+                 max_uploads=8, max_client_jobs=4, max_client_waits=2, max_queued=64, max_upload_bytes=1024 ** 3,
+                 ttl_seconds=3600):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_workers = max(1, max_workers or default_worker_count())
+        self.index_path = index_path
+        self.repair = repair
+        self.limits = limits
+        self.page_cache = page_cache
+        self.max_uploads = max_uploads
+        self.max_client_jobs = max_client_jobs
+        self.max_client_waits = max_client_waits
+        self.max_queued = max_queued
+        self.max_upload_bytes = max_upload_bytes
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}  # job_id -> Job
+        self._waiting = []  # Queued jobs, oldest first
+        self._running = {}  # client -> number of running jobs
+        self._last_started = {}  # client -> number of the client's latest job start
+        self._starts = 0
+        self._uploads = 0
+        self._waits = {}  # client -> result requests waiting for their job
+        self._pool = None
+        # Reentrant: a job finishing before its callback is added runs the callback at once
+        self._lock = threading.RLock()
+
+    def admit(self, client, filename, keywords, save_mode):
+        """
+        Return a new Job for an upload about to start, or raise ApiError if a limit is reached.
+        """
+        with self._lock:
+            self._prune_locked()
+            if self._uploads >= self.max_uploads:
+                raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many uploads in progress.", RETRY_AFTER_SECONDS)
+            if len(self._waiting) >= self.max_queued:
+                raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many jobs queued.", RETRY_AFTER_SECONDS)
+            unfinished = sum(1 for job in self._jobs.values() if job.client == client and not job.finished.is_set())
+            if unfinished >= self.max_client_jobs:
+                raise ApiError(HTTPStatus.TOO_MANY_REQUESTS,
+                               f"At most {self.max_client_jobs} unfinished jobs per client.", RETRY_AFTER_SECONDS)
+            job_id = uuid.uuid4().hex
+            job = Job(job_id, client, filename, keywords, save_mode, os.path.join(self.root, job_id))
+            self._jobs[job_id] = job
+            self._uploads += 1
+        os.makedirs(job.directory)
+        return job
+
+    def uploaded(self, job, size):
+        """
+        Queue a job whose upload has completed.
+        """
+        with self._lock:
+            self._uploads -= 1
+            job.upload_bytes = size
+            job.state = JOB_QUEUED
+            self._waiting.append(job)
+            self._start_next_locked()
+
+    def upload_failed(self, job):
+        """
+        Forget a job whose upload was refused or broke off.
+        """
+        with self._lock:
+            self._uploads -= 1
+            self._jobs.pop(job.job_id, None)
+        shutil.rmtree(job.directory, ignore_errors=True)
+
+    def job(self, job_id):
+        """
+        Return the Job with the given ID, or None.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait_finished(self, job, client, seconds):
+        """
+        Wait up to seconds for a job to finish and return whether it has. A
+        client already waiting in max_client_waits requests does not wait again.
+        """
+        with self._lock:
+            if self._waits.get(client, 0) >= self.max_client_waits:
+                seconds = 0
+            self._waits[client] = self._waits.get(client, 0) + 1
+        try:
+            return job.finished.wait(seconds)
+        finally:
+            with self._lock:
+                self._waits[client] -= 1
+                if not self._waits[client]:
+                    del self._waits[client]
+
+    def discard(self, job):
+        """
+        Delete a finished job and its files.
+        """
+        with self._lock:
+            self._jobs.pop(job.job_id, None)
+        shutil.rmtree(job.directory, ignore_errors=True)
+
+    def report_path(self, job):
+        """
+        Return the path of a finished job's report workbook, written on first request.
+        """
+        path = os.path.join(job.directory, "report.xlsx")
+        with job.report_lock:
+            if not os.path.exists(path):
+                with open(path + ".part", "wb") as report_file:
+                    report_file.write(generate_csv_report(job.keyword_occurrences or {}).getbuffer())
+                os.replace(path + ".part", path)
+        return path
+
+    def close(self):
+        """
+        Stop the worker processes; running jobs are abandoned.
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _start_next_locked(self):
+        # Clients with the fewest running jobs go first, then the client that
+        # started a job longest ago; min() keeps the oldest job among equals
+        while self._waiting and sum(self._running.values()) < self.max_workers:
+            job = min(self._waiting, key=lambda waiting: (self._running.get(waiting.client, 0),
+                                                          self._last_started.get(waiting.client, -1)))
+            self._waiting.remove(job)
+            self._submit_locked(job)
+
+    def _submit_locked(self, job):
+        if self._pool is None:
+            self._pool = new_pool(self.max_workers, self.limits)
+        pool = self._pool
+        try:
+            future = submit_file(pool, job.filename, job.input_path, job.keywords, job.directory, self.index_path,
+                                 job.save_mode, self.repair, page_cache=self.page_cache)
+        except BrokenProcessPool:
+            self._pool = None
+            return self._submit_locked(job)
+        job.state = JOB_RUNNING
+        job.attempts += 1
+        self._starts += 1
+        self._last_started[job.client] = self._starts
+        self._running[job.client] = self._running.get(job.client, 0) + 1
+        future.add_done_callback(lambda done: self._finished(job, pool, done))
+
+    def _finished(self, job, pool, future):
+        with self._lock:
+            self._running[job.client] -= 1
+            if not self._running[job.client]:
+                del self._running[job.client]
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                if self._pool is pool:
+                    pool.shutdown(wait=False)
+                    self._pool = None
+                # Every running job fails with the pool; each gets one more attempt in a fresh pool
+                if job.attempts < 2:
+                    job.state = JOB_QUEUED
+                    self._waiting.insert(0, job)
+                    self._start_next_locked()
+                    return
+                result = FileResult(job.filename, None, None, None, None, new_scan_stats(), [], str(e))
+            except Exception as e:
+                result = FileResult(job.filename, None, None, None, None, new_scan_stats(), [], str(e))
+            job.output_path = result.output_path
+            job.keyword_occurrences = result.keyword_occurrences
+            job.page_hits = result.page_hits
+            job.scan_stats = result.scan_stats
+            job.messages = result.messages
+            job.error = result.error
+            job.state = JOB_DONE if result.error is None else JOB_FAILED
+            job.finished_at = time.time()
+            job.finished.set()
+            self._start_next_locked()
+        log_metrics("file", job.filename, job.scan_stats, processed=job.error is None, client=job.client,
+                    upload_bytes=job.upload_bytes, wall_seconds=job.finished_at - job.created)
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.ttl_seconds
+        for job in [job for job in self._jobs.values() if job.finished.is_set() and job.finished_at < cutoff]:
+            del self._jobs[job.job_id]
+            shutil.rmtree(job.directory, ignore_errors=True)
+        active = {job.client for job in self._jobs.values() if not job.finished.is_set()}
+        self._last_started = {client: start for client, start in self._last_started.items() if client in active}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of the HTTP API (see the module docstring); the server's service is a HighlightService.
+    """
+    protocol_version = "HTTP/1.1"
+    server_version = "PDF-Highlighter"
+    timeout = 60  # Seconds a stalled or idle connection may hold its thread
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+    def handle_expect_100(self):
+        # 100 Continue is sent by do_POST once the upload has been admitted
+        return True
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path.rstrip("/") != "/jobs":
+                raise ApiError(HTTPStatus.NOT_FOUND, "Not found.")
+            job = self._admit(parse_qs(url.query))
+        except ApiError as e:
+            # The body has not been read, so the connection cannot be reused
+            self.close_connection = True
+            return self._send_error(e)
+
+        if self.headers.get("Expect", "").lower() == "100-continue":
+            self.send_response_only(HTTPStatus.CONTINUE)
+            self.end_headers()
+        try:
+            size = self._receive(job.input_path)
+        except (ApiError, OSError, ValueError) as e:
+            self.service.upload_failed(job)
+            self.close_connection = True
+            if not isinstance(e, ApiError):
+                logging.warning(f"Upload of {job.filename} from {job.client} failed: {e}")
+                e = ApiError(HTTPStatus.BAD_REQUEST, f"Upload failed: {e}")
+            try:
+                return self._send_error(e)
+            except OSError:
+                return None  # The client is gone
+        self.service.uploaded(job, size)
+        self._send_json(HTTPStatus.ACCEPTED, job.describe(), {"Location": f"/jobs/{job.job_id}"})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        try:
+            if parts == ["presets"]:
+                return self._send_json(HTTPStatus.OK, ALL_KEYWORDS)
+            job = self._job(parts)
+            if len(parts) == 2:
+                return self._send_json(HTTPStatus.OK, job.describe())
+            if parts[2] not in ("pdf", "report", "occurrences"):
+                raise ApiError(HTTPStatus.NOT_FOUND, "Not found.")
+            wait = parse_qs(url.query).get("wait", [0])[-1]
+            try:
+                wait = min(max(float(wait), 0), RESULT_WAIT_SECONDS)
+            except ValueError:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "wait must be a number of seconds.")
+            if not self.service.wait_finished(job, self._client(), wait):
+                return self._send_json(HTTPStatus.ACCEPTED, job.describe(), {"Retry-After": RETRY_AFTER_SECONDS})
+            if job.error is not None:
+                return self._send_json(HTTPStatus.UNPROCESSABLE_ENTITY, job.describe())
+            if parts[2] == "occurrences":
+                return self._send_json(HTTPStatus.OK, job.keyword_occurrences)
+            if parts[2] == "pdf":
+                return self._send_file(job.output_path, "application/pdf", os.path.basename(job.output_path))
+            return self._send_file(self.service.report_path(job), XLSX_TYPE, report_filename(job.filename))
+        except ApiError as e:
+            return self._send_error(e)
+
+    def do_DELETE(self):
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        try:
+            job = self._job(parts)
+            if len(parts) != 2:
+                raise ApiError(HTTPStatus.NOT_FOUND, "Not found.")
+            if not job.finished.is_set():
+                raise ApiError(HTTPStatus.CONFLICT, "The job has not finished yet.")
+        except ApiError as e:
+            return self._send_error(e)
+        self.service.discard(job)
+        self.send_response(HTTPStatus.NO_CONTENT)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _job(self, parts):
+        if parts[0] != "jobs" or len(parts) not in (2, 3):
+            raise ApiError(HTTPStatus.NOT_FOUND, "Not found.")
+        job = self.service.job(parts[1])
+        if job is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"No job {parts[1]}.")
+        return job
+
+    def _admit(self, params):
+        """
+        Validate an upload's parameters and headers and return its admitted Job.
+        """
+        try:
+            keywords = select_keywords(params.get("keyword", []), params.get("preset", []),
+                                       params.get("all", ["0"])[-1].lower() in ("1", "true", "yes"))
+        except KeyError as e:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"Unknown preset {e.args[0]}; see /presets.")
+        if not keywords:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "No keywords selected; use keyword, preset or all=1.")
+        save_mode = params.get("save_mode", [SAVE_FULL])[-1]
+        if save_mode not in SAVE_MODES:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"save_mode must be one of {', '.join(SAVE_MODES)}.")
+        filename = os.path.basename(params.get("filename", [""])[-1].replace("\\", "/")) or "document.pdf"
+
+        if "chunked" not in self.headers.get("Transfer-Encoding", "").lower():
+            length = self.headers.get("Content-Length")
+            if length is None or not length.isdigit():
+                raise ApiError(HTTPStatus.LENGTH_REQUIRED, "Send a Content-Length or a chunked body.")
+            if int(length) > self.service.max_upload_bytes:
+                raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                               f"Uploads are limited to {self.service.max_upload_bytes} bytes.")
+        return self.service.admit(self._client(), filename, keywords, save_mode)
+
+    def _client(self):
+        return self.headers.get("X-Client-Id") or self.client_address[0]
+
+    def _receive(self, path):
+        """
+        Stream the request body to path and return its size.
+        """
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            chunks = self._chunked_body()
+        else:
+            chunks = self._body(int(self.headers["Content-Length"]))
+        size = 0
+        with open(path, "wb") as upload_file:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > self.service.max_upload_bytes:
+                    raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                   f"Uploads are limited to {self.service.max_upload_bytes} bytes.")
+                upload_file.write(chunk)
+        return size
+
+    def _body(self, length):
+        while length:
+            chunk = self.rfile.read(min(TRANSFER_CHUNK_SIZE, length))
+            if not chunk:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "The upload ended early.")
+            length -= len(chunk)
+            yield chunk
+
+    def _chunked_body(self):
+        while True:
+            size = int(self.rfile.readline(MAX_HEADER_LINE).split(b";")[0], 16)
+            if not size:
+                # Skip the trailer section
+                while self.rfile.readline(MAX_HEADER_LINE) not in (b"\r\n", b"\n", b""):
+                    pass
+                return
+            yield from self._body(size)
+            self.rfile.readline(MAX_HEADER_LINE)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, error):
+        headers = {"Retry-After": error.retry_after} if error.retry_after else None
+        self._send_json(error.status, {"error": str(error)}, headers)
+
+    def _send_file(self, path, content_type, filename):
+        try:
+            source = open(path, "rb")
+        except OSError:
+            raise ApiError(HTTPStatus.GONE, "The job's files have been deleted.")
+        with source:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(os.fstat(source.fileno()).st_size))
+            self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(filename)}")
+            self.end_headers()
+            # Written a chunk at a time, so a slow reader only holds up its own thread
+            shutil.copyfileobj(source, self.wfile, TRANSFER_CHUNK_SIZE)
+
+
+class ApiServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server of the API that serves at most max_connections connections at a time.
+    """
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, address, service, max_connections=32):
+        self.service = service
+        self._connections = threading.BoundedSemaphore(max_connections)
+        super().__init__(address, ApiHandler)
+
+    def process_request(self, request, client_address):
+        # Blocking here stops accepting, so further connections wait in the listen backlog
+        self._connections.acquire()
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._connections.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._connections.release()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve the PDF highlighter over HTTP on this machine.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default: 8080)")
+    parser.add_argument("--root", default=DEFAULT_ROOT,
+                        help=f"Directory for uploads and results (default: {DEFAULT_ROOT})")
+    parser.add_argument("-w", "--workers", type=int, default=default_worker_count(),
+                        help="Number of worker processes (default: one per CPU)")
+    parser.add_argument("--index", metavar="PATH",
+                        help="Document index database; re-runs on indexed PDFs skip text extraction")
+    parser.add_argument("--page-cache", metavar="PATH",
+                        help="Page cache database; pages already seen in any PDF skip extraction and matching")
+    parser.add_argument("--repair-cache", metavar="DIR",
+                        help="Keep repaired copies of damaged PDFs here, so each is repaired only once")
+    parser.add_argument("--cpu-limit", type=float, metavar="SECONDS",
+                        help="CPU time limit per PDF; a PDF exceeding it is reported as failed")
+    parser.add_argument("--memory-limit", type=int, metavar="MB",
+                        help="Address-space limit per PDF in megabytes; a PDF exceeding it is reported as failed")
+    parser.add_argument("--max-connections", type=int, default=32, help="Requests served at once (default: 32)")
+    parser.add_argument("--max-uploads", type=int, default=8, help="Uploads accepted at once (default: 8)")
+    parser.add_argument("--max-client-jobs", type=int, default=4,
+                        help="Unfinished jobs allowed per client (default: 4)")
+    parser.add_argument("--max-client-waits", type=int, default=2,
+                        help="Result requests of one client waiting for their job at once (default: 2)")
+    parser.add_argument("--max-queued", type=int, default=64, help="Jobs allowed to wait for a worker (default: 64)")
+    parser.add_argument("--max-upload-mb", type=int, default=1024, help="Largest PDF accepted (default: 1024)")
+    parser.add_argument("--ttl", type=float, default=3600, metavar="SECONDS",
+                        help="Delete finished jobs this long after they end (default: 3600)")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Append per-file stage timings, counts and peak memory as JSON lines")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log requests and progress details to stderr")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    if args.metrics:
+        configure_metrics_log(args.metrics, propagate=False)
+
+    limits, repair_limits = file_limits(args.cpu_limit, args.memory_limit * 1024 ** 2 if args.memory_limit else None)
+    service = HighlightService(
+        os.path.expanduser(args.root), max_workers=args.workers,
+        index_path=os.path.expanduser(args.index) if args.index else None,
+        repair=PdfRepairer(os.path.expanduser(args.repair_cache) if args.repair_cache else None,
+                           limits=repair_limits),
+        limits=limits,
+        page_cache=PageCache(os.path.expanduser(args.page_cache)) if args.page_cache else None,
+        max_uploads=args.max_uploads, max_client_jobs=args.max_client_jobs,
+        max_client_waits=args.max_client_waits, max_queued=args.max_queued,
+        max_upload_bytes=args.max_upload_mb * 1024 ** 2, ttl_seconds=args.ttl,
+    )
+    server = ApiServer((args.host, args.port), service, max_connections=args.max_connections)
+    print(f"Serving the PDF highlighter on http://{args.host}:{server.server_address[1]}/", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,423 @@
+"""
+Process-pool execution of the highlighter.
+
+highlight_files_parallel spreads a batch of files over worker processes and
+yields results to the caller as they complete, so the UI can update progress
+per file. A worker that crashes (for example MuPDF aborting on a malformed
+PDF) only fails the file it was working on; the rest of the batch is
+resubmitted to a fresh pool. With resource limits, every file gets a fresh
+worker process capped in CPU time and address space, so a pathological file
+fails on its own instead of starving the rest of the batch.
+
+highlight_pdf_sharded splits the pages of one large PDF into shards. Workers
+search their shard and compute highlight rectangles, and the parent applies
+all of them to the document in a single merge step.
+"""
+import functools
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+
+from document_index import DocumentIndex
+from highlighter import (
+    SAVE_FULL,
+    find_page_highlights,
+    finish_highlighting,
+    highlight_document,
+    highlight_text_in_pdf,
+    merge_scan_stats,
+    new_scan_stats,
+    open_pdf_source,
+    rehighlight_pdf,
+    validate_pdf,
+)
+from instrumentation import profile_call
+from keyword_matcher import compile_keywords
+from repair import apply_limits
+from result_cache import content_hash
+
+# Smallest default shard; smaller documents are not worth the worker start-up cost
+MIN_SHARD_PAGES = 50
+
+# Result of highlighting one file in a worker process.
+# error is None on success. The highlighted PDF is returned as pdf_bytes, or,
+# when an output directory was given, written to output_path by the worker.
+# page_hits holds the report rows of highlighter.collect_page_hits.
+FileResult = namedtuple(
+    "FileResult",
+    ["filename", "pdf_bytes", "output_path", "keyword_occurrences", "page_hits", "scan_stats", "messages", "error"],
+)
+
+
+# Source of a file re-highlighted from an earlier result instead of from scratch
+# (see highlighter.rehighlight_pdf). base_path is the earlier highlighted PDF,
+# keywords the selection it was highlighted with and keyword_occurrences and
+# page_hits its results; doc_hash is the content hash of the original at
+# input_path, which is highlighted from scratch if the earlier PDF is unusable.
+RehighlightSource = namedtuple(
+    "RehighlightSource",
+    ["input_path", "doc_hash", "base_path", "keywords", "keyword_occurrences", "page_hits"],
+)
+
+
+def default_worker_count():
+    """
+    Return the default number of worker processes (one per CPU).
+    """
+    return os.cpu_count() or 1
+
+
+def _highlight_worker(source, selected_keywords, original_filename, output_path=None, index_path=None,
+                      save_mode=SAVE_FULL, repair=None, progress=None, page_cache=None, shard_workers=1):
+    """
+    Worker-process entry point: highlight one file and return a FileResult.
+    source is either the PDF bytes, a path to read them from or a RehighlightSource.
+    If index_path is given, the document index at that path is used and updated.
+    repair is passed on to highlighter.open_pdf_source, and
+    progress(original_filename, pages_done, page_count) is called as pages are searched.
+    page_cache is passed on to highlighter.search_document.
+    With shard_workers above 1, a file highlighted from scratch has its pages
+    split across that many further processes (see highlight_pdf_sharded).
+    Messages meant for the user are collected and replayed by the parent.
+    """
+    messages = []
+    scan_stats = new_scan_stats()
+    page_hits = []
+    notify = lambda level, message: messages.append((level, message))
+    document_index = DocumentIndex(index_path) if index_path else None
+    file_progress = functools.partial(progress, original_filename) if progress else None
+
+    updated_pdf = None
+    if isinstance(source, RehighlightSource):
+        updated_pdf, keyword_occurrences = rehighlight_pdf(
+            source.base_path, source.keywords, source.keyword_occurrences, source.page_hits, selected_keywords,
+            original_filename, scan_stats=scan_stats, notify=notify, document_index=document_index,
+            doc_hash=source.doc_hash, save_mode=save_mode, page_hits=page_hits, progress=file_progress,
+            page_cache=page_cache,
+        )
+        if updated_pdf is None:
+            logging.warning(f"{original_filename}: re-highlighting failed, highlighting from scratch.")
+            page_hits = []
+            source = source.input_path
+
+    if updated_pdf is None:
+        if isinstance(source, bytes):
+            file_content = source
+        elif isinstance(source, (bytearray, memoryview)):
+            file_content = bytes(source)
+        else:
+            with open(source, "rb") as source_file:
+                file_content = source_file.read()
+
+        options = dict(scan_stats=scan_stats, notify=notify, document_index=document_index, save_mode=save_mode,
+                       page_hits=page_hits, repair=repair, progress=file_progress, page_cache=page_cache)
+        if shard_workers > 1:
+            updated_pdf, keyword_occurrences = highlight_pdf_sharded(
+                file_content, selected_keywords, original_filename, max_workers=shard_workers, **options
+            )
+        else:
+            updated_pdf, keyword_occurrences = highlight_text_in_pdf(
+                file_content, selected_keywords, original_filename,
+                doc_hash=content_hash(file_content) if document_index is not None else None, **options
+            )
+    if updated_pdf is None:
+        return FileResult(original_filename, None, None, None, None, scan_stats, messages, "could not be processed")
+
+    if output_path is None:
+        return FileResult(original_filename, updated_pdf.getvalue(), None, keyword_occurrences, page_hits, scan_stats,
+                          messages, None)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "wb") as output_file:
+        output_file.write(updated_pdf.getbuffer())
+    return FileResult(original_filename, None, output_path, keyword_occurrences, page_hits, scan_stats, messages, None)
+
+
+def _failed(filename, error):
+    logging.error(f"Worker failed on {filename}: {error}")
+    return FileResult(filename, None, None, None, None, new_scan_stats(), [], str(error))
+
+
+def _shard_worker(pdf_path, selected_keywords, page_numbers, index_path=None, doc_hash=None, page_cache=None):
+    """
+    Worker-process entry point: search one shard of pages and return (hits, scan_stats).
+    With an index_path, the shard's pages are added to the document index and
+    searched from there. page_cache is passed on to the search or the index.
+    """
+    stats = new_scan_stats()
+    matcher = compile_keywords(selected_keywords)
+    with fitz.open(pdf_path) as pdf_document:
+        if index_path is None:
+            hits = find_page_highlights(pdf_document, matcher, page_numbers, stats, page_cache=page_cache)
+        else:
+            document_index = DocumentIndex(index_path)
+            document_index.add_pages(doc_hash, pdf_document, page_numbers, stats, page_cache=page_cache)
+            hits = document_index.search_pages(doc_hash, matcher, stats, page_numbers)
+    return hits, stats
+
+
+def _spawn_context():
+    # Spawn rather than fork: the Streamlit server process is multi-threaded
+    return multiprocessing.get_context("spawn")
+
+
+def new_pool(max_workers, limits=None):
+    """
+    Start a process pool; with limits (a repair.ResourceLimits), each worker
+    process handles a single file under its CPU time and memory limits.
+    """
+    if limits is None:
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=_spawn_context())
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=_spawn_context(), initializer=apply_limits,
+                               initargs=(limits.cpu_seconds, limits.memory_bytes), max_tasks_per_child=1)
+
+
+def highlighted_path(output_dir, filename):
+    """
+    Return where a worker writes the highlighted copy of filename under output_dir (None without one).
+    """
+    if not output_dir:
+        return None
+    directory, name = os.path.split(filename)
+    return os.path.join(output_dir, directory, f"highlighted_{name}")
+
+
+def submit_file(pool, filename, source, selected_keywords, output_dir=None, index_path=None, save_mode=SAVE_FULL,
+                repair=None, progress=None, page_cache=None, shard_workers=1):
+    """
+    Submit one file to a pool started with new_pool and return the Future of its FileResult.
+    The parameters are those of highlight_files_parallel. Unlike highlight_files_parallel,
+    a worker crash is not retried: the Future raises BrokenProcessPool.
+    """
+    return pool.submit(
+        _highlight_worker, source, frozenset(selected_keywords), filename,
+        highlighted_path(output_dir, filename), index_path, save_mode, repair, progress, page_cache, shard_workers
+    )
+
+
+def _run_pool(files, submit, max_workers, limits, suspects, deferred):
+    """
+    Run files through one process pool, keeping at most two jobs per worker in
+    flight so that a large input iterator is consumed lazily.
+    submit(pool, filename, source) submits the job of one file.
+    Yields FileResults; returns True if the pool broke before files was exhausted.
+    Files that were in flight when the pool broke are appended to suspects, and
+    a file that could not be submitted to the broken pool is appended to deferred.
+    """
+    broken = False
+    with new_pool(max_workers, limits) as pool:
+        futures = {}
+
+        def submit_next():
+            nonlocal broken
+            for filename, source in files:
+                try:
+                    future = submit(pool, filename, source)
+                except BrokenProcessPool:
+                    # Not started yet, so not a suspect: hand it to the next pool
+                    broken = True
+                    deferred.append((filename, source))
+                    return False
+                futures[future] = (filename, source)
+                return True
+            return False
+
+        for _ in range(max_workers * 2):
+            if broken or not submit_next():
+                break
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename, source = futures.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    # Any in-flight file may have caused the crash; retry them one by one
+                    broken = True
+                    suspects.append((filename, source))
+                    continue
+                except Exception as e:
+                    result = _failed(filename, e)
+                yield result
+                if not broken:
+                    submit_next()
+    return broken
+
+
+def highlight_files_parallel(files, selected_keywords, max_workers=None, output_dir=None, index_path=None,
+                             save_mode=SAVE_FULL, repair=None, limits=None, progress=None, page_cache=None,
+                             shard_workers=1):
+    """
+    Highlight a batch of PDFs in worker processes.
+    :param files: Iterable of (filename, source) pairs, where source is the PDF bytes,
+                  a path to the PDF or a RehighlightSource. The iterable is consumed lazily.
+    :param selected_keywords: Keywords to highlight in every file.
+    :param max_workers: Number of worker processes (defaults to the CPU count).
+    :param output_dir: If given, workers write highlighted PDFs there instead of returning bytes.
+    :param index_path: If given, path of the DocumentIndex database workers look up and update.
+    :param save_mode: Output mode for the highlighted PDFs (see highlighter.save_highlighted).
+    :param repair: Repair callable for damaged PDFs, passed to the workers (see highlighter.open_pdf_source).
+                   It must be picklable, like repair.PdfRepairer.
+    :param limits: If given, a repair.ResourceLimits for every file's worker process. A file exceeding
+                   them is reported as failed; its wall_seconds are not enforced.
+    :param progress: Optional picklable callable, called in the workers as
+                     progress(filename, pages_done, page_count) while a file's pages are searched.
+    :param page_cache: Optional page_cache.PageCache the workers look up and update.
+    :param shard_workers: Processes each file's pages are split across, started by its
+                          worker under the same limits (see highlight_pdf_sharded);
+                          1 highlights every file in its worker alone.
+    :return: Generator of FileResult, in completion order.
+    """
+    selected_keywords = frozenset(selected_keywords)
+    max_workers = max(1, max_workers or default_worker_count())
+    files = iter(files)
+
+    def submit(pool, filename, source):
+        return submit_file(pool, filename, source, selected_keywords, output_dir, index_path, save_mode, repair,
+                           progress, page_cache, shard_workers)
+
+    # Run the batch on a shared pool, starting a fresh pool for the remaining
+    # files whenever a worker crash breaks the current one
+    suspects = []
+    deferred = []
+    while (yield from _run_pool(files, submit, max_workers, limits, suspects, deferred)):
+        files = itertools.chain(deferred, files)
+        deferred = []
+
+    # Files caught in a crashed pool run in isolation, so a crash can only be
+    # blamed on the file that caused it
+    for filename, source in suspects:
+        try:
+            with new_pool(1, limits) as pool:
+                yield submit(pool, filename, source).result()
+        except Exception as e:
+            yield _failed(filename, e)
+
+
+def profile_file(filename, source, selected_keywords, output_dir=None, index_path=None, save_mode=SAVE_FULL,
+                 repair=None, page_cache=None):
+    """
+    Highlight one file in this process under cProfile, as a worker would.
+    Returns (FileResult, profiler); see instrumentation.profile_summary.
+    """
+    return profile_call(
+        _highlight_worker, source, frozenset(selected_keywords), filename,
+        highlighted_path(output_dir, filename), index_path, save_mode, repair, page_cache=page_cache
+    )
+
+
+def split_pages(page_count, max_workers, pages_per_shard=None):
+    """
+    Split range(page_count) into contiguous shards.
+    By default there are about four shards per worker, which keeps workers busy
+    when some page ranges are denser than others, and no shard is smaller than
+    MIN_SHARD_PAGES.
+    """
+    if not pages_per_shard:
+        pages_per_shard = max(MIN_SHARD_PAGES, math.ceil(page_count / (max_workers * 4)))
+    return [range(start, min(start + pages_per_shard, page_count)) for start in range(0, page_count, pages_per_shard)]
+
+
+def highlight_pdf_sharded(file_content, selected_keywords, original_filename, max_workers=None,
+                          pages_per_shard=None, scan_stats=None, notify=None, document_index=None,
+                          save_mode=SAVE_FULL, page_hits=None, repair=None, progress=None, page_cache=None):
+    """
+    Highlight one PDF using worker processes for page shards.
+    Returns the same (output_pdf, keyword_occurrences) pair as highlight_text_in_pdf,
+    with identical per-page occurrence lists.
+    """
+    stats = new_scan_stats()
+    pdf_document, source_bytes = open_pdf_source(file_content, original_filename, notify=notify, stats=stats,
+                                                 repair=repair)
+    if pdf_document is None or not validate_pdf(pdf_document, original_filename, notify=notify):
+        if pdf_document is not None:
+            pdf_document.close()
+        if scan_stats is not None:
+            merge_scan_stats(scan_stats, stats)
+        return None, None
+    return highlight_document_sharded(
+        pdf_document, source_bytes, selected_keywords, original_filename, max_workers=max_workers,
+        pages_per_shard=pages_per_shard, scan_stats=scan_stats, notify=notify, document_index=document_index,
+        doc_hash=content_hash(file_content) if document_index is not None else None, save_mode=save_mode,
+        page_hits=page_hits, stats=stats, progress=progress, page_cache=page_cache
+    )
+
+
+def highlight_document_sharded(pdf_document, source_bytes, selected_keywords, original_filename, max_workers=None,
+                               pages_per_shard=None, scan_stats=None, notify=None, document_index=None, doc_hash=None,
+                               save_mode=SAVE_FULL, page_hits=None, stats=None, progress=None, page_cache=None):
+    """
+    Sharded counterpart of highlight_document for an already opened document.
+    source_bytes are the bytes the document was opened from (see open_pdf_source);
+    workers read them from a temporary file. A document that is already in the
+    document index is answered from the index without starting workers;
+    otherwise the workers build its index shard by shard. stats is this file's
+    scan statistics record, as in highlight_document. progress(pages_done, page_count)
+    is called as shards complete; workers look up and update page_cache, if given.
+    """
+    max_workers = max(1, max_workers or default_worker_count())
+    shards = split_pages(len(pdf_document), max_workers, pages_per_shard)
+    use_index = document_index is not None and bool(doc_hash)
+    if max_workers == 1 or len(shards) < 2 or (use_index and document_index.has(doc_hash)):
+        return highlight_document(pdf_document, selected_keywords, original_filename,
+                                  scan_stats=scan_stats, notify=notify,
+                                  document_index=document_index, doc_hash=doc_hash, save_mode=save_mode,
+                                  page_hits=page_hits, stats=stats, progress=progress, page_cache=page_cache)
+    index_path = document_index.path if use_index else None
+
+    keyword_set = frozenset(selected_keywords)
+    hits_by_shard = [None] * len(shards)
+    if stats is None:
+        stats = new_scan_stats()
+
+    # Workers open the document from a temporary file instead of each
+    # receiving a pickled copy of the bytes
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, "source.pdf")
+        with open(pdf_path, "wb") as source_file:
+            source_file.write(source_bytes)
+
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=_spawn_context()) as pool:
+                futures = {
+                    pool.submit(_shard_worker, pdf_path, keyword_set, shard, index_path, doc_hash, page_cache): index
+                    for index, shard in enumerate(shards)
+                }
+                pages_done = 0
+                if progress:
+                    progress(pages_done, len(pdf_document))
+                for future in as_completed(futures):
+                    shard_hits, shard_stats = future.result()
+                    hits_by_shard[futures[future]] = shard_hits
+                    merge_scan_stats(stats, shard_stats)
+                    if progress:
+                        pages_done += len(shards[futures[future]])
+                        progress(pages_done, len(pdf_document))
+        except Exception as e:
+            pdf_document.close()
+            logging.error(f"Sharded highlighting failed for {original_filename}: {e}")
+            if notify:
+                notify("error", f"⚠️ Failed to highlight {original_filename} in parallel: {e}")
+            # The shards that completed are counted, as are the open and repair times
+            if scan_stats is not None:
+                merge_scan_stats(scan_stats, stats)
+            return None, None
+
+    if use_index:
+        document_index.mark_complete(doc_hash, len(pdf_document))
+
+    # Merge step: shards are concatenated in page order and applied at once
+    hits = [hit for shard_hits in hits_by_shard for hit in shard_hits]
+    return finish_highlighting(
+        pdf_document, selected_keywords, original_filename, hits, stats,
+        scan_stats=scan_stats, notify=notify, save_mode=save_mode, page_hits=page_hits
+    )
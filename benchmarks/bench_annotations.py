@@ -0,0 +1,76 @@
+"""
+Annotation count and output size with and without highlight merging.
+
+Builds a sample corpus of council-minute style pages where overlapping
+keywords ("Planning", "Planning Scheme", "Planning Scheme Amendment") and
+keywords listed in several presets ("VPA") hit the same text, finds the hits
+once, then applies them per hit and merged per line. Reports annotation
+counts, output sizes and save times for both.
+
+Run from the repository root:
+    python -m benchmarks.bench_annotations --pages 200
+"""
+import argparse
+import sys
+import time
+from io import BytesIO
+
+import fitz  # PyMuPDF
+
+from highlighter import apply_highlights, find_page_highlights, new_scan_stats
+from keyword_matcher import compile_keywords
+from keywords import ALL_KEYWORDS
+
+SAMPLE_LINES = [
+    "Item {n}: Planning Scheme Amendment C{n} to the local Planning Scheme",
+    "The VPA and the Precinct Structure Plan were noted by council",
+    "Rezoning request for the Activity Centre and Development Contributions Plan",
+    "General business and correspondence received during the period",
+]
+
+
+def make_corpus(pages):
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        for line in range(40):
+            text = SAMPLE_LINES[line % len(SAMPLE_LINES)].format(n=page_num * 40 + line)
+            page.insert_text((40, 40 + line * 18), text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def highlighted(file_content, hits, merge):
+    with fitz.open(stream=file_content) as pdf_document:
+        started = time.perf_counter()
+        apply_highlights(pdf_document, hits, merge=merge)
+        output = BytesIO()
+        pdf_document.save(output)
+        elapsed = time.perf_counter() - started
+        annotations = sum(len(list(page.annots())) for page in pdf_document)
+    return annotations, output.getbuffer().nbytes, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-hit and merged highlight annotations.")
+    parser.add_argument("--pages", type=int, default=200, help="Number of pages in the sample corpus")
+    args = parser.parse_args()
+
+    file_content = make_corpus(args.pages)
+    # Every keyword of every preset, duplicates included, as when "Select All" is used
+    keywords = [keyword for group in ALL_KEYWORDS.values() for keyword in group]
+    with fitz.open(stream=file_content) as pdf_document:
+        hits = find_page_highlights(pdf_document, compile_keywords(keywords), range(len(pdf_document)),
+                                    new_scan_stats())
+    print(f"{args.pages} pages, {len(hits)} keyword hits, input {len(file_content) / 1024:.0f} KB")
+
+    for label, merge in (("per hit", False), ("merged", True)):
+        annotations, size, elapsed = highlighted(file_content, hits, merge)
+        print(f"  {label:8} {annotations:7d} annotations, {size / 1024:8.0f} KB, "
+              f"annotate + save {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""
+Benchmark re-querying an indexed document with new keyword selections.
+
+Builds a synthetic text-heavy PDF and its document index, then answers
+several keyword selections from the index and by live extraction
+(find_page_highlights). Reports the time of the search stage, which is what
+the index replaces, and of a full highlight_text_in_pdf run, which also pays
+for writing the highlighted PDF. Exits with status 1 when indexed hits differ
+from live extraction or an indexed query takes longer than --max-seconds.
+
+Run from the repository root:
+    python -m benchmarks.bench_document_index --pages 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from document_index import DocumentIndex
+from highlighter import find_page_highlights, highlight_text_in_pdf, new_scan_stats
+from keyword_matcher import compile_keywords
+from keywords import ALL_KEYWORDS
+from result_cache import content_hash
+
+LINES_PER_PAGE = 40
+
+
+def make_pdf(pages):
+    """
+    Return PDF bytes with pages of filler text and a keyword on every fifth page.
+    """
+    keywords = sorted({keyword for group in ALL_KEYWORDS.values() for keyword in group})
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        for line in range(LINES_PER_PAGE):
+            text = f"Item {page_num}.{line} the council resolved to note the attachment"
+            if page_num % 5 == 0 and line == 10:
+                text += f" regarding {keywords[page_num % len(keywords)]}"
+            page.insert_text((40, 40 + line * 18), text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark keyword re-queries against the document index.")
+    parser.add_argument("--pages", type=int, default=1000, help="Number of pages in the synthetic PDF")
+    parser.add_argument("--max-seconds", type=float, default=1.0,
+                        help="Fail if an indexed query takes longer than this")
+    args = parser.parse_args()
+
+    file_content = make_pdf(args.pages)
+    doc_hash = content_hash(file_content)
+    selections = [list(group) for group in ALL_KEYWORDS.values()]
+
+    with tempfile.TemporaryDirectory() as temp_dir, fitz.open(stream=file_content) as pdf_document:
+        document_index = DocumentIndex(os.path.join(temp_dir, "index.sqlite3"))
+        started = time.perf_counter()
+        document_index.build(doc_hash, pdf_document)
+        print(f"{args.pages} pages: index built in {time.perf_counter() - started:.2f}s")
+
+        slowest = 0.0
+        for keywords in selections:
+            matcher = compile_keywords(keywords)
+            started = time.perf_counter()
+            live_hits = find_page_highlights(pdf_document, matcher, range(len(pdf_document)), new_scan_stats())
+            live_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            indexed_hits = document_index.find_highlights(doc_hash, matcher, new_scan_stats())
+            indexed_seconds = time.perf_counter() - started
+
+            if indexed_hits != live_hits:
+                print("FAIL: indexed hits differ from live extraction", file=sys.stderr)
+                return 1
+            slowest = max(slowest, indexed_seconds)
+            print(f"  {len(keywords)} keywords, {len(indexed_hits)} hits: "
+                  f"live {live_seconds:.3f}s, indexed {indexed_seconds:.3f}s")
+
+        started = time.perf_counter()
+        highlight_text_in_pdf(file_content, selections[0], "bench.pdf",
+                              document_index=document_index, doc_hash=doc_hash)
+        print(f"full indexed run including save: {time.perf_counter() - started:.2f}s")
+
+    if slowest > args.max_seconds:
+        print(f"FAIL: slowest indexed query took {slowest:.3f}s (limit {args.max_seconds:.2f}s)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Benchmark keyword matching throughput against the number of selected keywords.
+
+Compares the original one-pass-per-keyword str.find loop with the compiled
+single-pass KeywordMatcher on synthetic span text. Keyword counts beyond the
+built-in lists are padded with random words that never occur in the text, so
+the larger rows show pure scanning cost.
+
+Run from the repository root:
+    python -m benchmarks.bench_keyword_matcher
+"""
+import argparse
+import random
+import time
+
+from keywords import ALL_KEYWORDS
+from keyword_matcher import KeywordMatcher
+
+FILLER_WORDS = (
+    "the council resolved to note the item on proposed works for local area and "
+    "community consultation period adopted minutes item attachment meeting"
+).split()
+
+
+def make_spans(keywords, span_count, seed=0):
+    """
+    Build span strings made mostly of filler words with an occasional keyword.
+    """
+    rng = random.Random(seed)
+    spans = []
+    for _ in range(span_count):
+        words = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(6, 14))]
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        spans.append(" ".join(words))
+    return spans
+
+
+def make_keywords(count, seed=1):
+    """
+    Return the built-in keywords, padded with random filler keywords up to count.
+    """
+    rng = random.Random(seed)
+    keywords = sorted({kw for kws in ALL_KEYWORDS.values() for kw in kws})
+    while len(keywords) < count:
+        keywords.append("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(5, 12))))
+    return keywords[:count]
+
+
+def naive_scan(spans, keywords):
+    hits = 0
+    for keyword in keywords:
+        keyword_lower = keyword.lower()
+        for text_content in spans:
+            lower_text = text_content.lower()
+            start = 0
+            while True:
+                start = lower_text.find(keyword_lower, start)
+                if start == -1:
+                    break
+                hits += 1
+                start += len(keyword)
+    return hits
+
+
+def matcher_scan(spans, matcher):
+    hits = 0
+    for text_content in spans:
+        for _ in matcher.finditer(text_content):
+            hits += 1
+    return hits
+
+
+def best_of(repeat, func, *args):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--spans", type=int, default=20000, help="Number of synthetic spans to scan")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per measurement (best is kept)")
+    parser.add_argument("--max-naive", type=int, default=250, help="Largest keyword count timed with the naive loop")
+    args = parser.parse_args()
+
+    builtin_count = len({kw for kws in ALL_KEYWORDS.values() for kw in kws})
+    spans = make_spans(make_keywords(builtin_count), args.spans)
+    megabytes = sum(len(span) for span in spans) / 1e6
+
+    print(f"{args.spans} spans, {megabytes:.2f} MB of text")
+    print(f"{'keywords':>8}  {'naive MB/s':>11}  {'matcher MB/s':>13}  {'hits':>6}")
+    for count in (1, 5, 10, 25, 50, builtin_count, 250, 1000, 5000):
+        keywords = make_keywords(count)
+        matcher = KeywordMatcher(keywords)
+        matcher_time, matcher_hits = best_of(args.repeat, matcher_scan, spans, matcher)
+        if count <= args.max_naive:
+            naive_time, naive_hits = best_of(args.repeat, naive_scan, spans, keywords)
+            assert naive_hits == matcher_hits, (count, naive_hits, matcher_hits)
+            naive_rate = f"{megabytes / naive_time:.1f}"
+        else:
+            naive_rate = "-"
+        print(f"{count:>8}  {naive_rate:>11}  {megabytes / matcher_time:>13.1f}  {matcher_hits:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Peak-memory regression check for the highlighting pipeline.
+
+Builds a large synthetic PDF, highlights it once through highlight_text_in_pdf
+and reports the Python-level peak allocation (tracemalloc) and the process
+peak RSS, both relative to the input size. Exits with status 1 when the traced
+peak exceeds --max-ratio times the input size, so it can gate changes that
+reintroduce extra copies of the document bytes.
+
+Run from the repository root:
+    python -m benchmarks.bench_memory --size-mb 200
+"""
+import argparse
+import os
+import resource
+import sys
+import tracemalloc
+
+import fitz  # PyMuPDF
+
+from highlighter import highlight_text_in_pdf
+
+
+def make_large_pdf(size_mb, pages=200):
+    """
+    Return PDF bytes of roughly size_mb megabytes: text pages with keywords,
+    padded by an incompressible embedded file.
+    """
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        text = f"Item {page_num} minutes of the ordinary council meeting"
+        if page_num % 10 == 0:
+            text += " - Planning Scheme Amendment C123"
+        page.insert_text((72, 72), text, fontsize=10)
+    doc.embfile_add("padding.bin", os.urandom(size_mb * 1024 * 1024))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def max_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak-memory regression check for highlight_text_in_pdf.")
+    parser.add_argument("--size-mb", type=int, default=100, help="Approximate size of the synthetic PDF")
+    parser.add_argument("--max-ratio", type=float, default=2.5,
+                        help="Fail if traced peak memory exceeds this multiple of the input size")
+    args = parser.parse_args()
+
+    file_content = make_large_pdf(args.size_mb)
+    input_mb = len(file_content) / (1024 * 1024)
+    rss_before = max_rss_mb()
+
+    tracemalloc.start()
+    updated_pdf, keyword_occurrences = highlight_text_in_pdf(file_content, ["Planning Scheme"], "large.pdf")
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    traced_mb = traced_peak / (1024 * 1024)
+    ratio = traced_mb / input_mb
+    print(f"input: {input_mb:.1f} MB, output: {updated_pdf.getbuffer().nbytes / (1024 * 1024):.1f} MB")
+    print(f"traced peak: {traced_mb:.1f} MB ({ratio:.2f}x input)")
+    print(f"peak RSS: {max_rss_mb():.1f} MB (before run: {rss_before:.1f} MB)")
+
+    if ratio > args.max_ratio:
+        print(f"FAIL: traced peak exceeds {args.max_ratio:.2f}x the input size", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
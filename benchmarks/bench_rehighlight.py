@@ -0,0 +1,65 @@
+"""
+Re-highlighting a document after a keyword change versus highlighting it again.
+
+Highlights a synthetic corpus document with a keyword selection, then moves
+to a selection with some keywords removed and others added, once from the
+original bytes and once as a delta from the first output (see
+highlighter.rehighlight_pdf). Both runs use a document index that already
+holds the document, as the web app does for a document it has seen.
+
+Run from the repository root:
+    python -m benchmarks.bench_rehighlight --pages 500 --keywords 50 --changed 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import SUITES, all_keywords, keyword_subset, make_document
+from document_index import DocumentIndex
+from highlighter import DELTA_SAVE_MODES, SAVE_FULL, highlight_text_in_pdf, new_scan_stats, rehighlight_pdf
+from result_cache import content_hash
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare re-highlighting with highlighting from scratch.")
+    parser.add_argument("--pages", type=int, default=500, help="Number of pages of the synthetic PDF")
+    parser.add_argument("--keywords", type=int, default=50, help="Size of the first keyword selection")
+    parser.add_argument("--changed", type=int, default=3, help="Keywords added and removed for the second selection")
+    parser.add_argument("--save-mode", choices=DELTA_SAVE_MODES, default=SAVE_FULL, help="Save mode to benchmark")
+    args = parser.parse_args()
+
+    spec = SUITES["standard"][1]._replace(pages=args.pages)
+    file_content = make_document(spec)
+    doc_hash = content_hash(file_content)
+    first = set(keyword_subset(args.keywords))
+    added = sorted(set(all_keywords()) - first)[:args.changed]
+    second = (first - set(sorted(first)[:args.changed])) | set(added)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        document_index = DocumentIndex(os.path.join(index_dir, "index.sqlite3"))
+        page_hits = []
+        base, occurrences = highlight_text_in_pdf(file_content, first, "corpus.pdf", document_index=document_index,
+                                                  doc_hash=doc_hash, save_mode=args.save_mode, page_hits=page_hits)
+        print(f"input: {args.pages} pages, {len(first)} keywords, {args.changed} added and {args.changed} removed")
+
+        runs = {
+            "from scratch": lambda stats: highlight_text_in_pdf(
+                file_content, second, "corpus.pdf", scan_stats=stats, document_index=document_index,
+                doc_hash=doc_hash, save_mode=args.save_mode),
+            "delta": lambda stats: rehighlight_pdf(
+                base.getvalue(), first, occurrences, page_hits, second, "corpus.pdf", scan_stats=stats,
+                document_index=document_index, doc_hash=doc_hash, save_mode=args.save_mode),
+        }
+        for name, run in runs.items():
+            stats = new_scan_stats()
+            started = time.perf_counter()
+            run(stats)
+            print(f"  {name:12} {time.perf_counter() - started:7.2f}s, {stats['annotations']:6d} annotations added, "
+                  f"output {stats['output_bytes'] / (1024 * 1024):7.2f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+"""
+Save time and output size of each save mode.
+
+Highlights a large synthetic PDF (text pages padded with an incompressible
+embedded file, standing in for a big scanned document) once per mode and
+reports the save time and output size reported in the scan statistics.
+
+Run from the repository root:
+    python -m benchmarks.bench_save_modes --size-mb 200
+"""
+import argparse
+import sys
+
+from benchmarks.bench_memory import make_large_pdf
+from highlighter import SAVE_MODES, highlight_text_in_pdf, new_scan_stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the save modes of the highlighter.")
+    parser.add_argument("--size-mb", type=int, default=200, help="Approximate size of the synthetic PDF")
+    parser.add_argument("--pages", type=int, default=500, help="Number of pages in the synthetic PDF")
+    args = parser.parse_args()
+
+    file_content = make_large_pdf(args.size_mb, pages=args.pages)
+    print(f"input: {len(file_content) / (1024 * 1024):.1f} MB, {args.pages} pages")
+    for save_mode in SAVE_MODES:
+        stats = new_scan_stats()
+        highlight_text_in_pdf(file_content, ["Planning Scheme"], "large.pdf", scan_stats=stats, save_mode=save_mode)
+        print(f"  {save_mode:12} save {stats['save_seconds']:6.2f}s, output {stats['output_bytes'] / (1024 * 1024):8.2f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
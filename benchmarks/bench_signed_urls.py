@@ -0,0 +1,68 @@
+"""
+Signing download URLs on every rerun versus reusing them from SignedUrlCache.
+
+Simulates reruns of the download section, each asking for a signed URL per
+stored result. URLs are signed offline with google-cloud-storage's V4
+signing and a throwaway RSA key, so no credentials or network are needed.
+--fake uses signed_urls.FakeSigner instead.
+
+Run from the repository root:
+    python -m benchmarks.bench_signed_urls --blobs 20 --reruns 200
+"""
+import argparse
+import sys
+import time
+
+from signed_urls import FakeSigner, SignedUrlCache
+
+
+def gcs_signer():
+    """
+    Return sign(blob_name, expiration) signing V4 URLs of a local bucket handle with a generated key.
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from google.cloud import storage
+    from google.oauth2 import service_account
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    credentials = service_account.Credentials.from_service_account_info({
+        "type": "service_account",
+        "client_email": "bench@example.iam.gserviceaccount.com",
+        "private_key": key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                         serialization.NoEncryption()).decode("ascii"),
+        "token_uri": "https://oauth2.googleapis.com/token",
+    })
+    bucket = storage.Client(project="bench", credentials=credentials).bucket("pdf-highlighter-upload")
+    return lambda blob_name, expiration: bucket.blob(blob_name).generate_signed_url(
+        expiration=expiration, version="v4", credentials=credentials)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare signing URLs per rerun with the signed URL cache.")
+    parser.add_argument("--blobs", type=int, default=20, help="Download links shown per rerun")
+    parser.add_argument("--reruns", type=int, default=200, help="Reruns of the download section")
+    parser.add_argument("--fake", action="store_true", help="Use FakeSigner instead of GCS V4 signing")
+    args = parser.parse_args()
+
+    sign = FakeSigner() if args.fake else gcs_signer()
+    blobs = [(f"downloads/{index:064x}/highlighted_{index}.pdf", f"{index:064x}") for index in range(args.blobs)]
+    cache = SignedUrlCache(sign)
+    runs = {
+        "sign per rerun": lambda blob_name, file_hash: sign(blob_name, 3600),
+        "cached": cache.get,
+    }
+    print(f"{args.blobs} links x {args.reruns} reruns, {'fake' if args.fake else 'GCS V4'} signing")
+    for name, get_url in runs.items():
+        started = time.perf_counter()
+        for _ in range(args.reruns):
+            for blob_name, file_hash in blobs:
+                get_url(blob_name, file_hash)
+        elapsed = time.perf_counter() - started
+        print(f"  {name:15} {elapsed:7.3f}s, {elapsed / args.reruns * 1000:8.3f} ms per rerun")
+    print(f"  cache: {cache.signed} signed, {cache.hits} reused")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Startup and rerun latency of the Streamlit app.
+
+Streamlit re-executes main.py on every widget interaction, so anything the
+script does at module level is paid on every click. This benchmark runs
+main.py with streamlit.testing's AppTest against a fake GCS client whose
+client creation and bucket check take --latency seconds each (standing in
+for network round trips), and reports the first run and the mean rerun
+time. It also reports the cold import time of the app's modules in a fresh
+interpreter and which heavy optional libraries that import pulled in.
+Exits with status 1 when the mean rerun exceeds --max-rerun-seconds.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from unittest import mock
+
+APP_MODULES = ["highlighter", "reports", "batch", "result_cache", "document_index", "uploads"]
+HEAVY_MODULES = ["pikepdf", "openpyxl", "google.cloud.storage"]
+
+
+def cold_import():
+    """
+    Import the app's modules in a fresh interpreter; return (seconds, heavy modules loaded).
+    """
+    code = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        f"for name in {APP_MODULES!r}: __import__(name)\n"
+        "elapsed = time.perf_counter() - started\n"
+        f"print(json.dumps([elapsed, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.getcwd()).stdout
+    return json.loads(output)
+
+
+def fake_gcs_client(latency):
+    """
+    Return a storage.Client stand-in that sleeps for latency on creation and on bucket.exists().
+    """
+    def make_client(*args, **kwargs):
+        time.sleep(latency)
+        client = mock.MagicMock()
+        client.bucket.return_value.exists.side_effect = lambda: time.sleep(latency) or True
+        return client
+    return make_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Streamlit startup and rerun latency.")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Simulated seconds per GCS network call")
+    parser.add_argument("--reruns", type=int, default=10, help="Number of reruns to average")
+    parser.add_argument("--max-rerun-seconds", type=float, default=0.15,
+                        help="Fail if the mean rerun takes longer than this")
+    args = parser.parse_args()
+
+    import_seconds, heavy = cold_import()
+    print(f"cold import of app modules: {import_seconds:.2f}s; heavy libraries loaded: {', '.join(heavy) or 'none'}")
+
+    import google.cloud.storage
+    from streamlit.testing.v1 import AppTest
+
+    with mock.patch.object(google.cloud.storage, "Client", fake_gcs_client(args.latency)):
+        app = AppTest.from_file("main.py", default_timeout=120)
+        started = time.perf_counter()
+        app.run()
+        first_run = time.perf_counter() - started
+        if app.exception:
+            print(f"FAIL: app raised {app.exception[0].value}", file=sys.stderr)
+            return 1
+
+        started = time.perf_counter()
+        for _ in range(args.reruns):
+            app.run()
+        rerun = (time.perf_counter() - started) / args.reruns
+
+    print(f"first run: {first_run:.3f}s, mean rerun: {rerun * 1000:.1f} ms "
+          f"(simulated GCS latency {args.latency:.2f}s per call)")
+    if rerun > args.max_rerun_seconds:
+        print(f"FAIL: mean rerun exceeds {args.max_rerun_seconds:.2f}s", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
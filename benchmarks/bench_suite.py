@@ -0,0 +1,157 @@
+"""
+Reproducible benchmark suite over the synthetic planning-document corpus.
+
+Every document of a corpus suite (see benchmarks.corpus) is highlighted
+through highlight_text_in_pdf with ALL_KEYWORDS subsets of several sizes.
+Each case runs in a fresh process, so its peak RSS is its own. Pages/s,
+hits/s, peak RSS, output size and the per-stage timings of the scan
+statistics are written to a JSON file together with the commit and library
+versions; --compare prints the change against an earlier results file and
+exits with status 1 when a case got slower than --max-slowdown allows.
+
+Run from the repository root:
+    python -m benchmarks.bench_suite --suite standard --output bench_results.json
+    python -m benchmarks.bench_suite --suite standard --output new.json --compare bench_results.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from benchmarks.corpus import SUITES, corpus_path, keyword_subset
+from highlighter import SAVE_FULL, SAVE_MODES, highlight_text_in_pdf, new_scan_stats
+
+# Keyword subset sizes; None stands for every predefined keyword
+KEYWORD_COUNTS = [1, 10, 50, None]
+
+
+def run_case(pdf_path, keywords, save_mode):
+    """
+    Highlight one corpus document; runs in a fresh worker process.
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        file_content = pdf_file.read()
+    with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
+        repaired = pdf_document.is_repaired
+
+    stats = new_scan_stats()
+    started = time.perf_counter()
+    updated_pdf, _ = highlight_text_in_pdf(file_content, keywords, os.path.basename(pdf_path), scan_stats=stats,
+                                           save_mode=save_mode)
+    wall_seconds = time.perf_counter() - started
+    return {
+        "wall_seconds": wall_seconds,
+        "ok": updated_pdf is not None,
+        "repaired_by_mupdf": repaired,
+        "repaired_by_pikepdf": stats["repair_seconds"] > 0,
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "stats": stats,
+    }
+
+
+def run_isolated(pdf_path, keywords, save_mode):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_case, pdf_path, keywords, save_mode).result()
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, max_slowdown):
+    """
+    Print the pages/s change of every case present in both runs; return the number of regressions.
+    """
+    previous = {case["case"]: case for case in baseline["cases"]}
+    regressions = 0
+    print(f"\ncompared with {baseline['environment'].get('commit') or 'baseline'}:")
+    for case in results["cases"]:
+        old = previous.get(case["case"])
+        if old is None or not old["pages_per_second"]:
+            continue
+        ratio = case["pages_per_second"] / old["pages_per_second"]
+        flag = ""
+        if ratio * max_slowdown < 1:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"  {case['case']:36} {old['pages_per_second']:9.1f} -> {case['pages_per_second']:9.1f} pages/s "
+              f"({ratio:5.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the highlighter over the synthetic benchmark corpus.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="standard", help="Corpus suite to run")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdf_highlighter_corpus"),
+                        help="Directory where generated documents are kept between runs")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus generation seed")
+    parser.add_argument("--save-mode", choices=SAVE_MODES, default=SAVE_FULL, help="Save mode to benchmark")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file to write the results to")
+    parser.add_argument("--compare", metavar="JSON", help="Earlier results file to compare against")
+    parser.add_argument("--max-slowdown", type=float, default=1.25,
+                        help="With --compare, fail if a case's pages/s drops by more than this factor")
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "suite": args.suite, "seed": args.seed, "save_mode": args.save_mode,
+               "cases": []}
+    print(f"{'case':36} {'pages/s':>9} {'hits/s':>9} {'peak RSS':>9} {'output':>9}")
+    for spec in SUITES[args.suite]:
+        pdf_path = corpus_path(args.corpus_dir, spec, args.seed)
+        input_bytes = os.path.getsize(pdf_path)
+        for count in KEYWORD_COUNTS:
+            keywords = keyword_subset(count, args.seed)
+            case_name = f"{spec.name}/k{count or 'all'}"
+            run = run_isolated(pdf_path, keywords, args.save_mode)
+            stats = run["stats"]
+            case = {
+                "case": case_name,
+                "spec": spec._asdict(),
+                "keywords": len(keywords),
+                "input_bytes": input_bytes,
+                "output_bytes": stats["output_bytes"],
+                "pages": stats["pages"],
+                "hits": stats["hits"],
+                "pages_per_second": stats["pages"] / run["wall_seconds"],
+                "hits_per_second": stats["hits"] / run["wall_seconds"],
+                **{key: value for key, value in run.items() if key != "stats"},
+                "stages": {key: value for key, value in stats.items() if key.endswith("_seconds")},
+            }
+            results["cases"].append(case)
+            print(f"{case_name:36} {case['pages_per_second']:9.1f} {case['hits_per_second']:9.1f} "
+                  f"{case['peak_rss_mb']:7.0f}MB {case['output_bytes'] / 1024:7.0f}KB"
+                  f"{'' if case['ok'] else '  FAILED'}")
+
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            if compare(results, json.load(baseline_file), args.max_slowdown):
+                return 1
+    return 0 if all(case["ok"] for case in results["cases"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+Synthetic planning-document corpus for benchmarks.
+
+make_document renders a CorpusSpec into PDF bytes with PyMuPDF. Pages read
+like council minutes and planning reports, with keywords from ALL_KEYWORDS
+scattered through the text. A spec controls the page count, text density
+(lines per page), font mix, the share of scanned pages (an image, no text
+layer), the share of keywords split across spans (each half in a different
+font) or wrapped onto the next line, and whether the xref table is damaged
+so the document has to be repaired on opening. Generation is seeded, so a
+spec always produces the same document.
+
+Run from the repository root to write a corpus to a directory:
+    python -m benchmarks.corpus out_dir/ --suite standard
+"""
+import argparse
+import os
+import random
+import re
+import sys
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+
+from keywords import ALL_KEYWORDS
+
+CorpusSpec = namedtuple(
+    "CorpusSpec",
+    ["name", "pages", "density", "fonts", "scanned_ratio", "split_ratio", "corrupt"],
+)
+
+DENSITY_LINES = {"sparse": 8, "normal": 40, "dense": 70}
+FONT_MIXES = {
+    "single": ["helv"],
+    "mixed": ["helv", "tiro", "cour", "hebo", "tibo"],
+}
+
+FONT_SIZE = 9
+LEFT_MARGIN = 50
+TOP_MARGIN = 50
+LINE_CHARS = 80
+KEYWORD_RATE = 0.15  # Share of lines containing a keyword
+
+VOCABULARY = (
+    "council meeting minutes item report resolution moved seconded carried officer recommendation "
+    "application permit lodged objection submission hearing panel site area lot street road ward "
+    "residential commercial industrial zone overlay schedule policy strategy precinct framework "
+    "infrastructure drainage traffic heritage vegetation open space community consultation notice "
+    "adopted endorsed deferred noted received the and of to for with on at by from that this "
+    "subject proposal development approval condition review amendment budget"
+).split()
+
+SUITES = {
+    "quick": [
+        CorpusSpec("p10_normal", 10, "normal", "single", 0.0, 0.0, False),
+        CorpusSpec("p100_mixed_split", 100, "normal", "mixed", 0.0, 0.3, False),
+    ],
+    "standard": [
+        CorpusSpec("p10_normal", 10, "normal", "single", 0.0, 0.0, False),
+        CorpusSpec("p100_mixed_split", 100, "normal", "mixed", 0.0, 0.3, False),
+        CorpusSpec("p200_corrupt_xref", 200, "normal", "single", 0.0, 0.1, True),
+        CorpusSpec("p500_scanned", 500, "sparse", "single", 0.6, 0.0, False),
+        CorpusSpec("p1000_dense_mixed", 1000, "dense", "mixed", 0.05, 0.1, False),
+    ],
+}
+SUITES["full"] = SUITES["standard"] + [
+    CorpusSpec("p5000_normal", 5000, "normal", "mixed", 0.1, 0.05, False),
+]
+
+
+def all_keywords():
+    """
+    Return every predefined keyword once, in a stable order.
+    """
+    return sorted({keyword for keywords in ALL_KEYWORDS.values() for keyword in keywords})
+
+
+def keyword_subset(size, seed=0):
+    """
+    Return a reproducible sample of size predefined keywords (all of them if size is None).
+    """
+    keywords = all_keywords()
+    if size is None or size >= len(keywords):
+        return keywords
+    return sorted(random.Random(f"keywords:{size}:{seed}").sample(keywords, size))
+
+
+def _scan_image(rng):
+    """
+    Return PNG bytes of a noisy grey image standing in for a scanned page.
+    """
+    width, height = 120, 170
+    samples = bytes(rng.randrange(180, 256) for _ in range(width * height))
+    return fitz.Pixmap(fitz.csGRAY, width, height, samples, False).tobytes("png")
+
+
+def _write_segments(writer, fonts, y, segments):
+    """
+    Append (text, fontname) segments one after another on a line; each font change starts a new span.
+    """
+    position = fitz.Point(LEFT_MARGIN, y)
+    for text, fontname in segments:
+        _, position = writer.append(position, text, font=fonts[fontname], fontsize=FONT_SIZE)
+
+
+def _filler(rng, chars):
+    words = []
+    while sum(len(word) + 1 for word in words) < chars:
+        words.append(rng.choice(VOCABULARY))
+    return " ".join(words)
+
+
+def _render_page(page, spec, rng, keywords, font_objects):
+    # One TextWriter per page is much faster than an insert_text call per line
+    writer = fitz.TextWriter(page.rect)
+    write = lambda y, segments: _write_segments(writer, font_objects, y, segments)
+    fonts = FONT_MIXES[spec.fonts]
+    lines = DENSITY_LINES[spec.density]
+    # Set solid enough that consecutive lines form one text block, so wrapped keywords can match
+    line_height = min((page.rect.height - 2 * TOP_MARGIN) / lines, FONT_SIZE * 1.3)
+    carry = None  # Second half of a keyword wrapped from the previous line
+    for line in range(lines):
+        y = TOP_MARGIN + line * line_height
+        fontname = rng.choice(fonts)
+        if carry is not None:
+            write(y, [(carry + " " + _filler(rng, LINE_CHARS - len(carry)), fontname)])
+            carry = None
+            continue
+        if rng.random() >= KEYWORD_RATE:
+            write(y, [(_filler(rng, LINE_CHARS), fontname)])
+            continue
+
+        keyword = rng.choice(keywords)
+        before = _filler(rng, rng.randrange(0, LINE_CHARS // 2)) + " "
+        if rng.random() < spec.split_ratio:
+            if " " in keyword and line < lines - 1 and rng.random() < 0.5:
+                # Wrapped: the keyword continues at the start of the next line
+                first, carry = keyword.split(" ", 1)
+                write(y, [(before + first, fontname)])
+            else:
+                # Split across spans: each half of the keyword in a different font
+                cut = max(1, len(keyword) // 2)
+                other = rng.choice(fonts[1:] or fonts)
+                write(y, [
+                    (before + keyword[:cut], fontname), (keyword[cut:], other), (" " + _filler(rng, 20), fontname),
+                ])
+        else:
+            after = " " + _filler(rng, max(0, LINE_CHARS - len(before) - len(keyword)))
+            write(y, [(before + keyword + after, fontname)])
+    writer.write_text(page)
+
+
+def _corrupt_xref(data, rng):
+    """
+    Damage the cross-reference table and the startxref offset of PDF bytes.
+    """
+    xref_start = data.rfind(b"\nxref")
+    trailer_start = data.find(b"trailer", xref_start)
+    if xref_start < 0 or trailer_start < 0:
+        return data
+    garbage = bytes(rng.choice(b"0123456789 fn\n") for _ in range(trailer_start - xref_start))
+    data = data[:xref_start] + garbage + data[trailer_start:]
+    return re.sub(rb"startxref\s+\d+", b"startxref\n" + str(rng.randrange(10, len(data))).encode(), data)
+
+
+def make_document(spec, seed=0):
+    """
+    Render a CorpusSpec into PDF bytes.
+    """
+    rng = random.Random(f"{spec.name}:{seed}")
+    keywords = all_keywords()
+    font_objects = {fontname: fitz.Font(fontname) for fontname in FONT_MIXES[spec.fonts]}
+    doc = fitz.open()
+    scan_xref = 0
+    scan_png = _scan_image(rng) if spec.scanned_ratio else None
+    for _ in range(spec.pages):
+        page = doc.new_page()
+        if rng.random() < spec.scanned_ratio:
+            # The same image object is shared by all scanned pages
+            if scan_xref:
+                page.insert_image(page.rect, xref=scan_xref)
+            else:
+                scan_xref = page.insert_image(page.rect, stream=scan_png)
+            continue
+        _render_page(page, spec, rng, keywords, font_objects)
+    # A fixed file ID keeps the output reproducible; without object streams
+    # the xref is a classic table that can be damaged
+    doc.set_metadata({})
+    data = doc.tobytes(garbage=1, deflate=True, no_new_id=True)
+    doc.close()
+    if spec.corrupt:
+        data = _corrupt_xref(data, rng)
+    return data
+
+
+def corpus_path(directory, spec, seed=0):
+    """
+    Return the path of a spec's document under directory, generating it if missing.
+    """
+    path = os.path.join(directory, f"{spec.name}_s{seed}.pdf")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as pdf_file:
+            pdf_file.write(make_document(spec, seed))
+        os.replace(temp_path, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic planning-document corpus.")
+    parser.add_argument("directory", help="Directory to write the PDFs to")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="standard", help="Set of documents to generate")
+    parser.add_argument("--seed", type=int, default=0, help="Generation seed")
+    args = parser.parse_args()
+
+    for spec in SUITES[args.suite]:
+        path = corpus_path(args.directory, spec, args.seed)
+        print(f"{spec.name:22} {spec.pages:5d} pages  {os.path.getsize(path) / 1024:9.0f} KB  {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+ZIP bundles of results, streamed to disk one entry at a time.
+
+A ZipBundle writes each entry to its archive file as soon as it is added, so
+a bundle can be built while a batch is still running, and building it never
+needs more memory than one copy buffer, whatever the total size.
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+
+BUNDLE_COMPRESSIONS = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+}
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class ZipBundle:
+    """
+    ZIP archive in a temporary file under directory, appended to entry by entry.
+    close() finishes the archive and returns its path; the caller owns the file
+    from then on. Used as a context manager, the file is deleted if the block fails.
+    """
+
+    def __init__(self, directory, compression="stored"):
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix="bundle_", suffix=".zip")
+        self.compression = compression
+        self.count = 0
+        self._file = os.fdopen(fd, "w+b")
+        self._zip = zipfile.ZipFile(self._file, "w", compression=BUNDLE_COMPRESSIONS[compression])
+
+    def add(self, arcname, source):
+        """
+        Append an entry from a file path or a binary file object.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            self._zip.write(source, arcname)
+        else:
+            source.seek(0)
+            with self._zip.open(arcname, "w", force_zip64=True) as entry:
+                shutil.copyfileobj(source, entry, COPY_CHUNK_SIZE)
+        self.count += 1
+
+    def close(self):
+        """
+        Write the central directory and return the path of the finished archive.
+        """
+        self._zip.close()
+        self._file.close()
+        return self.path
+
+    def discard(self):
+        """
+        Abandon the bundle and delete its file.
+        """
+        try:
+            self._zip.close()
+        finally:
+            self._file.close()
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+        return False
@@ -0,0 +1,196 @@
+"""
+Headless command-line entry point for the PDF highlighter.
+
+Highlights every PDF found in the given files, directories or glob patterns,
+using a pool of worker processes, and writes the results to an output
+directory. Inputs are discovered lazily, so very large directories start
+processing straight away.
+
+Examples:
+    python cli.py council_reports/ -o highlighted/ --preset VIC --preset General
+    python cli.py "scans/**/*.pdf" -o out/ -k "Planning Scheme" -k Rezoning --workers 8 --report
+    python cli.py council_reports/ -o highlighted/ --all --batch-report highlighted/batch_report.csv
+    python cli.py slow.pdf -o out/ --all --profile slow.prof
+    python cli.py uploads/ -o out/ --all --cpu-limit 300 --memory-limit 2048 --repair-cache ~/.cache/repaired
+"""
+import argparse
+import glob
+import itertools
+import logging
+import os
+import sys
+import time
+
+from batch import default_worker_count, highlight_files_parallel, profile_file
+from highlighter import SAVE_FULL, SAVE_MODES, merge_scan_stats, new_scan_stats, page_cache_hit_rate
+from instrumentation import configure_metrics_log, log_metrics, profile_summary
+from keywords import ALL_KEYWORDS, select_keywords
+from page_cache import PageCache
+from repair import PdfRepairer, file_limits
+from reports import BatchReportWriter, generate_csv_report, report_filename
+
+
+def iter_pdf_files(inputs):
+    """
+    Yield (name, path) for every PDF in the inputs.
+    Files found under a directory are named by their path relative to it, so
+    the directory layout is preserved in the output directory.
+    """
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf"):
+                        path = os.path.join(root, name)
+                        yield os.path.relpath(path, item), path
+        elif os.path.isfile(item):
+            yield os.path.basename(item), item
+        else:
+            for path in glob.iglob(item, recursive=True):
+                if os.path.isfile(path) and path.lower().endswith(".pdf"):
+                    yield os.path.basename(path), path
+
+
+def resolve_keywords(args):
+    """
+    Combine --keyword, --keywords-file, --preset and --all into one keyword set.
+    """
+    keywords = list(args.keyword or [])
+    if args.keywords_file:
+        with open(args.keywords_file, encoding="utf-8") as keywords_file:
+            keywords.extend(keywords_file)
+    return select_keywords(keywords, args.preset or [], args.all)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Highlight keywords in PDFs without the Streamlit UI.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="Directory for highlighted PDFs and reports")
+    parser.add_argument("-k", "--keyword", action="append", help="Keyword to highlight (repeatable)")
+    parser.add_argument("--keywords-file", help="File with one keyword per line")
+    parser.add_argument("--preset", action="append", choices=sorted(ALL_KEYWORDS),
+                        help="Keyword preset to include (repeatable)")
+    parser.add_argument("--all", action="store_true", help="Highlight all predefined keywords")
+    parser.add_argument("-w", "--workers", type=int, default=default_worker_count(),
+                        help="Number of worker processes (default: one per CPU)")
+    parser.add_argument("--report", action="store_true", help="Also write a keyword report per PDF")
+    parser.add_argument("--batch-report", metavar="PATH",
+                        help="Also write one report for all PDFs, one row per file, keyword and page "
+                             "with hit counts and context (.xlsx or .csv)")
+    parser.add_argument("--index", metavar="PATH",
+                        help="Document index database; re-runs on indexed PDFs skip text extraction")
+    parser.add_argument("--page-cache", metavar="PATH",
+                        help="Page cache database; pages already seen in any PDF skip extraction and matching")
+    parser.add_argument("--save-mode", choices=SAVE_MODES, default=SAVE_FULL,
+                        help="Output format: full rewrite, incremental append, compact archive, "
+                             "or an excerpt of the pages with hits (default: full)")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Append per-file and per-batch stage timings, counts and peak memory as JSON lines")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Highlight a single PDF in-process under cProfile and write the profile to PATH")
+    parser.add_argument("--cpu-limit", type=float, metavar="SECONDS",
+                        help="CPU time limit per PDF; a PDF exceeding it is reported as failed")
+    parser.add_argument("--memory-limit", type=int, metavar="MB",
+                        help="Address-space limit per PDF in megabytes; a PDF exceeding it is reported as failed")
+    parser.add_argument("--repair-cache", metavar="DIR",
+                        help="Keep repaired copies of damaged PDFs here, so each is repaired only once")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log progress details to stderr")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    keywords = resolve_keywords(args)
+    if not keywords:
+        print("No keywords selected; use --keyword, --keywords-file, --preset or --all.", file=sys.stderr)
+        return 2
+    if args.batch_report and not args.batch_report.lower().endswith((".xlsx", ".csv")):
+        print("--batch-report must end in .xlsx or .csv.", file=sys.stderr)
+        return 2
+
+    if args.metrics:
+        configure_metrics_log(args.metrics, propagate=False)
+
+    # Damaged PDFs are repaired in a separate process under the default repair limits,
+    # lowered to the per-PDF limits where those are stricter
+    limits, repair_limits = file_limits(args.cpu_limit,
+                                        args.memory_limit * 1024 ** 2 if args.memory_limit else None)
+    repairer = PdfRepairer(os.path.expanduser(args.repair_cache) if args.repair_cache else None,
+                           limits=repair_limits)
+    page_cache = PageCache(os.path.expanduser(args.page_cache)) if args.page_cache else None
+
+    os.makedirs(args.output, exist_ok=True)
+    started = time.perf_counter()
+    processed = failed = pages = output_bytes = 0
+    save_seconds = 0.0
+    batch_stats = new_scan_stats()
+
+    if args.profile:
+        files = list(itertools.islice(iter_pdf_files(args.inputs), 2))
+        if len(files) != 1:
+            print("--profile needs exactly one input PDF.", file=sys.stderr)
+            return 2
+        filename, path = files[0]
+        result, profiler = profile_file(filename, path, keywords, output_dir=args.output, index_path=args.index,
+                                        save_mode=args.save_mode, repair=repairer, page_cache=page_cache)
+        profiler.dump_stats(args.profile)
+        print(profile_summary(profiler))
+        results = [result]
+    else:
+        results = highlight_files_parallel(
+            iter_pdf_files(args.inputs), keywords, max_workers=args.workers, output_dir=args.output,
+            index_path=args.index, save_mode=args.save_mode, repair=repairer, limits=limits, page_cache=page_cache
+        )
+    # Rows are written as each file completes, so the report of a huge batch is never held in memory
+    batch_report = BatchReportWriter(args.batch_report) if args.batch_report else None
+    for result in results:
+        merge_scan_stats(batch_stats, result.scan_stats)
+        log_metrics("file", result.filename, result.scan_stats, processed=result.error is None)
+        for level, message in result.messages:
+            if level in ("warning", "error"):
+                print(f"{result.filename}: {message}", file=sys.stderr)
+        if result.error is not None:
+            failed += 1
+            print(f"FAILED  {result.filename}: {result.error}", file=sys.stderr)
+            continue
+
+        processed += 1
+        pages += result.scan_stats["pages"]
+        output_bytes += result.scan_stats["output_bytes"]
+        save_seconds += result.scan_stats["save_seconds"]
+        found = sorted(keyword for keyword, hit_pages in (result.keyword_occurrences or {}).items() if hit_pages)
+        print(f"OK      {result.filename}: {result.scan_stats['pages']} pages, {len(found)} keywords found")
+        if batch_report is not None:
+            batch_report.add_file(result.filename, result.page_hits)
+
+        if args.report and result.keyword_occurrences:
+            directory, name = os.path.split(result.filename)
+            report_path = os.path.join(args.output, directory, report_filename(name))
+            with open(report_path, "wb") as report_file:
+                report_file.write(generate_csv_report(result.keyword_occurrences).getbuffer())
+
+    if batch_report is not None:
+        print(f"Batch report with {batch_report.rows} rows written to {batch_report.close()}")
+
+    elapsed = time.perf_counter() - started
+    log_metrics("batch", " ".join(args.inputs), batch_stats, files=processed + failed, failed=failed,
+                wall_seconds=elapsed)
+    print(
+        f"{processed} files processed, {failed} failed, {pages} pages in {elapsed:.1f}s "
+        f"({processed / elapsed:.2f} files/s, {pages / elapsed:.1f} pages/s)"
+    )
+    print(f"{output_bytes / (1024 * 1024):.1f} MB written in {args.save_mode} mode, {save_seconds:.1f}s spent saving")
+    hit_rate = page_cache_hit_rate(batch_stats)
+    if hit_rate is not None:
+        print(f"Page cache: {batch_stats['page_cache_hits']} pages seen before, {hit_rate:.0%} hit rate")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+Persistent per-document text and position index.
+
+The first time a document is highlighted with indexing enabled, the character
+stream and glyph boxes of every page (see highlighter.page_chars) are stored
+in a SQLite database, keyed by the document's content hash. Later runs with
+any keyword selection search the stored page text and compute highlight
+rectangles from the stored boxes, so the document never goes through text
+extraction again.
+"""
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from array import array
+
+from highlighter import CHAR_TEXT_FLAGS, char_highlights, page_chars
+
+# Bump whenever the stored page representation changes; an index file with an
+# older schema is recreated
+INDEX_VERSION = "3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_hash TEXT PRIMARY KEY,
+    page_count INTEGER NOT NULL,
+    index_version TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    doc_hash TEXT NOT NULL,
+    page_num INTEGER NOT NULL,
+    width REAL NOT NULL,
+    height REAL NOT NULL,
+    text TEXT NOT NULL,
+    boxes BLOB NOT NULL,
+    PRIMARY KEY (doc_hash, page_num)
+) WITHOUT ROWID;
+"""
+
+
+def _decode_boxes(blob):
+    boxes = array("f")
+    boxes.frombytes(zlib.decompress(blob))
+    return boxes
+
+
+class DocumentIndex:
+    """
+    SQLite-backed index of page text and glyph boxes, keyed by content hash.
+    Connections are opened per call, so one index can be shared by Streamlit
+    session threads and worker processes.
+    """
+
+    def __init__(self, path, max_documents=1000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_documents = max_documents
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            if connection.execute("PRAGMA user_version").fetchone()[0] != int(INDEX_VERSION):
+                connection.executescript("DROP TABLE IF EXISTS documents; DROP TABLE IF EXISTS pages;")
+                connection.execute(f"PRAGMA user_version = {int(INDEX_VERSION)}")
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def has(self, doc_hash):
+        """
+        Return True if the document is fully indexed with the current index version.
+        """
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT index_version FROM documents WHERE doc_hash = ?", (doc_hash,)
+            ).fetchone()
+        finally:
+            connection.close()
+        return row is not None and row[0] == INDEX_VERSION
+
+    def add_pages(self, doc_hash, pdf_document, page_numbers, stats=None, on_page=None, page_cache=None):
+        """
+        Extract and store the character stream and glyph boxes of the given pages.
+        Extraction time is added to stats["extraction_seconds"] if stats is given,
+        and on_page, if given, is called without arguments after each page.
+        With a page_cache.PageCache, pages it already knows, from any document,
+        are copied from it instead of being extracted.
+        """
+        digests = {}
+        known = {}
+        extracted = {}
+        if page_cache is not None:
+            lookup_start = time.perf_counter()
+            digests = page_cache.digests(pdf_document, page_numbers)
+            known = page_cache.get_text(set(digests.values()))
+            if stats is not None:
+                stats["page_cache_seconds"] += time.perf_counter() - lookup_start
+
+        extraction_start = time.perf_counter()
+        rows = []
+        for page_num in page_numbers:
+            digest = digests.get(page_num)
+            if digest in known:
+                page_row = known[digest]
+                if stats is not None:
+                    stats["page_cache_hits"] += 1
+            else:
+                page = pdf_document.load_page(page_num)
+                if page.get_fonts():
+                    text, boxes = page_chars(page.get_text("rawdict", flags=CHAR_TEXT_FLAGS))
+                else:
+                    text, boxes = "", array("f")
+                page_row = (page.rect.width, page.rect.height, text, zlib.compress(boxes.tobytes()))
+                if digest is not None:
+                    known[digest] = extracted[digest] = page_row
+                    if stats is not None:
+                        stats["page_cache_misses"] += 1
+            rows.append((doc_hash, page_num, *page_row))
+            if on_page:
+                on_page()
+        if stats is not None:
+            stats["extraction_seconds"] += time.perf_counter() - extraction_start
+
+        if extracted:
+            page_cache.put_text(extracted)
+
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def mark_complete(self, doc_hash, page_count):
+        """
+        Record that all pages of a document have been added, and prune old documents.
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                (doc_hash, page_count, INDEX_VERSION, time.time()),
+            )
+        self.prune()
+
+    def build(self, doc_hash, pdf_document, stats=None, on_page=None, page_cache=None):
+        """
+        Index every page of an opened document.
+        """
+        self.add_pages(doc_hash, pdf_document, range(len(pdf_document)), stats, on_page, page_cache)
+        self.mark_complete(doc_hash, len(pdf_document))
+        logging.info(f"Indexed {len(pdf_document)} pages of document {doc_hash[:12]}.")
+
+    def search_pages(self, doc_hash, matcher, stats, page_numbers=None):
+        """
+        Search stored pages and return hits in the format of highlighter.find_page_highlights.
+        Only the boxes of pages whose text contains a keyword are decoded.
+        """
+        query = "SELECT page_num, width, height, text, boxes FROM pages WHERE doc_hash = ?"
+        params = [doc_hash]
+        if page_numbers is not None:
+            query += " AND page_num BETWEEN ? AND ?"
+            params += [min(page_numbers), max(page_numbers)]
+        query += " ORDER BY page_num"
+
+        hits = []
+        connection = self._connect()
+        try:
+            for page_num, width, height, text, boxes in connection.execute(query, params):
+                stats["pages"] += 1
+                if not text.strip():
+                    stats["pages_without_text"] += 1
+                    continue
+                if not matcher.search(text):
+                    stats["pages_skipped"] += 1
+                    continue
+                stats["pages_with_hits"] += 1
+                matching_start = time.perf_counter()
+                for keyword, rect, snippet in char_highlights(matcher, text, _decode_boxes(boxes), width, height):
+                    hits.append((page_num, keyword, rect, snippet))
+                stats["matching_seconds"] += time.perf_counter() - matching_start
+        finally:
+            connection.close()
+        return hits
+
+    def find_highlights(self, doc_hash, matcher, stats):
+        """
+        Return hits for a fully indexed document, or None if it is not indexed.
+        """
+        if not self.has(doc_hash):
+            return None
+        with self._connect() as connection:
+            connection.execute("UPDATE documents SET last_used = ? WHERE doc_hash = ?", (time.time(), doc_hash))
+        return self.search_pages(doc_hash, matcher, stats)
+
+    def prune(self):
+        """
+        Delete the least recently used documents beyond max_documents,
+        and documents indexed with an older index version.
+        """
+        with self._connect() as connection:
+            stale = [row[0] for row in connection.execute(
+                "SELECT doc_hash FROM documents WHERE index_version != ? UNION "
+                "SELECT doc_hash FROM (SELECT doc_hash FROM documents ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (INDEX_VERSION, self.max_documents),
+            )]
+            for doc_hash in stale:
+                connection.execute("DELETE FROM pages WHERE doc_hash = ?", (doc_hash,))
+                connection.execute("DELETE FROM documents WHERE doc_hash = ?", (doc_hash,))
@@ -0,0 +1,949 @@
+"""
+Core PDF keyword highlighting, independent of the Streamlit UI.
+
+Functions here never call Streamlit directly. User-facing messages are passed
+to an optional ``notify(level, message)`` callback, where level is one of
+"info", "success", "warning" or "error", so the same code can run in the app,
+in worker processes and in headless scripts.
+"""
+import io
+import json
+import logging
+import math
+import time
+from array import array
+from io import BytesIO
+
+import fitz  # PyMuPDF
+from pymupdf import mupdf
+
+from instrumentation import sample_memory
+from keyword_matcher import compile_keywords
+
+# Bump whenever a change alters the highlighted output for the same input,
+# so cached results from older versions are not reused
+HIGHLIGHTER_VERSION = "6"
+
+# Hits are on the same line when their vertical overlap is at least this share of the shorter height
+LINE_OVERLAP_RATIO = 0.5
+# Hits on a line closer than this share of the line height (about a space) are merged
+ADJACENT_GAP_RATIO = 0.3
+
+# Ligatures are split into their characters so keywords containing them still match
+PREFILTER_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES
+CHAR_TEXT_FLAGS = fitz.TEXTFLAGS_RAWDICT & ~fitz.TEXT_PRESERVE_LIGATURES
+
+# Scan statistics merged by taking the maximum instead of the sum
+PEAK_STATS = ("peak_memory_bytes",)
+
+# Box of a separator character inserted into the page character stream
+_NO_BOX = (math.nan,) * 4
+
+# Output modes, see save_highlighted
+SAVE_FULL = "full"
+SAVE_INCREMENTAL = "incremental"
+SAVE_COMPACT = "compact"
+SAVE_EXCERPT = "excerpt"
+SAVE_MODES = (SAVE_FULL, SAVE_INCREMENTAL, SAVE_COMPACT, SAVE_EXCERPT)
+# Modes whose output keeps every page, so it can be re-highlighted (see rehighlight_document)
+DELTA_SAVE_MODES = (SAVE_FULL, SAVE_INCREMENTAL, SAVE_COMPACT)
+
+INCREMENTAL_BUFFER_SIZE = 1024 * 1024  # Initial size; the buffer grows as needed
+EXCERPT_NOTE_FONT_SIZE = 7
+
+# Author of the highlight annotations this module adds; their subject lists their keywords
+# as a JSON array (see annotation_keywords)
+ANNOTATION_AUTHOR = "PDF-Highlighter"
+
+# Characters of page text kept on each side of an occurrence in its context snippet
+SNIPPET_CONTEXT = 40
+
+
+def _notify(notify, level, message):
+    """
+    Forward a user-facing message to the notify callback, if any.
+    """
+    if notify:
+        notify(level, message)
+
+
+def preprocess_pdf_with_pikepdf(input_stream, notify=None):
+    """
+    Attempt to preprocess the PDF using pikepdf.
+    """
+    import pikepdf  # Only needed for damaged PDFs; imported on first use
+
+    try:
+        pdf = pikepdf.open(input_stream)
+        output = io.BytesIO()
+        pdf.save(output)
+        pdf.close()
+        output.seek(0)
+        logging.info("Successfully preprocessed PDF with pikepdf.")
+        return output
+    except pikepdf.PdfError as e:
+        logging.error(f"pikepdf preprocessing failed: {e}")
+        _notify(notify, "error", f"⚠️ Failed to preprocess PDF with pikepdf: {e}")
+        return None
+
+
+def repair_in_process(file_content, notify=None):
+    """
+    Default repair for open_pdf_source: pikepdf preprocessing in this process.
+    Returns the repaired bytes, or None on failure.
+    """
+    preprocessed_pdf = preprocess_pdf_with_pikepdf(io.BytesIO(file_content), notify=notify)
+    return preprocessed_pdf.getvalue() if preprocessed_pdf else None
+
+
+def open_pdf(file_content, original_filename, notify=None, repair=None):
+    """
+    Open PDF bytes with PyMuPDF, falling back to pikepdf preprocessing for
+    structurally damaged files. Returns the fitz document, or None on failure.
+    """
+    return open_pdf_source(file_content, original_filename, notify=notify, repair=repair)[0]
+
+
+def open_pdf_source(file_content, original_filename, notify=None, stats=None, repair=None):
+    """
+    Like open_pdf, but return (pdf_document, source_bytes) where source_bytes are
+    the bytes actually opened: file_content itself, or the pikepdf-repaired copy.
+    file_content must be a bytes object; it is not copied.
+    Returns (None, None) on failure.
+    If stats is given, the time spent is added to stats["open_seconds"] and the
+    pikepdf share of it to stats["repair_seconds"].
+    repair(file_content, notify) returns repaired bytes or None; it defaults to
+    repair_in_process (see repair.PdfRepairer for an isolated, resource-limited one).
+    """
+    open_start = time.perf_counter()
+    try:
+        return _open_pdf_source(file_content, original_filename, notify, stats, repair or repair_in_process)
+    finally:
+        if stats is not None:
+            stats["open_seconds"] += time.perf_counter() - open_start
+            sample_memory(stats)
+
+
+def _open_pdf_source(file_content, original_filename, notify, stats, repair):
+    try:
+        # Opening from the bytes object itself lets MuPDF read it in place
+        return fitz.open(stream=file_content, filetype="pdf"), file_content
+    except fitz.FileDataError as e:
+        _notify(notify, "warning", f"⚠️ {original_filename} has structural issues. Attempting to preprocess with pikepdf...")
+        logging.warning(f"{original_filename} has structural issues: {e}")
+    except Exception as e:
+        _notify(notify, "error", f"⚠️ An unexpected error occurred while opening {original_filename}: {e}")
+        logging.error(f"Unexpected error opening {original_filename}: {e}")
+        return None, None
+
+    # Attempt preprocessing with pikepdf
+    repair_start = time.perf_counter()
+    preprocessed_pdf = repair(file_content, notify)
+    if stats is not None:
+        stats["repair_seconds"] += time.perf_counter() - repair_start
+    if not preprocessed_pdf:
+        _notify(notify, "error", f"⚠️ Failed to preprocess {original_filename} with pikepdf.")
+        return None, None
+
+    try:
+        pdf_document = fitz.open(stream=preprocessed_pdf, filetype="pdf")
+    except Exception as e:
+        _notify(notify, "error", f"⚠️ Failed to process {original_filename} even after preprocessing. Error: {e}")
+        logging.error(f"Failed to open preprocessed PDF with pikepdf for {original_filename}: {e}")
+        return None, None
+    _notify(notify, "success", f"✅ Successfully preprocessed {original_filename} with pikepdf.")
+    return pdf_document, preprocessed_pdf
+
+
+def validate_pdf(pdf_document, original_filename, notify=None):
+    """
+    Check that an opened document can be highlighted (i.e. is not encrypted).
+    """
+    if pdf_document.is_encrypted:
+        _notify(notify, "error", f"⚠️ {original_filename} is encrypted. Please provide an unencrypted PDF.")
+        logging.error(f"{original_filename} is encrypted.")
+        return False
+    return True
+
+
+def new_scan_stats():
+    """
+    Return an empty page-scan statistics record for highlight_text_in_pdf.
+    """
+    return {
+        "pages": 0,
+        "pages_with_hits": 0,
+        "pages_skipped": 0,       # Text layer present but no selected keyword
+        "pages_without_text": 0,  # No text layer (e.g. scanned pages)
+        "hits": 0,                # Keyword occurrences
+        "annotations": 0,         # Highlight annotations added
+        "open_seconds": 0.0,      # Including repair
+        "repair_seconds": 0.0,    # pikepdf preprocessing of damaged files
+        "prefilter_seconds": 0.0,
+        "extraction_seconds": 0.0,
+        "matching_seconds": 0.0,
+        "annotate_seconds": 0.0,
+        "save_seconds": 0.0,
+        "report_seconds": 0.0,
+        "page_cache_seconds": 0.0,  # Page digests and page cache lookups
+        "page_cache_hits": 0,     # Pages answered from the page cache
+        "page_cache_misses": 0,
+        "output_bytes": 0,
+        "peak_memory_bytes": 0,   # Resident memory, sampled at stage boundaries
+    }
+
+
+def merge_scan_stats(total, stats):
+    """
+    Add the counters of one scan statistics record into another; peaks (see PEAK_STATS) take the maximum.
+    """
+    for key, value in stats.items():
+        if key in PEAK_STATS:
+            total[key] = max(total.get(key, 0), value)
+        else:
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def estimate_seconds_saved(stats):
+    """
+    Estimate the time the pre-filter saved by skipping glyph-level extraction,
+    using the average extraction cost of the pages that did have hits.
+    """
+    if not stats["pages_with_hits"]:
+        return 0.0
+    average_extraction = stats["extraction_seconds"] / stats["pages_with_hits"]
+    return (stats["pages_skipped"] + stats["pages_without_text"]) * average_extraction
+
+
+def page_cache_hit_rate(stats):
+    """
+    Return the share of pages answered from the page cache, or None if it was not used.
+    """
+    lookups = stats["page_cache_hits"] + stats["page_cache_misses"]
+    return stats["page_cache_hits"] / lookups if lookups else None
+
+
+def find_page_highlights(pdf_document, matcher, page_numbers, stats, on_page=None, page_cache=None):
+    """
+    Search the given pages and compute highlight rectangles without modifying the document.
+    Pages are first checked with a cheap plain-text pass; only pages containing a
+    selected keyword go through glyph-level "rawdict" extraction.
+    :param page_numbers: Zero-based page numbers to search, in ascending order.
+    :param stats: Scan statistics record (see new_scan_stats) updated in place.
+    :param on_page: Optional callable, called without arguments as each page is searched.
+    :param page_cache: Optional page_cache.PageCache. Pages with the same content as a
+        page searched for the same keywords before, in any document, take their hits
+        from it instead of being searched.
+    :return: List of (page_num, keyword, rect, snippet) hits in page order, rect as an
+        (x0, y0, x1, y1) tuple. snippet is the context of the occurrence for its first
+        rect and None for the further rects of an occurrence wrapped over several lines.
+    """
+    hits = []
+    digests = {}
+    known = {}
+    searched = {}
+    if page_cache is not None:
+        lookup_start = time.perf_counter()
+        digests = page_cache.digests(pdf_document, page_numbers)
+        known = page_cache.get_hits(set(digests.values()), matcher.keywords)
+        stats["page_cache_seconds"] += time.perf_counter() - lookup_start
+
+    for page_num in page_numbers:
+        stats["pages"] += 1
+        if on_page:
+            on_page()
+
+        digest = digests.get(page_num)
+        if digest in known:
+            outcome, page_hits = known[digest]
+            stats["page_cache_hits"] += 1
+        else:
+            outcome, page_hits = _search_page(pdf_document.load_page(page_num), matcher, stats)
+            if digest is not None:
+                # Repeats of the page later in this document are answered from memory
+                known[digest] = searched[digest] = (outcome, page_hits)
+                stats["page_cache_misses"] += 1
+        stats[outcome] += 1
+        hits.extend((page_num, keyword, rect, snippet) for keyword, rect, snippet in page_hits)
+
+    if searched:
+        store_start = time.perf_counter()
+        page_cache.put_hits(searched, matcher.keywords)
+        stats["page_cache_seconds"] += time.perf_counter() - store_start
+    sample_memory(stats)
+    return hits
+
+
+def _search_page(page, matcher, stats):
+    """
+    Search one page for find_page_highlights. Returns (outcome, hits), outcome being
+    the scan statistics counter the page counts towards and hits a list of
+    (keyword, rect, snippet) tuples.
+    """
+    # Tier 1: cheap checks on the text layer only
+    prefilter_start = time.perf_counter()
+    page_text = page.get_text("text", flags=PREFILTER_TEXT_FLAGS) if page.get_fonts() else ""
+    has_text = bool(page_text.strip())
+    # Collapse line breaks and whitespace runs, as page_chars does, so
+    # keywords wrapped onto the next line pass the prefilter
+    has_hit = has_text and matcher.search(" ".join(page_text.split()))
+    stats["prefilter_seconds"] += time.perf_counter() - prefilter_start
+    if not has_text:
+        return "pages_without_text", []
+    if not has_hit:
+        return "pages_skipped", []
+
+    # Tier 2: one glyph-level extraction for pages with hits
+    extraction_start = time.perf_counter()
+    text, boxes = page_chars(page.get_text("rawdict", flags=CHAR_TEXT_FLAGS))
+    matching_start = time.perf_counter()
+    stats["extraction_seconds"] += matching_start - extraction_start
+
+    hits = list(char_highlights(matcher, text, boxes, page.rect.width, page.rect.height))
+    stats["matching_seconds"] += time.perf_counter() - matching_start
+    return "pages_with_hits", hits
+
+
+def page_chars(raw_dict):
+    """
+    Build the character stream of a page from a page.get_text("rawdict") result.
+    Returns (text, boxes). text is the page text with whitespace runs
+    collapsed to single spaces, the lines of a block joined by a space and blocks
+    separated by a newline, so keywords match across span and line boundaries
+    but not across blocks. boxes is an array("f") holding the x0, y0, x1, y1 glyph
+    box of every character of text, NaN for inserted separators.
+    """
+    chars = []
+    boxes = array("f")
+    for block in raw_dict["blocks"]:
+        if block["type"] != 0:  # Skip non-text blocks
+            continue
+        if chars and chars[-1] != "\n":
+            chars.append("\n")
+            boxes.extend(_NO_BOX)
+        for line in block["lines"]:
+            if chars and chars[-1] not in " \n":
+                chars.append(" ")
+                boxes.extend(_NO_BOX)
+            for span in line["spans"]:
+                for char in span["chars"]:
+                    c = char["c"]
+                    if c.isspace():
+                        if not chars or chars[-1] in " \n":
+                            continue
+                        c = " "
+                    elif len(c.lower()) != 1:
+                        # Exactly one character per glyph, also after lowercasing
+                        # for matching, keeps offsets aligned with boxes
+                        c = c.lower()[:1] or c
+                    chars.append(c)
+                    boxes.extend(char["bbox"])
+    return "".join(chars), boxes
+
+
+def _same_line(rect, char_rect):
+    overlap = min(rect.y1, char_rect.y1) - max(rect.y0, char_rect.y0)
+    return overlap >= LINE_OVERLAP_RATIO * min(rect.height, char_rect.height) and char_rect.x0 >= rect.x0
+
+
+def snippet_at(text, start, end):
+    """
+    Return the text around text[start:end] on a single line, with an ellipsis where it was cut.
+    """
+    before = text[max(start - SNIPPET_CONTEXT, 0):start]
+    after = text[end:end + SNIPPET_CONTEXT]
+    # Cut context at word boundaries
+    if start > SNIPPET_CONTEXT:
+        before = "…" + before.split(" ", 1)[-1]
+    if end + SNIPPET_CONTEXT < len(text):
+        after = after.rsplit(" ", 1)[0] + "…"
+    return f"{before}{text[start:end]}{after}".replace("\n", " ").strip()
+
+
+def char_highlights(matcher, text, boxes, page_width, page_height):
+    """
+    Yield (keyword, rect, snippet) for every keyword occurrence in a page's
+    character stream (see page_chars), rect being an (x0, y0, x1, y1) tuple
+    clipped to the page. An occurrence wrapped over several lines yields one
+    rect per line; the first carries the occurrence's context snippet (see
+    snippet_at), the others None.
+    """
+    page_bounds = fitz.Rect(0, 0, page_width, page_height)
+    for start, end, keyword in matcher.finditer(text):
+        snippet = snippet_at(text, start, end)
+        rect = None
+        for pos in range(start, end):
+            x0, y0, x1, y1 = boxes[4 * pos:4 * pos + 4]
+            if x0 != x0:  # NaN: inserted separator
+                continue
+            char_rect = fitz.Rect(x0, y0, x1, y1)
+            if rect is None:
+                rect = char_rect
+            elif _same_line(rect, char_rect):
+                rect |= char_rect
+            else:
+                yield keyword, tuple(rect & page_bounds), snippet
+                snippet = None
+                rect = char_rect
+        if rect is not None:
+            yield keyword, tuple(rect & page_bounds), snippet
+
+
+def _group_lines(tagged_rects):
+    """
+    Group (rect, tag) pairs into text lines. Returns a list of lines, each a list
+    of (fitz.Rect, tag) pairs; empty rects are dropped.
+    """
+    lines = []  # [line_y0, line_y1, items]
+    items = sorted(((fitz.Rect(rect), tag) for rect, tag in tagged_rects), key=lambda item: (item[0].y0, item[0].x0))
+    for rect, tag in items:
+        if rect.is_empty:
+            continue
+        for line in lines:
+            # Same line when the vertical overlap covers most of the shorter rect
+            overlap = min(line[1], rect.y1) - max(line[0], rect.y0)
+            if overlap >= LINE_OVERLAP_RATIO * min(line[1] - line[0], rect.height):
+                line[2].append((rect, tag))
+                break
+        else:
+            lines.append([rect.y0, rect.y1, [(rect, tag)]])
+    return [line_items for _, _, line_items in lines]
+
+
+def _merge_line(rects):
+    """
+    Merge the overlapping or adjacent rects of one line, left to right.
+    """
+    merged = []
+    for rect in sorted(rects, key=lambda rect: rect.x0):
+        if merged and rect.x0 - merged[-1].x1 <= ADJACENT_GAP_RATIO * rect.height:
+            merged[-1] |= rect
+        else:
+            merged.append(fitz.Rect(rect))
+    return merged
+
+
+def merge_line_rects(rects):
+    """
+    Group (x0, y0, x1, y1) rects into text lines and merge overlapping or adjacent
+    rects on each line. Returns a list of lines, each a list of merged fitz.Rects
+    in left-to-right order.
+    """
+    return [_merge_line([rect for rect, _ in line]) for line in _group_lines((rect, None) for rect in rects)]
+
+
+def annotation_keywords(annot):
+    """
+    Return the keywords a highlight annotation added by this module stands for,
+    or None for any other annotation. Highlights of older versions, which have a
+    single keyword as subject, are read as well.
+    """
+    info = annot.info
+    if info["title"] != ANNOTATION_AUTHOR:
+        return None
+    subject = info["subject"]
+    if subject.startswith("["):
+        try:
+            return set(json.loads(subject))
+        except ValueError:
+            pass
+    return {subject}
+
+
+def _annotation_rects(annot):
+    """
+    Return the rects of a highlight annotation's quads.
+    """
+    vertices = annot.vertices or []
+    return [fitz.Quad(vertices[index:index + 4]).rect for index in range(0, len(vertices) - 3, 4)]
+
+
+def _own_highlights(page):
+    """
+    Return (xref, rects, keywords) for the highlight annotations this module added to a page.
+    """
+    highlights = []
+    for annot in page.annots(types=[fitz.PDF_ANNOT_HIGHLIGHT]):
+        keywords = annotation_keywords(annot)
+        if keywords is not None:
+            highlights.append((annot.xref, _annotation_rects(annot), keywords))
+    return highlights
+
+
+def _add_highlight(page, quads, keywords):
+    highlight = page.add_highlight_annot(quads=quads)
+    highlight.set_colors(stroke=(1, 0.65, 0))  # Set color to orange
+    highlight.set_info(title=ANNOTATION_AUTHOR, subject=json.dumps(sorted(keywords), ensure_ascii=False))
+    highlight.update()
+
+
+def apply_highlights(pdf_document, hits, merge=True):
+    """
+    Add highlight annotations to the document for the hits from find_page_highlights.
+    With merge (the default), the hits on a line become a single multi-quad
+    annotation, whatever their keywords, with overlapping and adjacent hits
+    merged; a highlight this module added to the line before is merged into it
+    too, so overlapping keywords never stack annotations. Otherwise every hit
+    gets its own. Annotations are tagged with ANNOTATION_AUTHOR and list the
+    keywords that contributed to them as subject, so they can be updated per
+    keyword later (see remove_highlights).
+    Returns the number of annotations added.
+    """
+    count = 0
+    rects_by_page = {}
+    for page_num, keyword, rect, _ in hits:
+        rects_by_page.setdefault(page_num, []).append((rect, keyword))
+
+    for page_num, tagged_rects in rects_by_page.items():
+        page = pdf_document.load_page(page_num)
+        if not merge:
+            for rect, keyword in tagged_rects:
+                if not fitz.Rect(rect).is_empty:
+                    _add_highlight(page, [fitz.Rect(rect)], {keyword})
+                    count += 1
+            continue
+
+        # Earlier highlights take part in the line grouping, tagged with their xref
+        own = _own_highlights(page)
+        existing = {xref: keywords for xref, _, keywords in own}
+        replaced = set()
+        annotations = []
+        for line in _group_lines(tagged_rects + [(rect, xref) for xref, rects, _ in own for rect in rects]):
+            tags = {tag for _, tag in line}
+            if all(isinstance(tag, int) for tag in tags):
+                continue  # Nothing new on this line
+            keywords = set()
+            for tag in tags:
+                if isinstance(tag, int):
+                    keywords |= existing[tag]
+                    replaced.add(tag)
+                else:
+                    keywords.add(tag)
+            annotations.append((_merge_line([rect for rect, _ in line]), keywords))
+        for xref in replaced:
+            page.delete_annot(page.load_annot(xref))
+        for quads, keywords in annotations:
+            _add_highlight(page, quads, keywords)
+            count += 1
+    return count
+
+
+def remove_highlights(pdf_document, keywords, page_numbers):
+    """
+    Delete the highlight annotations apply_highlights added for any of the given
+    keywords from the given pages; other annotations are left alone.
+    An annotation merged from several keywords is deleted as a whole. Returns the
+    lines to rebuild from the keywords that remain, as a page_num ->
+    [(rects, remaining_keywords)] map of the deleted annotations that also stood
+    for other keywords (see restore_highlights).
+    """
+    keywords = set(keywords)
+    orphaned = {}
+    for page_num in page_numbers:
+        page = pdf_document.load_page(page_num)
+        # Collect first: deleting while iterating over the annotations invalidates the iterator
+        stale = [highlight for highlight in _own_highlights(page) if highlight[2] & keywords]
+        for xref, rects, contributors in stale:
+            page.delete_annot(page.load_annot(xref))
+            remaining = contributors - keywords
+            if remaining:
+                orphaned.setdefault(page_num, []).append((rects, remaining))
+    return orphaned
+
+
+def restore_highlights(pdf_document, orphaned, stats, page_cache=None):
+    """
+    Search the pages of the annotations remove_highlights deleted for their
+    remaining keywords and return the hits (see find_page_highlights) on the
+    lines those annotations covered, so apply_highlights can rebuild them.
+    Only the search times are added to the scan statistics; the pages were
+    counted when the document was first searched.
+    """
+    kept = set().union(*(keywords for entries in orphaned.values() for _, keywords in entries))
+    if not kept:
+        return []
+    search_stats = new_scan_stats()
+    hits = find_page_highlights(pdf_document, compile_keywords(kept), sorted(orphaned), search_stats,
+                                page_cache=page_cache)
+    for key, value in search_stats.items():
+        if key.endswith("_seconds"):
+            stats[key] += value
+    restored = []
+    for hit in hits:
+        page_num, keyword, rect, _ = hit
+        rect = fitz.Rect(rect)
+        if any(keyword in keywords and any(rect.intersects(line_rect) for line_rect in rects)
+               for rects, keywords in orphaned[page_num]):
+            restored.append(hit)
+    return restored
+
+
+def collect_occurrences(selected_keywords, hits):
+    """
+    Build the keyword -> page numbers map (1-based) from hits in page order.
+    """
+    # Initialize keyword_occurrences with all selected keywords
+    keyword_occurrences = {keyword: [] for keyword in selected_keywords}
+    for page_num, keyword, _, _ in hits:
+        pages = keyword_occurrences[keyword]
+        if not pages or pages[-1] != page_num + 1:
+            pages.append(page_num + 1)
+    return keyword_occurrences
+
+
+def collect_page_hits(hits):
+    """
+    Summarize hits in page order as [keyword, page, count, snippet] rows, one per
+    keyword and page (1-based), with the number of occurrences on the page and the
+    context snippet of the first one.
+    """
+    rows = {}
+    for page_num, keyword, _, snippet in hits:
+        if snippet is None:  # Continuation of an occurrence wrapped over lines
+            continue
+        row = rows.get((page_num, keyword))
+        if row is None:
+            rows[(page_num, keyword)] = [keyword, page_num + 1, 1, snippet]
+        else:
+            row[2] += 1
+    return list(rows.values())
+
+
+def save_highlighted(pdf_document, hits, original_filename, save_mode=SAVE_FULL):
+    """
+    Save an annotated document and return it as a BytesIO.
+    :param save_mode: One of SAVE_MODES:
+        "full" rewrites the whole document with default options;
+        "incremental" appends only the new objects to the original bytes
+        (documents MuPDF had to repair on opening are saved in full instead);
+        "compact" drops unused objects, deflates streams and packs objects into
+        object streams, for archival;
+        "excerpt" keeps only the pages with hits, labelled with and linking to
+        their page numbers in the original.
+    """
+    if save_mode not in SAVE_MODES:
+        raise ValueError(f"Unknown save mode: {save_mode}")
+
+    output_pdf = BytesIO()
+    if save_mode == SAVE_INCREMENTAL and pdf_document.can_save_incrementally():
+        output_pdf = BytesIO(_incremental_bytes(pdf_document))
+    elif save_mode == SAVE_COMPACT:
+        # garbage=3 would also merge duplicate objects, but is orders of magnitude slower
+        pdf_document.save(output_pdf, garbage=2, deflate=True, use_objstms=1)
+    elif save_mode == SAVE_EXCERPT and hits:
+        _save_excerpt(pdf_document, sorted({page_num for page_num, _, _, _ in hits}), original_filename, output_pdf)
+    else:
+        if save_mode != SAVE_FULL:
+            logging.info(f"{original_filename}: {save_mode} save not possible, saving the full document.")
+        pdf_document.save(output_pdf)
+    output_pdf.seek(0)
+    return output_pdf
+
+
+def _incremental_bytes(pdf_document):
+    """
+    Return the original PDF bytes with the changes appended as an incremental update.
+    """
+    # Document.save only supports incremental saves back to the file the document
+    # was opened from; the MuPDF writer can append to a memory buffer instead
+    pdf = mupdf.pdf_document_from_fz_document(pdf_document.this)
+    options = mupdf.PdfWriteOptions()
+    options.do_incremental = 1
+    buffer = mupdf.FzBuffer(INCREMENTAL_BUFFER_SIZE)
+    output = mupdf.FzOutput(buffer)
+    mupdf.pdf_write_document(pdf, output, options)
+    output.fz_close_output()
+    return buffer.fz_buffer_extract()
+
+
+def _save_excerpt(pdf_document, page_numbers, original_filename, output_pdf):
+    """
+    Save the given pages of a document to output_pdf. Each page gets a page label
+    with its original page number and a note linking to that page in the original file.
+    """
+    excerpt = fitz.open()
+    try:
+        # Copy runs of consecutive pages in one call
+        runs = []
+        for page_num in page_numbers:
+            if runs and runs[-1][1] == page_num - 1:
+                runs[-1][1] = page_num
+            else:
+                runs.append([page_num, page_num])
+        for first, last in runs:
+            excerpt.insert_pdf(pdf_document, from_page=first, to_page=last)
+
+        for page, page_num in zip(excerpt, page_numbers):
+            note = f"Page {page_num + 1} of {original_filename}"
+            origin = page.rect.tl + (8, 12)
+            page.insert_text(origin, note, fontsize=EXCERPT_NOTE_FONT_SIZE, color=(0, 0, 1))
+            note_width = fitz.get_text_length(note, fontsize=EXCERPT_NOTE_FONT_SIZE)
+            page.insert_link({
+                "kind": fitz.LINK_GOTOR,
+                "from": fitz.Rect(origin.x, origin.y - EXCERPT_NOTE_FONT_SIZE, origin.x + note_width, origin.y + 2),
+                "file": original_filename,
+                "page": page_num,
+            })
+        excerpt.set_page_labels([
+            {"startpage": index, "prefix": "", "style": "D", "firstpagenum": page_num + 1}
+            for index, page_num in enumerate(page_numbers)
+        ])
+        excerpt.save(output_pdf, garbage=2, deflate=True)
+    finally:
+        excerpt.close()
+
+
+def finish_highlighting(pdf_document, selected_keywords, original_filename, hits, stats, scan_stats=None, notify=None,
+                        save_mode=SAVE_FULL, page_hits=None, stale_highlights=None, page_cache=None):
+    """
+    Apply the hits to the document, save it (see save_highlighted) and close it.
+    stale_highlights, if given, is a (keywords, page_numbers) pair whose highlights
+    are removed first (see remove_highlights); lines they shared with other
+    keywords are highlighted again for those (see restore_highlights), searching
+    with page_cache, if given.
+    The hit and annotation counts, annotation and save times and output size are
+    added to the scan statistics, and the per-page summary of the hits (see
+    collect_page_hits) to page_hits, if given.
+    Returns the same (output_pdf, keyword_occurrences) pair as highlight_text_in_pdf.
+    """
+    stats["hits"] += sum(1 for _, _, _, snippet in hits if snippet is not None)
+    logging.info(
+        f"{original_filename}: {stats['pages_with_hits']} of {stats['pages']} pages with hits, "
+        f"{stats['pages_skipped']} skipped, {stats['pages_without_text']} without text layer"
+    )
+
+    # Save the highlighted PDF
+    output_pdf = None
+    try:
+        annotate_start = time.perf_counter()
+        restored_hits = []
+        if stale_highlights:
+            orphaned = remove_highlights(pdf_document, *stale_highlights)
+            search_start = time.perf_counter()
+            restored_hits = restore_highlights(pdf_document, orphaned, stats, page_cache=page_cache)
+            annotate_start += time.perf_counter() - search_start  # Counted as extraction and matching
+        stats["annotations"] += apply_highlights(pdf_document, hits + restored_hits)
+        save_start = time.perf_counter()
+        stats["annotate_seconds"] += save_start - annotate_start
+        output_pdf = save_highlighted(pdf_document, hits, original_filename, save_mode)
+        stats["save_seconds"] += time.perf_counter() - save_start
+        stats["output_bytes"] += len(output_pdf.getvalue())  # getvalue() shares the buffer, no copy
+        sample_memory(stats)
+        logging.info(
+            f"{original_filename}: saved in {save_mode} mode, {stats['output_bytes']} bytes "
+            f"in {stats['save_seconds']:.2f}s"
+        )
+    except Exception as e:
+        _notify(notify, "error", f"⚠️ Failed to save highlighted PDF for {original_filename}: {e}")
+        logging.error(f"Failed to save highlighted PDF for {original_filename}: {e}")
+    finally:
+        pdf_document.close()
+        if scan_stats is not None:
+            merge_scan_stats(scan_stats, stats)
+
+    if output_pdf is None:
+        return None, None
+    if page_hits is not None:
+        page_hits.extend(collect_page_hits(hits))
+    if not hits:
+        return output_pdf, None  # Return the updated PDF even if no keywords are found
+
+    return output_pdf, collect_occurrences(selected_keywords, hits)
+
+
+def page_progress(progress, page_count):
+    """
+    Adapt a progress(pages_done, page_count) callback to the on_page callback of
+    find_page_highlights and DocumentIndex.add_pages. Reports 0 pages done first.
+    """
+    if progress is None:
+        return None
+    pages_done = 0
+    progress(pages_done, page_count)
+
+    def on_page():
+        nonlocal pages_done
+        pages_done += 1
+        progress(pages_done, page_count)
+    return on_page
+
+
+def highlight_document(pdf_document, selected_keywords, original_filename, scan_stats=None, notify=None,
+                       document_index=None, doc_hash=None, save_mode=SAVE_FULL, page_hits=None, stats=None,
+                       progress=None, page_cache=None):
+    """
+    Highlight selected keywords in an already opened document, then save and close it.
+    Returns the same (output_pdf, keyword_occurrences) pair as highlight_text_in_pdf.
+    stats is this file's scan statistics record, if the caller already started
+    one (e.g. with the time spent opening the file); it is merged into scan_stats.
+    document_index, doc_hash, progress and page_cache are passed on to search_document.
+    save_mode selects the output format (see save_highlighted); page_hits is
+    passed on to finish_highlighting.
+    """
+    # Compile (or reuse) a single matcher for the whole keyword selection
+    matcher = compile_keywords(selected_keywords)
+    if stats is None:
+        stats = new_scan_stats()
+    hits = search_document(pdf_document, matcher, original_filename, stats, document_index=document_index,
+                           doc_hash=doc_hash, progress=progress, page_cache=page_cache)
+    return finish_highlighting(
+        pdf_document, selected_keywords, original_filename, hits, stats,
+        scan_stats=scan_stats, notify=notify, save_mode=save_mode, page_hits=page_hits
+    )
+
+
+def search_document(pdf_document, matcher, original_filename, stats, document_index=None, doc_hash=None,
+                    progress=None, page_cache=None):
+    """
+    Return the hits (see find_page_highlights) of a matcher in every page of a document.
+    If a DocumentIndex and the document's content hash are given, hits are
+    looked up in the index, which is built first if the document is not in it yet.
+    progress(pages_done, page_count), if given, is called as pages are searched.
+    page_cache (a page_cache.PageCache), if given, answers pages seen before in any
+    document, whether they are searched or added to the index.
+    """
+    page_count = len(pdf_document)
+    if document_index is not None and doc_hash:
+        try:
+            hits = document_index.find_highlights(doc_hash, matcher, stats)
+            if hits is None:
+                document_index.build(doc_hash, pdf_document, stats, on_page=page_progress(progress, page_count),
+                                     page_cache=page_cache)
+                hits = document_index.find_highlights(doc_hash, matcher, stats)
+            elif progress:
+                # Searching the index takes no per-page work worth reporting
+                progress(page_count, page_count)
+            return hits
+        except Exception as e:
+            # An unusable index must not fail the run: fall back to live extraction
+            logging.error(f"Document index unavailable for {original_filename}: {e}")
+            # Drop the page counts of the failed attempt; the time spent stays counted
+            for key in ("pages", "pages_with_hits", "pages_skipped", "pages_without_text"):
+                stats[key] = 0
+    return find_page_highlights(pdf_document, matcher, range(page_count), stats,
+                                on_page=page_progress(progress, page_count), page_cache=page_cache)
+
+
+def rehighlight_document(pdf_document, previous_keywords, previous_occurrences, previous_page_hits, selected_keywords,
+                         original_filename, scan_stats=None, notify=None, document_index=None, doc_hash=None,
+                         save_mode=SAVE_FULL, page_hits=None, stats=None, progress=None, page_cache=None):
+    """
+    Move a document already highlighted by this module from one keyword selection
+    to another, then save and close it. Only the keywords added to the selection
+    are searched, and only the highlights of removed keywords are deleted, on the
+    pages where they occurred; a deleted highlight that other keywords shared is
+    rebuilt from those, and new hits are merged into the highlights on their
+    lines. The rest of the annotations stay as they are.
+    Returns the same (output_pdf, keyword_occurrences) pair as highlight_text_in_pdf
+    for the new selection.
+    :param pdf_document: The highlighted output of an earlier run, opened.
+    :param previous_keywords: Keywords that run highlighted.
+    :param previous_occurrences: Its keyword occurrences (None when nothing was found).
+    :param previous_page_hits: Its report rows (see collect_page_hits); the rows of the
+        new selection are appended to page_hits, if given.
+    :param doc_hash: Content hash of the original document, for the document index.
+    :param save_mode: One of DELTA_SAVE_MODES. In "full" mode the changes are appended
+        to the earlier output as an incremental update instead of rewriting it.
+    The other arguments are those of highlight_document.
+    """
+    if save_mode not in DELTA_SAVE_MODES:
+        raise ValueError(f"Cannot re-highlight in {save_mode} mode")
+    selected_keywords = set(selected_keywords)
+    added = selected_keywords - set(previous_keywords)
+    removed = set(previous_keywords) - selected_keywords
+    previous_occurrences = previous_occurrences or {}
+    if stats is None:
+        stats = new_scan_stats()
+
+    if added:
+        hits = search_document(pdf_document, compile_keywords(added), original_filename, stats,
+                               document_index=document_index, doc_hash=doc_hash, progress=progress,
+                               page_cache=page_cache)
+    else:
+        hits = []
+        if progress:
+            progress(len(pdf_document), len(pdf_document))
+    stale_pages = sorted({page - 1 for keyword in removed for page in previous_occurrences.get(keyword, ())})
+    logging.info(
+        f"{original_filename}: re-highlighting with {len(added)} added and {len(removed)} removed keywords, "
+        f"{len(stale_pages)} pages with stale highlights"
+    )
+    added_page_hits = []
+    output_pdf, added_occurrences = finish_highlighting(
+        pdf_document, added, original_filename, hits, stats, scan_stats=scan_stats, notify=notify,
+        save_mode=SAVE_INCREMENTAL if save_mode == SAVE_FULL else save_mode, page_hits=added_page_hits,
+        stale_highlights=(removed, stale_pages), page_cache=page_cache
+    )
+    if output_pdf is None:
+        return None, None
+
+    if page_hits is not None:
+        kept_rows = [row for row in previous_page_hits or () if row[0] not in removed]
+        page_hits.extend(sorted(kept_rows + added_page_hits, key=lambda row: row[1]))
+    # Keywords without hits are listed too, as collect_occurrences does
+    keyword_occurrences = {keyword: previous_occurrences.get(keyword, []) for keyword in selected_keywords}
+    keyword_occurrences.update(added_occurrences or {})
+    if not any(keyword_occurrences.values()):
+        return output_pdf, None
+    return output_pdf, keyword_occurrences
+
+
+def rehighlight_pdf(base, previous_keywords, previous_occurrences, previous_page_hits, selected_keywords,
+                    original_filename, scan_stats=None, notify=None, document_index=None, doc_hash=None,
+                    save_mode=SAVE_FULL, page_hits=None, progress=None, page_cache=None):
+    """
+    Open an earlier highlighted output, given as bytes or a path, and re-highlight
+    it for a new keyword selection (see rehighlight_document). Returns
+    (None, None) if the earlier output cannot be opened.
+    """
+    stats = new_scan_stats()
+    open_start = time.perf_counter()
+    try:
+        if isinstance(base, (bytes, bytearray, memoryview)):
+            pdf_document = fitz.open(stream=base, filetype="pdf")
+        else:
+            pdf_document = fitz.open(base, filetype="pdf")
+    except Exception as e:
+        logging.error(f"Failed to open the earlier highlighted PDF of {original_filename}: {e}")
+        pdf_document = None
+    stats["open_seconds"] += time.perf_counter() - open_start
+    if pdf_document is None:
+        if scan_stats is not None:
+            merge_scan_stats(scan_stats, stats)
+        return None, None
+
+    return rehighlight_document(
+        pdf_document, previous_keywords, previous_occurrences, previous_page_hits, selected_keywords,
+        original_filename, scan_stats=scan_stats, notify=notify, document_index=document_index, doc_hash=doc_hash,
+        save_mode=save_mode, page_hits=page_hits, stats=stats, progress=progress, page_cache=page_cache
+    )
+
+
+def highlight_text_in_pdf(file_content, selected_keywords, original_filename, scan_stats=None, notify=None,
+                          document_index=None, doc_hash=None, save_mode=SAVE_FULL, page_hits=None, repair=None,
+                          progress=None, page_cache=None):
+    """
+    Highlight selected keywords in the PDF and return the updated PDF and keyword occurrences.
+    Includes preprocessing steps for corrupted or complex PDFs; encrypted PDFs are rejected.
+    If scan_stats is given (see new_scan_stats), the counters and stage timings
+    of this file are added to it, including the time spent opening it.
+    If page_hits is a list, [keyword, page, count, snippet] rows for the report
+    are appended to it (see collect_page_hits).
+    document_index, doc_hash, save_mode, progress and page_cache are passed on
+    to highlight_document; repair is passed on to open_pdf_source.
+    """
+    stats = new_scan_stats()
+    pdf_document, _ = open_pdf_source(file_content, original_filename, notify=notify, stats=stats, repair=repair)
+    if pdf_document is None or not validate_pdf(pdf_document, original_filename, notify=notify):
+        if pdf_document is not None:
+            pdf_document.close()
+        if scan_stats is not None:
+            merge_scan_stats(scan_stats, stats)
+        return None, None
+
+    return highlight_document(
+        pdf_document, selected_keywords, original_filename,
+        scan_stats=scan_stats, notify=notify, document_index=document_index, doc_hash=doc_hash,
+        save_mode=save_mode, page_hits=page_hits, stats=stats, progress=progress, page_cache=page_cache
+    )
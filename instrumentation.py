@@ -0,0 +1,99 @@
+"""
+Performance instrumentation: memory sampling, structured metrics logs and profiling.
+
+Stage timings and counters are collected in the scan statistics records of
+highlighter.new_scan_stats as a file moves through opening, repair,
+pre-filtering, extraction, matching, annotation, saving and reporting.
+log_metrics writes such a record as one JSON line on the
+"pdf_highlighter.metrics" logger, per file and per batch, and profile_call
+runs a single call under cProfile for a closer look.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+
+METRICS_LOGGER = logging.getLogger("pdf_highlighter.metrics")
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def memory_bytes():
+    """
+    Return the resident memory of this process in bytes.
+    Falls back to the peak resident memory where the current value is not
+    available, and to 0 where neither is.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Bytes on macOS, KB elsewhere
+
+
+def sample_memory(stats):
+    """
+    Raise stats["peak_memory_bytes"] to the current resident memory if it is higher.
+    Memory is sampled at stage boundaries, so short spikes within a stage may be missed.
+    """
+    stats["peak_memory_bytes"] = max(stats.get("peak_memory_bytes", 0), memory_bytes())
+
+
+def log_metrics(scope, name, stats, **extra):
+    """
+    Log a statistics record as one JSON line and return the logged record.
+    :param scope: What the record covers: "file", "batch" or "upload".
+    :param name: File name or other label of the measured unit.
+    :param extra: Additional JSON-serializable fields.
+    """
+    record = {"scope": scope, "name": name}
+    for key, value in {**stats, **extra}.items():
+        record[key] = round(value, 4) if isinstance(value, float) else value
+    METRICS_LOGGER.info(json.dumps(record, ensure_ascii=False))
+    return record
+
+
+def configure_metrics_log(path, propagate=True):
+    """
+    Also write metrics records to path as bare JSON lines. Safe to call repeatedly.
+    With propagate=False they are no longer passed on to the root logger's handlers.
+    """
+    path = os.path.abspath(path)
+    METRICS_LOGGER.setLevel(logging.INFO)
+    METRICS_LOGGER.propagate = propagate
+    for handler in METRICS_LOGGER.handlers:
+        if isinstance(handler, logging.FileHandler) and handler.baseFilename == path:
+            return
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    METRICS_LOGGER.addHandler(handler)
+
+
+def profile_call(func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) under cProfile and return (result, profiler).
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    return result, profiler
+
+
+def profile_summary(profiler, limit=25):
+    """
+    Return the functions with the highest cumulative time as printable text.
+    """
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).strip_dirs().sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
@@ -0,0 +1,504 @@
+"""
+Persistent background job queue for highlighting runs.
+
+A job is a batch of PDFs highlighted with one keyword selection. submit()
+copies the inputs into the queue directory and records the job and its files
+in a SQLite database; a dispatcher thread keeps a persistent pool of worker
+processes busy with the pending files of every job and records each result
+as it completes. Free workers take files from the jobs in turn, the job with
+the fewest running files first, so one large batch cannot hold every worker
+while other jobs wait. A file submitted with an earlier result of the same
+document is re-highlighted from that result for the keywords that changed
+(see highlighter.rehighlight_document). Workers report the pages searched so far, so callers
+can poll per-file and per-page progress with status() and files() and pick
+up finished files while the rest of the job is still running.
+
+Files that were running when the process stopped are pending again when the
+queue is next opened, so an interrupted job resumes after its last completed
+file.
+"""
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, namedtuple
+from concurrent.futures.process import BrokenProcessPool
+
+from batch import FileResult, RehighlightSource, default_worker_count, highlighted_path, new_pool, submit_file
+from highlighter import SAVE_FULL, new_scan_stats
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_CANCELLED = "cancelled"
+
+# File states
+FILE_PENDING = "pending"
+FILE_RUNNING = "running"
+FILE_DONE = "done"
+FILE_FAILED = "failed"
+FILE_CANCELLED = "cancelled"
+FINISHED_FILE_STATES = (FILE_DONE, FILE_FAILED, FILE_CANCELLED)
+
+PROGRESS_INTERVAL_SECONDS = 0.5  # Page progress is written at most this often per file
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    keywords TEXT NOT NULL,
+    save_mode TEXT NOT NULL,
+    max_workers INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS files (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    state TEXT NOT NULL,
+    cached INTEGER NOT NULL DEFAULT 0,
+    pages_done INTEGER NOT NULL DEFAULT 0,
+    pages_total INTEGER NOT NULL DEFAULT 0,
+    output_path TEXT,
+    result TEXT,
+    error TEXT,
+    finished REAL,
+    PRIMARY KEY (job_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS files_by_state ON files (state, job_id);
+CREATE TABLE IF NOT EXISTS bases (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (job_id, position)
+) WITHOUT ROWID;
+"""
+
+# Progress of a job as a whole
+JobStatus = namedtuple(
+    "JobStatus",
+    ["job_id", "state", "created", "files_total", "files_done", "files_failed", "pages_done", "pages_total"],
+)
+
+# One file of a job. keyword_occurrences, page_hits, scan_stats and messages
+# are those of batch.FileResult; output_path is None until the file is done.
+# input_path is the job's copy of the original, None for completed files.
+JobFile = namedtuple(
+    "JobFile",
+    ["position", "filename", "state", "cached", "pages_done", "pages_total", "input_path", "output_path",
+     "keyword_occurrences", "page_hits", "scan_stats", "messages", "error"],
+)
+
+
+# A file handed to the worker pool. slots is the number of processes it keeps
+# busy, more than one for a file split into page shards; an isolated file runs
+# in a pool of its own after a crash. pool is the pool it was submitted to.
+_Task = namedtuple(
+    "_Task", ["job_id", "filename", "source", "keywords", "save_mode", "slots", "isolated", "pool"],
+)
+
+
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class JobProgress:
+    """
+    Picklable progress callback for batch.submit_file that writes
+    the pages searched so far into a job's file rows, at most every
+    PROGRESS_INTERVAL_SECONDS per file.
+    """
+
+    def __init__(self, db_path, job_id):
+        self.db_path = db_path
+        self.job_id = job_id
+        self._written = {}  # filename -> time of the last write in this process
+
+    def __call__(self, filename, pages_done, page_count):
+        now = time.monotonic()
+        if pages_done not in (0, page_count) and now - self._written.get(filename, 0) < PROGRESS_INTERVAL_SECONDS:
+            return
+        self._written[filename] = now
+        try:
+            with _connect(self.db_path) as connection:
+                connection.execute(
+                    "UPDATE files SET pages_done = ?, pages_total = ? WHERE job_id = ? AND filename = ?",
+                    (pages_done, page_count, self.job_id, filename),
+                )
+        except sqlite3.Error as e:
+            # Progress is informational; a busy database must not fail the file
+            logging.warning(f"Failed to record progress of {filename}: {e}")
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of highlighting jobs, run by one dispatcher thread.
+    :param root: Directory holding the database and the inputs and outputs of every job.
+    :param max_workers: Worker processes shared by all jobs (defaults to the CPU count); the
+                        max_workers of a job caps how many of them it uses at once.
+    :param index_path: Document index database used by the workers, if any.
+    :param repair: Repair callable for damaged PDFs (see batch.highlight_files_parallel).
+    :param limits: Resource limits for each file's worker process (see batch.highlight_files_parallel).
+    :param ttl_seconds: Finished and cancelled jobs are deleted this long after they end.
+    :param page_cache: page_cache.PageCache used by the workers, if any.
+    """
+
+    def __init__(self, root, max_workers=None, index_path=None, repair=None, limits=None, ttl_seconds=24 * 3600,
+                 page_cache=None):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.path = os.path.join(root, "jobs.sqlite3")
+        self.max_workers = max(1, max_workers or default_worker_count())
+        self.index_path = index_path
+        self.repair = repair
+        self.limits = limits
+        self.ttl_seconds = ttl_seconds
+        self.page_cache = page_cache
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+        self._last_started = {}  # job_id -> number of the job's latest file start
+        self._starts = 0
+        with _connect(self.path) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            # Files interrupted by a restart run again; their jobs resume
+            resumed = connection.execute(
+                "UPDATE files SET state = ?, pages_done = 0 WHERE state = ?", (FILE_PENDING, FILE_RUNNING)
+            ).rowcount
+        if resumed:
+            logging.info(f"Resuming {resumed} interrupted files from the job queue.")
+
+    def _job_dir(self, job_id, *parts):
+        return os.path.join(self.root, job_id, *parts)
+
+    def submit(self, files, selected_keywords, save_mode=SAVE_FULL, max_workers=None, completed=(), previous=None):
+        """
+        Queue a job and return its ID.
+        :param files: Iterable of (filename, source) pairs, where source is the PDF bytes
+                      or a path to the PDF. Filenames must be unique within the job.
+        :param completed: batch.FileResult records of files already highlighted (e.g. taken
+                          from a result cache) to include in the job as done; their
+                          output_path is copied into the job.
+        :param previous: Optional mapping of filename to a batch.RehighlightSource describing an
+                         earlier result of that file to re-highlight instead of starting from
+                         scratch; its input_path is ignored and its base_path copied into the job.
+        """
+        job_id = uuid.uuid4().hex
+        input_dir = self._job_dir(job_id, "input")
+        os.makedirs(input_dir)
+        previous = previous or {}
+        rows = []
+        base_rows = []
+        position = 0
+        for result in completed:
+            output_path = highlighted_path(self._job_dir(job_id, "output"), result.filename)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            shutil.copyfile(result.output_path, output_path)
+            rows.append((job_id, position, result.filename, FILE_DONE, 1, 0, 0, output_path,
+                         self._result_json(result), None, time.time()))
+            position += 1
+        for filename, source in files:
+            input_path = os.path.join(input_dir, f"{position}.pdf")
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                with open(input_path, "wb") as input_file:
+                    input_file.write(source)
+            else:
+                shutil.copyfile(source, input_path)
+            rows.append((job_id, position, filename, FILE_PENDING, 0, 0, 0, None, None, None, None))
+            base = previous.get(filename)
+            if base is not None:
+                os.makedirs(self._job_dir(job_id, "base"), exist_ok=True)
+                shutil.copyfile(base.base_path, self._job_dir(job_id, "base", f"{position}.pdf"))
+                base_rows.append((job_id, position, json.dumps({
+                    "doc_hash": base.doc_hash,
+                    "keywords": sorted(base.keywords),
+                    "keyword_occurrences": base.keyword_occurrences,
+                    "page_hits": base.page_hits,
+                })))
+            position += 1
+
+        with _connect(self.path) as connection:
+            connection.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                (job_id, time.time(), json.dumps(sorted(selected_keywords)), save_mode,
+                 max(1, max_workers or self.max_workers), JOB_QUEUED),
+            )
+            connection.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            connection.executemany("INSERT INTO bases VALUES (?, ?, ?)", base_rows)
+            self._finish_if_complete(connection, job_id)
+        logging.info(f"Queued job {job_id} with {len(rows)} files.")
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id):
+        """
+        Return the JobStatus of a job, or None if there is no such job.
+        """
+        connection = _connect(self.path)
+        try:
+            job = connection.execute("SELECT state, created FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = connection.execute(
+                "SELECT COUNT(*), SUM(state = ?), SUM(state IN (?, ?)), SUM(pages_done), SUM(pages_total) "
+                "FROM files WHERE job_id = ?",
+                (FILE_DONE, FILE_FAILED, FILE_CANCELLED, job_id),
+            ).fetchone()
+        finally:
+            connection.close()
+        return JobStatus(job_id, job[0], job[1], *(count or 0 for count in counts))
+
+    def files(self, job_id, finished_only=False):
+        """
+        Return the JobFiles of a job in submission order.
+        """
+        query = "SELECT * FROM files WHERE job_id = ?"
+        params = [job_id]
+        if finished_only:
+            query += " AND state IN (?, ?, ?)"
+            params += FINISHED_FILE_STATES
+        connection = _connect(self.path)
+        try:
+            rows = connection.execute(query + " ORDER BY position", params).fetchall()
+        finally:
+            connection.close()
+        return [self._job_file(row) for row in rows]
+
+    def cancel(self, job_id):
+        """
+        Cancel the pending files of a job; files already running are finished.
+        """
+        with _connect(self.path) as connection:
+            connection.execute(
+                "UPDATE files SET state = ?, finished = ? WHERE job_id = ? AND state = ?",
+                (FILE_CANCELLED, time.time(), job_id, FILE_PENDING),
+            )
+            connection.execute(
+                "UPDATE jobs SET state = ?, finished = COALESCE(finished, ?) WHERE job_id = ?",
+                (JOB_CANCELLED, time.time(), job_id),
+            )
+
+    @staticmethod
+    def _result_json(result):
+        return json.dumps({
+            "keyword_occurrences": result.keyword_occurrences,
+            "page_hits": result.page_hits,
+            "scan_stats": result.scan_stats,
+            "messages": result.messages,
+        })
+
+    def _job_file(self, row):
+        job_id, position, filename, state, cached, pages_done, pages_total, output_path, result, error = row[:10]
+        result = json.loads(result) if result else {}
+        input_path = None if cached else self._job_dir(job_id, "input", f"{position}.pdf")
+        return JobFile(
+            position, filename, state, bool(cached), pages_done, pages_total, input_path, output_path,
+            result.get("keyword_occurrences"), result.get("page_hits"),
+            result.get("scan_stats") or new_scan_stats(),
+            [tuple(message) for message in result.get("messages", [])], error,
+        )
+
+    def start(self):
+        """
+        Start the dispatcher thread, if it is not running yet.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._dispatch, name="job-queue", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stop the dispatcher after the files it is running, if any.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _dispatch(self):
+        running = {}  # Future -> _Task
+        while not self._stop.is_set() or running:
+            try:
+                for future in [future for future in running if future.done()]:
+                    self._complete(running, running.pop(future), future)
+                if not self._stop.is_set():
+                    self._start_files(running)
+                if not running:
+                    self.prune()
+            except Exception as e:
+                # A failing file must not stop the queue
+                logging.exception(f"Job queue dispatch failed: {e}")
+            # Set by submit() and by every file finishing
+            self._wake.wait(5)
+            self._wake.clear()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _start_files(self, running):
+        """
+        Hand pending files to the worker pool while it has free workers.
+        """
+        while True:
+            free = self.max_workers - sum(task.slots for task in running.values())
+            if free < 1:
+                return
+            task = self._claim(running, free)
+            if task is None:
+                return
+            future, task = self._submit(task)
+            running[future] = task
+
+    def _claim(self, running, free):
+        """
+        Mark the next pending file as running and return its _Task, or None if no
+        job can start a file. The job with the fewest running files goes first,
+        then the job that started a file longest ago, then the oldest job; a job
+        never runs more files than its max_workers. source is the path of the input,
+        or a batch.RehighlightSource for files submitted with an earlier result.
+        A job's last file is split into page shards across the free workers, unless
+        it is re-highlighted, which only searches the changed keywords.
+        """
+        running_files = Counter(task.job_id for task in running.values())
+        with _connect(self.path) as connection:
+            jobs = connection.execute(
+                "SELECT job_id, created, keywords, save_mode, max_workers, COUNT(*) FROM jobs "
+                "JOIN files USING (job_id) WHERE files.state = ? GROUP BY job_id",
+                (FILE_PENDING,),
+            ).fetchall()
+            active = {job[0] for job in jobs} | set(running_files)
+            self._last_started = {job_id: start for job_id, start in self._last_started.items() if job_id in active}
+            jobs = [job for job in jobs if running_files[job[0]] < min(job[4], self.max_workers)]
+            if not jobs:
+                return None
+            job_id, _, keywords, save_mode, max_workers, pending = min(
+                jobs, key=lambda job: (running_files[job[0]], self._last_started.get(job[0], -1), job[1])
+            )
+            position, filename, base = connection.execute(
+                "SELECT files.position, filename, source FROM files LEFT JOIN bases USING (job_id, position) "
+                "WHERE job_id = ? AND state = ? ORDER BY files.position LIMIT 1",
+                (job_id, FILE_PENDING),
+            ).fetchone()
+            connection.execute(
+                "UPDATE files SET state = ? WHERE job_id = ? AND position = ?", (FILE_RUNNING, job_id, position)
+            )
+            connection.execute(
+                "UPDATE jobs SET state = ? WHERE job_id = ? AND state = ?", (JOB_RUNNING, job_id, JOB_QUEUED)
+            )
+        self._starts += 1
+        self._last_started[job_id] = self._starts
+
+        slots = 1
+        if pending == 1 and not running_files[job_id] and base is None:
+            slots = max(1, min(max_workers, free))
+        source = self._job_dir(job_id, "input", f"{position}.pdf")
+        if base is not None:
+            base = json.loads(base)
+            source = RehighlightSource(
+                source, base["doc_hash"], self._job_dir(job_id, "base", f"{position}.pdf"), base["keywords"],
+                base["keyword_occurrences"], base["page_hits"],
+            )
+        logging.info(f"Starting {filename} of job {job_id} with {slots} workers.")
+        return _Task(job_id, filename, source, json.loads(keywords), save_mode, slots, False, None)
+
+    def _submit(self, task):
+        """
+        Submit a file to the shared pool, or to a new pool of its own if it is
+        isolated. Returns the Future of its FileResult and the task with its pool.
+        """
+        if task.isolated:
+            pool = new_pool(1, self.limits)
+        else:
+            if self._pool is None:
+                self._pool = new_pool(self.max_workers, self.limits)
+            pool = self._pool
+        try:
+            future = submit_file(
+                pool, task.filename, task.source, task.keywords, self._job_dir(task.job_id, "output"),
+                self.index_path, task.save_mode, self.repair, JobProgress(self.path, task.job_id), self.page_cache,
+                task.slots,
+            )
+        except BrokenProcessPool:
+            self._pool = None
+            return self._submit(task)
+        future.add_done_callback(lambda done: self._wake.set())
+        return future, task._replace(pool=pool)
+
+    def _complete(self, running, task, future):
+        """
+        Record the result of a file that left the worker pool.
+        """
+        if task.isolated:
+            task.pool.shutdown(wait=False)
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            if task.pool is self._pool:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            if not task.isolated:
+                # Any file in flight may have caused the crash; each runs again in a
+                # pool of its own, so a second crash can only be blamed on that file
+                future, task = self._submit(task._replace(isolated=True))
+                running[future] = task
+                return
+            result = FileResult(task.filename, None, None, None, None, new_scan_stats(), [], str(e))
+        except Exception as e:
+            result = FileResult(task.filename, None, None, None, None, new_scan_stats(), [], str(e))
+        if result.error is not None:
+            logging.error(f"Job {task.job_id} failed on {task.filename}: {result.error}")
+        self._record(task.job_id, result)
+        with _connect(self.path) as connection:
+            self._finish_if_complete(connection, task.job_id)
+
+    def _record(self, job_id, result):
+        state = FILE_DONE if result.error is None else FILE_FAILED
+        with _connect(self.path) as connection:
+            connection.execute(
+                "UPDATE files SET state = ?, pages_done = MAX(pages_done, pages_total), output_path = ?, "
+                "result = ?, error = ?, finished = ? WHERE job_id = ? AND filename = ?",
+                (state, result.output_path, self._result_json(result), result.error, time.time(), job_id,
+                 result.filename),
+            )
+
+    @staticmethod
+    def _finish_if_complete(connection, job_id):
+        unfinished = connection.execute(
+            "SELECT COUNT(*) FROM files WHERE job_id = ? AND state IN (?, ?)", (job_id, FILE_PENDING, FILE_RUNNING)
+        ).fetchone()[0]
+        if not unfinished:
+            connection.execute(
+                "UPDATE jobs SET state = CASE WHEN state = ? THEN state ELSE ? END, "
+                "finished = COALESCE(finished, ?) WHERE job_id = ?",
+                (JOB_CANCELLED, JOB_DONE, time.time(), job_id),
+            )
+
+    def prune(self):
+        """
+        Delete jobs that ended more than ttl_seconds ago, with their files.
+        """
+        cutoff = time.time() - self.ttl_seconds
+        with _connect(self.path) as connection:
+            expired = [row[0] for row in connection.execute(
+                "SELECT job_id FROM jobs WHERE state IN (?, ?) AND finished < ?", (JOB_DONE, JOB_CANCELLED, cutoff)
+            )]
+            for job_id in expired:
+                connection.execute("DELETE FROM files WHERE job_id = ?", (job_id,))
+                connection.execute("DELETE FROM bases WHERE job_id = ?", (job_id,))
+                connection.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        for job_id in expired:
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+        if expired:
+            logging.info(f"Deleted {len(expired)} expired jobs.")
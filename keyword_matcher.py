@@ -0,0 +1,115 @@
+"""
+Single-pass multi-keyword matching for the PDF highlighter.
+
+All selected keywords are folded into one prefix trie, which is rendered as a
+single regular expression. Scanning a piece of text is then one pass of the
+regex engine, however many keywords are selected, and the trie is only walked
+at the positions where some keyword actually starts.
+"""
+import re
+from functools import lru_cache
+
+# Trie key marking the end of a keyword (characters are never empty strings)
+_END = ""
+
+
+def _trie_to_regex(node):
+    """
+    Render a trie node as a regex matching any keyword below it.
+    Common prefixes are shared, so the cost per text position depends on the
+    keyword length rather than on the number of keywords.
+    """
+    pattern = ""
+    # Collapse single-child chains without recursing
+    while len(node) == 1 and _END not in node:
+        (char, node), = node.items()
+        pattern += re.escape(char)
+
+    branches = [
+        re.escape(char) + _trie_to_regex(child)
+        for char, child in sorted(node.items())
+        if char != _END
+    ]
+    if not branches:
+        return pattern
+    alternation = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    if _END in node:
+        alternation = f"(?:{alternation})?"
+    return pattern + alternation
+
+
+class KeywordMatcher:
+    """
+    Case-insensitive matcher for a fixed set of keywords.
+    Build it once per keyword set (see compile_keywords) and reuse it for every page.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = tuple(sorted(set(keywords)))
+        self._trie = {}
+        for keyword in self.keywords:
+            needle = keyword.lower()
+            if not needle:
+                continue
+            node = self._trie
+            for char in needle:
+                node = node.setdefault(char, {})
+            node.setdefault(_END, []).append(keyword)
+
+        # Zero-width lookahead so that every start position is reported,
+        # including keywords that overlap or contain one another
+        self._pattern = re.compile(f"(?=(?:{_trie_to_regex(self._trie)}))") if self._trie else None
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def finditer(self, text):
+        """
+        Yield (start, end, keyword) for every keyword occurrence in text.
+        Offsets refer to text.lower(). Occurrences of the same keyword never overlap,
+        which mirrors the repeated str.find loop this matcher replaces.
+        """
+        if self._pattern is None:
+            return
+        lower_text = text.lower()
+        text_length = len(lower_text)
+        next_start = {}
+
+        for match in self._pattern.finditer(lower_text):
+            start = pos = match.start()
+            node = self._trie
+            while pos < text_length:
+                node = node.get(lower_text[pos])
+                if node is None:
+                    break
+                pos += 1
+                for keyword in node.get(_END, ()):
+                    if start >= next_start.get(keyword, 0):
+                        next_start[keyword] = pos
+                        yield start, pos, keyword
+
+    def search(self, text):
+        """
+        Return True if any keyword occurs in text.
+        """
+        return self._pattern is not None and self._pattern.search(text.lower()) is not None
+
+    def keywords_in(self, text):
+        """
+        Return the set of keywords that occur in text.
+        """
+        return {keyword for _, _, keyword in self.finditer(text)}
+
+
+@lru_cache(maxsize=32)
+def _compile_frozen(keywords):
+    return KeywordMatcher(keywords)
+
+
+def compile_keywords(keywords):
+    """
+    Return a KeywordMatcher for the given keywords.
+    Matchers are cached per keyword set for the life of the process, so Streamlit
+    reruns with an unchanged selection reuse the compiled pattern.
+    """
+    return _compile_frozen(frozenset(keywords))
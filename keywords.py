@@ -0,0 +1,58 @@
+"""
+Preset and general keyword lists offered in the highlighter UI.
+"""
+
+# -------------------------------
+# Define Preset and General Keywords
+# -------------------------------
+PRESET_KEYWORDS = {
+    "VIC": ["VPA", "Victorian Planning Authority", "VPP", "Victorian Planning Provision"],
+    "QLD": ["Shire Planning", "City Planning"],
+    "WA": ["Metropolitan Region Scheme", "Rural Living Zone"],
+    "NSW": ["Urban Renewal Areas"],
+}
+
+GENERAL_KEYWORDS = [
+    "Activity Centre", "Amendment", "Amendments Report", "Annual Plan", "Annual Report",
+    "Area Plan", "Assessments", "Broadacre", "Budget", "City Plan", "Code Amendment",
+    "Concept Plan", "Corporate Business Plan", "Corporate Plan", "Council Action Plan",
+    "Council Business Plan", "Council Plan", "Council Report", 
+    "Development Investigation Area", "Development Plan", "Development Plan Amendment",
+    "DPA", "Emerging community", "Employment land study", "Exhibition", "expansion",
+    "Framework", "Framework plan", "Gateway Determination", "greenfield", "growth area", 
+    "growth plan", "growth plans", "housing", "Housing Strategy",
+    "Industrial land study", "infrastructure plan", "infrastructure planning", 
+    "Inquiries", "Investigation area", "land use", "Land use strategy",
+    "LDP", "Local Area Plan", "Local Development Area", "Local Development Plan",
+    "Local Environmental Plan", "Local Planning Policy", "Local Planning Scheme",
+    "Local Planning Strategy", "Local Strategic Planning Statement", "LPP", "LPS", "LSPS",
+    "Major Amendment", "Major Update", "Master Plan", "Masterplan", "Neighbourhood Plan",
+    "Operational Plan", "Planning Commission", "Planning Framework", "Planning Investigation Area",
+    "Planning proposal", "Planning report", "Planning Scheme", "Planning Scheme Amendment",
+    "Planning Strategy", "Precinct plan", "Priority Development Area",
+    "Project Vision", "Rezoning", "settlement", "Strategy", "Structure Plan", "Structure Planning",
+    "Study", "Territory plan", "Town Planning Scheme",
+    "Township Plan", "TPS", "Urban Design Framework", "Urban growth", "Urban Release",
+    "Urban renewal", "Variation", "Vision", "VPA",
+    "Victorian Planning Authority", "VPP", "Victorian Planning Provision",
+    "Shire Planning", "City Planning",
+    "Metropolitan Region Scheme", "Rural Living Zone",
+    "Urban Renewal Areas",
+]
+
+# Combine all keywords for easy access
+ALL_KEYWORDS = {**PRESET_KEYWORDS, "General": GENERAL_KEYWORDS}
+
+
+def select_keywords(keywords=(), presets=(), include_all=False):
+    """
+    Combine explicit keywords, the keywords of the named presets (keys of
+    ALL_KEYWORDS) and, with include_all, every predefined keyword into one set.
+    Raises KeyError for an unknown preset name.
+    """
+    selected = {keyword.strip() for keyword in keywords if keyword.strip()}
+    for preset in presets:
+        selected.update(ALL_KEYWORDS[preset])
+    if include_all:
+        selected.update(kw for kws in ALL_KEYWORDS.values() for kw in kws)
+    return selected
@@ -1,14 +1,28 @@
-import io
+import os
 import streamlit as st
-import fitz  # PyMuPDF
-import openpyxl
-from io import BytesIO
-import zipfile
-import pikepdf
 import tempfile
+import time
 import logging
-from google.cloud import storage  # GCS integration
-from google.oauth2 import service_account  # For service account credentials
+from concurrent.futures import ThreadPoolExecutor
+from keywords import PRESET_KEYWORDS, GENERAL_KEYWORDS, ALL_KEYWORDS
+from highlighter import (
+    highlight_document, open_pdf_source, validate_pdf, new_scan_stats, merge_scan_stats, estimate_seconds_saved,
+    page_cache_hit_rate,
+    SAVE_FULL, SAVE_INCREMENTAL, SAVE_COMPACT, SAVE_EXCERPT, DELTA_SAVE_MODES
+)
+from reports import BatchReportWriter, generate_csv_report, report_filename
+from result_store import ResultSession, ResultStore
+from result_cache import LocalDirectoryBackend, ResultCache, cache_key, content_hash, file_content_hash
+from document_index import DocumentIndex
+from page_cache import PageCache
+from repair import PdfRepairer, ResourceLimits
+from uploads import GCSStorage, LocalStorage, UploadQueue
+from signed_urls import SignedUrlCache
+from bundles import ZipBundle
+from previews import PREVIEW_DPI, ZOOMED_PREVIEW_DPI, PreviewRenderer, hit_pages
+from instrumentation import configure_metrics_log, log_metrics, profile_call, profile_summary
+from batch import FileResult, RehighlightSource, highlight_document_sharded, default_worker_count
+from job_queue import FILE_CANCELLED, FILE_DONE, FILE_FAILED, FILE_PENDING, FILE_RUNNING, JOB_CANCELLED, JOB_DONE, JobQueue
 
 # -------------------------------
 # Hardcoded Service Account Credentials
@@ -54,35 +68,111 @@ QnYl49DOtLl7q1gzKA+pBWnb7g==
     "universe_domain": "googleapis.com"
 }
 
-# Create credentials object from the service account info
-credentials = service_account.Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO)
-
 # -------------------------------
 # Initialize Google Cloud Storage Client
 # -------------------------------
-def initialize_gcs_client():
+# Define bucket name
+GCS_BUCKET_NAME = "pdf-highlighter-upload"  # Your bucket name
+
+# Set PDF_HIGHLIGHTER_STORAGE_DIR to store uploads in a local directory instead of GCS
+LOCAL_STORAGE_DIR = os.environ.get("PDF_HIGHLIGHTER_STORAGE_DIR")
+
+@st.cache_resource
+def get_gcs_bucket():
+    """
+    Create the credentials, GCS client and bucket handle once per process.
+    Raises on failure, so a failed attempt is retried on the next rerun.
+    """
+    # Imported on first use: google.cloud is slow to import and not needed with local storage
+    from google.cloud import storage
+    from google.oauth2 import service_account
+
+    # Create credentials object from the service account info
+    credentials = service_account.Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO)
+    client = storage.Client(credentials=credentials, project=credentials.project_id)
+    logging.info("Google Cloud Storage client initialized successfully.")
+    return client.bucket(GCS_BUCKET_NAME)
+
+@st.cache_resource
+def check_bucket_in_background(_bucket):
+    """
+    Check once per process, in a background thread, that the bucket exists.
+    Returns a Future of the check, so reruns never wait on the network round trip.
+    """
+    def check():
+        exists = _bucket.exists()
+        if exists:
+            logging.info(f"Connected to GCS bucket: {GCS_BUCKET_NAME}")
+        else:
+            logging.error(f"The bucket '{GCS_BUCKET_NAME}' does not exist.")
+        return exists
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gcs-bucket-check")
+    future = executor.submit(check)
+    executor.shutdown(wait=False)
+    return future
+
+def initialize_gcs_bucket():
     """
-    Initialize and return a Google Cloud Storage client using hardcoded credentials.
+    Return the GCS bucket handle, or None if the client could not be initialized.
+    Reports a missing bucket once the background check has finished.
     """
     try:
-        client = storage.Client(credentials=credentials, project=credentials.project_id)
-        logging.info("Google Cloud Storage client initialized successfully.")
-        return client
+        gcs_bucket = get_gcs_bucket()
     except Exception as e:
         logging.error(f"Failed to initialize GCS client: {e}")
         st.error(f"⚠️ Failed to initialize Google Cloud Storage client: {e}")
         return None
 
-# Define bucket name
-GCS_BUCKET_NAME = "pdf-highlighter-upload"  # Your bucket name
-gcs_client = initialize_gcs_client()
-if gcs_client:
-    bucket = gcs_client.bucket(GCS_BUCKET_NAME)
-    if not bucket.exists():
-        st.error(f"⚠️ The bucket '{GCS_BUCKET_NAME}' does not exist.")
-        logging.error(f"The bucket '{GCS_BUCKET_NAME}' does not exist.")
+    bucket_check = check_bucket_in_background(gcs_bucket)
+    if bucket_check.done():
+        if bucket_check.exception() is not None:
+            st.error(f"⚠️ Failed to check the bucket '{GCS_BUCKET_NAME}': {bucket_check.exception()}")
+        elif not bucket_check.result():
+            st.error(f"⚠️ The bucket '{GCS_BUCKET_NAME}' does not exist.")
+    return gcs_bucket
+
+bucket = None if LOCAL_STORAGE_DIR else initialize_gcs_bucket()
+
+# -------------------------------
+# Background Uploads
+# -------------------------------
+UPLOAD_WORKERS = 4
+UPLOAD_MAX_PENDING = 32  # Queued uploads beyond this make processing wait
+UPLOAD_WAIT_SECONDS = 120  # How long a signed URL waits for its upload to finish
+
+@st.cache_resource
+def get_upload_queue():
+    """
+    Return the process-wide background upload queue, or None if no storage is available.
+    """
+    if LOCAL_STORAGE_DIR:
+        storage_backend = LocalStorage(LOCAL_STORAGE_DIR)
+    elif bucket is not None:
+        storage_backend = GCSStorage(bucket)
     else:
-        logging.info(f"Connected to GCS bucket: {GCS_BUCKET_NAME}")
+        return None
+    return UploadQueue(storage_backend, max_workers=UPLOAD_WORKERS, max_pending=UPLOAD_MAX_PENDING)
+
+upload_queue = get_upload_queue()
+
+# Signed URLs are reused across reruns and sessions until they are about to expire
+SIGNED_URL_SECONDS = 3600
+SIGNED_URL_REFRESH_SECONDS = 600  # A link shown is valid for at least this long
+# Results at least this large are downloaded straight from storage instead of through the app
+DIRECT_DOWNLOAD_MIN_BYTES = 20 * 1024 ** 2
+
+@st.cache_resource
+def get_signed_url_cache():
+    """
+    Return the process-wide signed URL cache, or None if no storage is available.
+    """
+    if upload_queue is None:
+        return None
+    return SignedUrlCache(upload_queue.storage.signed_url, expiration=SIGNED_URL_SECONDS,
+                          refresh_margin=SIGNED_URL_REFRESH_SECONDS)
+
+signed_url_cache = get_signed_url_cache()
 
 # -------------------------------
 # Configure Logging
@@ -92,57 +182,142 @@ logging.basicConfig(
     filename='app.log',
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
+# Per-file, per-batch and per-upload metrics, one JSON record per line
+configure_metrics_log('metrics.jsonl')
 
 # -------------------------------
-# Define Preset and General Keywords
+# Result Storage
 # -------------------------------
-PRESET_KEYWORDS = {
-    "VIC": ["VPA", "Victorian Planning Authority", "VPP", "Victorian Planning Provision"],
-    "QLD": ["Shire Planning", "City Planning"],
-    "WA": ["Metropolitan Region Scheme", "Rural Living Zone"],
-    "NSW": ["Urban Renewal Areas"],
-}
+RESULT_STORE_MAX_BYTES = 20 * 1024 ** 3  # Total disk budget for results across all sessions
+RESULT_STORE_TTL_SECONDS = 6 * 3600  # Results not accessed for this long are deleted
+
+@st.cache_resource
+def get_result_store():
+    """
+    Return the process-wide store for highlighted PDFs and reports.
+    """
+    return ResultStore(max_bytes=RESULT_STORE_MAX_BYTES, ttl_seconds=RESULT_STORE_TTL_SECONDS)
+
+result_store = get_result_store()
+
+# Persistent cache of results keyed by PDF content, keyword set and highlighter version
+RESULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdf_highlighter", "results")
+RESULT_CACHE_MAX_BYTES = 50 * 1024 ** 3
+
+@st.cache_resource
+def get_result_cache():
+    """
+    Return the process-wide result cache.
+    """
+    return ResultCache(LocalDirectoryBackend(RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES))
 
-GENERAL_KEYWORDS = [
-    "Activity Centre", "Amendment", "Amendments Report", "Annual Plan", "Annual Report",
-    "Area Plan", "Assessments", "Broadacre", "Budget", "City Plan", "Code Amendment",
-    "Concept Plan", "Corporate Business Plan", "Corporate Plan", "Council Action Plan",
-    "Council Business Plan", "Council Plan", "Council Report", 
-    "Development Investigation Area", "Development Plan", "Development Plan Amendment",
-    "DPA", "Emerging community", "Employment land study", "Exhibition", "expansion",
-    "Framework", "Framework plan", "Gateway Determination", "greenfield", "growth area", 
-    "growth plan", "growth plans", "housing", "Housing Strategy",
-    "Industrial land study", "infrastructure plan", "infrastructure planning", 
-    "Inquiries", "Investigation area", "land use", "Land use strategy",
-    "LDP", "Local Area Plan", "Local Development Area", "Local Development Plan",
-    "Local Environmental Plan", "Local Planning Policy", "Local Planning Scheme",
-    "Local Planning Strategy", "Local Strategic Planning Statement", "LPP", "LPS", "LSPS",
-    "Major Amendment", "Major Update", "Master Plan", "Masterplan", "Neighbourhood Plan",
-    "Operational Plan", "Planning Commission", "Planning Framework", "Planning Investigation Area",
-    "Planning proposal", "Planning report", "Planning Scheme", "Planning Scheme Amendment",
-    "Planning Strategy", "Precinct plan", "Priority Development Area",
-    "Project Vision", "Rezoning", "settlement", "Strategy", "Structure Plan", "Structure Planning",
-    "Study", "Territory plan", "Town Planning Scheme",
-    "Township Plan", "TPS", "Urban Design Framework", "Urban growth", "Urban Release",
-    "Urban renewal", "Variation", "Vision", "VPA",
-    "Victorian Planning Authority", "VPP", "Victorian Planning Provision",
-    "Shire Planning", "City Planning",
-    "Metropolitan Region Scheme", "Rural Living Zone",
-    "Urban Renewal Areas",
-]
-
-# Combine all keywords for easy access
-ALL_KEYWORDS = {**PRESET_KEYWORDS, "General": GENERAL_KEYWORDS}
+result_cache = get_result_cache()
+
+# Per-document text and position index: new keyword selections on a known
+# document are answered without extracting its text again
+DOCUMENT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pdf_highlighter", "document_index.sqlite3")
+DOCUMENT_INDEX_MAX_DOCUMENTS = 1000
+
+@st.cache_resource
+def get_document_index():
+    """
+    Return the process-wide document index.
+    """
+    return DocumentIndex(DOCUMENT_INDEX_PATH, max_documents=DOCUMENT_INDEX_MAX_DOCUMENTS)
+
+document_index = get_document_index()
+
+# Per-page search results and text shared across documents: pages repeated in
+# many uploads (scheme extracts, maps, boilerplate) are extracted only once
+PAGE_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "pdf_highlighter", "page_cache.sqlite3")
+PAGE_CACHE_MAX_PAGES = 200000
+
+@st.cache_resource
+def get_page_cache():
+    """
+    Return the process-wide page cache.
+    """
+    return PageCache(PAGE_CACHE_PATH, max_pages=PAGE_CACHE_MAX_PAGES)
+
+page_cache = get_page_cache()
+
+# Damaged PDFs are repaired in a separate, resource-limited process, and the
+# repaired copies are kept by content hash so a file is repaired only once
+REPAIR_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdf_highlighter", "repaired")
+REPAIR_LIMITS = ResourceLimits(cpu_seconds=120, memory_bytes=4 * 1024 ** 3, wall_seconds=180)
+# CPU time and address space of the worker process of each queued file
+JOB_LIMITS = ResourceLimits(cpu_seconds=900, memory_bytes=8 * 1024 ** 3, wall_seconds=None)
+
+@st.cache_resource
+def get_pdf_repairer():
+    """
+    Return the process-wide PDF repairer.
+    """
+    return PdfRepairer(REPAIR_CACHE_DIR, limits=REPAIR_LIMITS)
+
+pdf_repairer = get_pdf_repairer()
+
+# Highlighting runs are queued jobs processed by a background worker pool; their
+# progress is kept on disk, so a job survives page reloads and resumes after a restart
+JOB_QUEUE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdf_highlighter", "jobs")
+JOB_POLL_SECONDS = 2  # How often the page refreshes the progress of a running job
+
+@st.cache_resource
+def get_job_queue():
+    """
+    Return the process-wide job queue; its dispatcher is started with the page.
+    """
+    return JobQueue(JOB_QUEUE_DIR, index_path=document_index.path, repair=pdf_repairer, limits=JOB_LIMITS,
+                    page_cache=page_cache)
+
+job_queue = get_job_queue()
+
+# Previews of the pages with hits are rendered in background processes and
+# kept in memory across sessions, so paging back and forth never re-renders
+PREVIEW_CACHE_MAX_BYTES = 256 * 1024 ** 2
+PREVIEWS_PER_SCREEN = 12
+PREVIEW_COLUMNS = 4
+
+@st.cache_resource
+def get_preview_renderer():
+    """
+    Return the process-wide preview renderer.
+    """
+    return PreviewRenderer(max_bytes=PREVIEW_CACHE_MAX_BYTES)
+
+preview_renderer = get_preview_renderer()
 
 # -------------------------------
 # Initialize Streamlit Session State
 # -------------------------------
+if 'result_session' not in st.session_state:
+    st.session_state.result_session = ResultSession(result_store)
 if 'updated_pdfs' not in st.session_state:
     st.session_state.updated_pdfs = {}
 if 'csv_reports' not in st.session_state:
     st.session_state.csv_reports = {}
+if 'hit_pages' not in st.session_state:
+    st.session_state.hit_pages = {}  # filename -> (page_num, output_page_num) of the pages with hits
+if 'preview_hashes' not in st.session_state:
+    st.session_state.preview_hashes = {}  # filename -> (path, content hash) of the previewed PDF
 if 'selected_keywords' not in st.session_state:
     st.session_state.selected_keywords = set()
+if 'scan_stats' not in st.session_state:
+    st.session_state.scan_stats = None
+if 'cache_stats' not in st.session_state:
+    st.session_state.cache_stats = {"hits": 0, "misses": 0}
+if 'bundles' not in st.session_state:
+    st.session_state.bundles = {}  # "pdfs"/"reports" -> (compression, ResultHandle) of the ZIP download
+if 'batch_report' not in st.session_state:
+    st.session_state.batch_report = None  # ResultHandle of the consolidated report of a multi-file run
+if 'uploads' not in st.session_state:
+    st.session_state.uploads = {}  # blob name -> Future of its background upload
+if 'direct_downloads' not in st.session_state:
+    st.session_state.direct_downloads = {}  # result path -> Future of its upload's (blob name, content hash)
+if 'run_metrics' not in st.session_state:
+    st.session_state.run_metrics = None  # {"batch": record, "files": [records], "profile": text} of the last run
+if 'run' not in st.session_state:
+    st.session_state.run = None  # The current or last run, see new_run
 
 # -------------------------------
 # Callback Functions
@@ -166,234 +341,175 @@ def toggle_state_callback(state):
     else:
         st.session_state.selected_keywords.difference_update(PRESET_KEYWORDS[state])
 
-def preprocess_pdf_with_pikepdf(input_stream):
-    """
-    Attempt to preprocess the PDF using pikepdf.
-    """
-    try:
-        pdf = pikepdf.open(input_stream)
-        output = io.BytesIO()
-        pdf.save(output)
-        pdf.close()
-        output.seek(0)
-        logging.info("Successfully preprocessed PDF with pikepdf.")
-        return output
-    except pikepdf.PdfError as e:
-        logging.error(f"pikepdf preprocessing failed: {e}")
-        st.error(f"⚠️ Failed to preprocess PDF with pikepdf: {e}")
-        return None
-
 # -------------------------------
 # Helper Functions
 # -------------------------------
 
-def is_valid_pdf(file):
+def open_uploaded_pdf(file_content, filename, stats=None):
     """
-    Validate if the uploaded file is a valid, unencrypted PDF.
+    Open an uploaded PDF once and validate it (readable, unencrypted).
+    Returns (pdf_document, source_bytes) for highlighting, or (None, None) if invalid.
+    The time spent opening it is added to stats, if given.
     """
-    try:
-        file.seek(0)
-        with fitz.open(stream=file.read(), filetype="pdf") as doc:
-            if doc.is_encrypted:
-                st.error(f"⚠️ {file.name} is encrypted. Please provide an unencrypted PDF.")
-                return False
-            return True
-    except Exception as e:
-        st.error(f"⚠️ {file.name} is not a valid PDF file. Error: {e}")
-        logging.error(f"Error validating PDF {file.name}: {e}")
-        return False
+    pdf_document, source_bytes = open_pdf_source(file_content, filename, notify=show_message, stats=stats,
+                                                 repair=pdf_repairer)
+    if pdf_document is None:
+        st.error(f"⚠️ {filename} is not a valid PDF file.")
+        return None, None
+    if not validate_pdf(pdf_document, filename, notify=show_message):
+        pdf_document.close()
+        return None, None
+    return pdf_document, source_bytes
 
 def upload_to_gcs(blob_name, file_data):
     """
-    Upload a file to Google Cloud Storage.
+    Queue a file (bytes, a BytesIO or a path) for upload to Google Cloud Storage.
+    The upload runs in the background; its Future is kept in the session state.
     """
-    if not gcs_client or not bucket:
+    if upload_queue is None:
         st.error("⚠️ Google Cloud Storage client is not initialized.")
         return None
+    future = upload_queue.submit(blob_name, file_data)
+    st.session_state.uploads[blob_name] = future
+    return future
+
+def wait_for_upload(blob_name):
+    """
+    Wait for this session's upload of a blob to finish.
+    Returns False if the upload failed or did not finish in time.
+    """
+    future = st.session_state.uploads.get(blob_name)
+    if future is None:
+        return True
     try:
-        blob = bucket.blob(blob_name)
-        blob.upload_from_file(file_data, rewind=True)
-        # blob.make_public()  # Removed to comply with UBLA
-        logging.info(f"Uploaded {blob_name} to GCS.")
-        return blob.public_url  # Note: This URL may not be publicly accessible
+        future.result(timeout=UPLOAD_WAIT_SECONDS)
+        return True
     except Exception as e:
-        logging.error(f"Failed to upload {blob_name} to GCS: {e}")
         st.error(f"⚠️ Failed to upload {blob_name} to Google Cloud Storage: {e}")
-        return None
+        return False
 
-def generate_signed_url(blob_name, expiration=3600):
+def report_upload_status():
     """
-    Generate a signed URL for a blob.
+    Show failures of finished background uploads and how many are still running.
+    """
+    for blob_name, future in list(st.session_state.uploads.items()):
+        if not future.done():
+            continue
+        del st.session_state.uploads[blob_name]
+        if future.exception() is not None:
+            st.error(f"⚠️ Failed to upload {blob_name} to Google Cloud Storage: {future.exception()}")
+    if st.session_state.uploads:
+        st.caption(f"☁️ {len(st.session_state.uploads)} uploads still running in the background.")
+
+def generate_signed_url(blob_name):
+    """
+    Return a signed URL for a blob, once its background upload has finished.
+    URLs come from the signed URL cache, keyed by blob name and the MD5 of the
+    uploaded content, and are only signed again when close to expiring.
     :param blob_name: Name of the blob in GCS.
-    :param expiration: Time in seconds for the URL to remain valid.
     :return: Signed URL as a string.
     """
-    if not gcs_client or not bucket:
+    if upload_queue is None:
         st.error("⚠️ Google Cloud Storage client is not initialized.")
         return None
+    if not wait_for_upload(blob_name):
+        return None
     try:
-        blob = bucket.blob(blob_name)
-        url = blob.generate_signed_url(expiration=expiration)
-        logging.info(f"Generated signed URL for {blob_name}: {url}")
-        return url
+        return signed_url_cache.get(blob_name, upload_queue.uploaded_md5(blob_name))
     except Exception as e:
         logging.error(f"Failed to generate signed URL for {blob_name}: {e}")
         st.error(f"⚠️ Failed to generate signed URL for {blob_name}: {e}")
         return None
 
-def highlight_text_in_pdf(file_content, selected_keywords, original_filename):
+def direct_download_url(path, file_name):
     """
-    Highlight selected keywords in the PDF and return the updated PDF and keyword occurrences.
-    Includes preprocessing steps for corrupted or complex PDFs.
-    Also uploads original and processed PDFs to GCS.
+    Return a signed URL of a copy of a large stored result in cloud storage, or
+    None if it should go through the app instead: it is small, no storage is
+    available, or its upload is still running or failed. Never waits, so reruns
+    stay fast. The copy is uploaded on the first call, named by its content
+    hash so that other sessions never overwrite it; the hash is computed by
+    the upload in the background.
     """
-    # Attempt to open the PDF with PyMuPDF
-    try:
-        pdf_file = io.BytesIO(file_content)
-        pdf_document = fitz.open(stream=pdf_file, filetype="pdf")
-    except fitz.fitz.FileDataError as e:
-        st.warning(f"⚠️ {original_filename} has structural issues. Attempting to preprocess with pikepdf...")
-        logging.warning(f"{original_filename} has structural issues: {e}")
-
-        # Attempt preprocessing with pikepdf
-        preprocessed_pdf = preprocess_pdf_with_pikepdf(io.BytesIO(file_content))
-        
-        if preprocessed_pdf:
-            try:
-                pdf_document = fitz.open(stream=preprocessed_pdf, filetype="pdf")
-                st.success(f"✅ Successfully preprocessed {original_filename} with pikepdf.")
-            except Exception as e:
-                st.error(f"⚠️ Failed to process {original_filename} even after preprocessing. Error: {e}")
-                logging.error(f"Failed to open preprocessed PDF with pikepdf for {original_filename}: {e}")
-                return None, None
-        else:
-            st.error(f"⚠️ Failed to preprocess {original_filename} with pikepdf.")
-            return None, None
-
-    except Exception as e:
-        st.error(f"⚠️ An unexpected error occurred while opening {original_filename}: {e}")
-        logging.error(f"Unexpected error opening {original_filename}: {e}")
-        return None, None
-
-    # Upload original PDF to GCS
-    original_blob_name = f"original_pdfs/{original_filename}"
-    original_pdf_stream = io.BytesIO(file_content)
-    original_pdf_stream.seek(0)
-    original_pdf_url = upload_to_gcs(original_blob_name, original_pdf_stream)
-    if original_pdf_url:
-        logging.info(f"Original PDF uploaded to GCS: {original_pdf_url}")
-
-    # Initialize keyword_occurrences with all selected keywords
-    keyword_occurrences = {keyword: [] for keyword in selected_keywords}
-    keywords_found = False
-
-    for page_num in range(len(pdf_document)):
-        page = pdf_document.load_page(page_num)
-        text = page.get_text("dict")
-
-        for keyword in selected_keywords:
-            keyword_lower = keyword.lower()
-
-            for block in text["blocks"]:
-                if block["type"] == 0:  # Block is text
-                    for line in block["lines"]:
-                        for span in line["spans"]:
-                            text_content = span["text"]
-                            lower_text = text_content.lower()
-
-                            start = 0
-                            while True:
-                                start = lower_text.find(keyword_lower, start)
-                                if start == -1:
-                                    break
-
-                                # Track page number for each keyword occurrence
-                                if (page_num + 1) not in keyword_occurrences[keyword]:
-                                    keyword_occurrences[keyword].append(page_num + 1)
-                                    keywords_found = True  # At least one keyword found
-
-                                # Highlight the keyword in the PDF
-                                bbox = span["bbox"]
-                                span_width = bbox[2] - bbox[0]
-                                span_height = bbox[3] - bbox[1]
-                                char_width = span_width / len(text_content) if len(text_content) > 0 else 1
-
-                                keyword_bbox = fitz.Rect(
-                                    bbox[0] + char_width * start,
-                                    bbox[1],
-                                    bbox[0] + char_width * (start + len(keyword)),
-                                    bbox[3]
-                                )
-                                
-                                keyword_bbox = keyword_bbox.intersect(fitz.Rect(0, 0, page.rect.width, page.rect.height))
-                                
-                                if not keyword_bbox.is_empty:
-                                    highlight = page.add_highlight_annot(keyword_bbox)
-                                    highlight.set_colors(stroke=(1, 0.65, 0))  # Set color to orange
-                                    highlight.update()
-
-                                start += len(keyword)
-
-    # Save the highlighted PDF
-    output_pdf = BytesIO()
+    if signed_url_cache is None or os.path.getsize(path) < DIRECT_DOWNLOAD_MIN_BYTES:
+        return None
+    future = st.session_state.direct_downloads.get(path)
+    if future is None:
+        future = upload_queue.submit_by_content(lambda file_hash: f"downloads/{file_hash}/{file_name}", path)
+        st.session_state.direct_downloads[path] = future
+    if not future.done() or future.exception() is not None:
+        return None
+    blob_name, file_hash = future.result()
     try:
-        pdf_document.save(output_pdf)
-        output_pdf.seek(0)
+        return signed_url_cache.get(blob_name, file_hash)
     except Exception as e:
-        st.error(f"⚠️ Failed to save highlighted PDF for {original_filename}: {e}")
-        logging.error(f"Failed to save highlighted PDF for {original_filename}: {e}")
-        return None, None
-    finally:
-        pdf_document.close()
-
-    # Upload processed PDF to GCS
-    processed_blob_name = f"processed_pdfs/highlighted_{original_filename}"
-    processed_pdf_stream = BytesIO(output_pdf.getvalue())
-    processed_pdf_stream.seek(0)
-    processed_pdf_url = upload_to_gcs(processed_blob_name, processed_pdf_stream)
-    if processed_pdf_url:
-        logging.info(f"Processed PDF uploaded to GCS: {processed_pdf_url}")
+        logging.error(f"Failed to generate signed URL for {blob_name}: {e}")
+        return None
 
-    if not keywords_found:
-        return output_pdf, None  # Return the updated PDF even if no keywords are found
+def download_result(handle, label, file_name, mime, key=None):
+    """
+    Offer a stored result for download: as a signed link straight from cloud
+    storage if it is large and uploaded (see direct_download_url), otherwise
+    as a download button served by the app.
+    """
+    path = result_store.path(handle)
+    url = direct_download_url(path, file_name) if path is not None else None
+    if url:
+        st.markdown(f"🔗 [{label}](<{url}>)")
+        return
+    with result_store.open(handle) as result_file:
+        st.download_button(label=label, data=result_file, file_name=file_name, mime=mime, key=key)
+
+def show_message(level, message):
+    """
+    Display a message from the highlighting core on the Streamlit page.
+    """
+    {"info": st.info, "success": st.success, "warning": st.warning, "error": st.error}[level](message)
 
-    return output_pdf, keyword_occurrences
+def upload_highlight_results(original_filename, file_content, updated_pdf):
+    """
+    Queue the original and processed PDFs for upload to GCS.
+    updated_pdf may be a BytesIO or the path of the highlighted PDF.
+    Unchanged objects already in the bucket are not transferred again.
+    """
+    upload_to_gcs(f"original_pdfs/{original_filename}", file_content)
+    upload_to_gcs(f"processed_pdfs/highlighted_{original_filename}", updated_pdf)
 
-def generate_csv_report(keyword_occurrences, original_filename):
+def highlight_and_upload(pdf_document, source_bytes, file_content, selected_keywords, original_filename,
+                         scan_stats=None, max_workers=1, doc_hash=None, save_mode=SAVE_FULL, page_hits=None,
+                         stats=None):
+    """
+    Highlight selected keywords in an opened PDF, then upload the original and processed PDFs to GCS.
+    With more than one worker, the pages are searched in parallel shards.
+    The document index is used for the document with content hash doc_hash, and the page cache for its pages.
+    Report rows are appended to page_hits, and this file's statistics recorded in stats, if given.
+    """
+    if max_workers > 1:
+        updated_pdf, keyword_occurrences = highlight_document_sharded(
+            pdf_document, source_bytes, selected_keywords, original_filename,
+            max_workers=max_workers, scan_stats=scan_stats, notify=show_message,
+            document_index=document_index, doc_hash=doc_hash, save_mode=save_mode, page_hits=page_hits,
+            stats=stats, page_cache=page_cache
+        )
+    else:
+        updated_pdf, keyword_occurrences = highlight_document(
+            pdf_document, selected_keywords, original_filename,
+            scan_stats=scan_stats, notify=show_message,
+            document_index=document_index, doc_hash=doc_hash, save_mode=save_mode, page_hits=page_hits,
+            stats=stats, page_cache=page_cache
+        )
+    if updated_pdf:
+        upload_highlight_results(original_filename, file_content, updated_pdf)
+    return updated_pdf, keyword_occurrences
+
+def generate_and_upload_report(keyword_occurrences, original_filename):
     """
     Generate a CSV report from keyword occurrences.
     Also uploads the report to GCS.
     """
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Keywords Report"
-
-    # Write header
-    ws.append(["Keyword", "Occurrences (Page Numbers)"])
-
-    # Write keyword occurrences
-    for keyword, pages in keyword_occurrences.items():
-        if pages:
-            ws.append([keyword, ", ".join(map(str, pages))])
-
-    # Auto-size columns
-    for column_cells in ws.columns:
-        length = max(len(str(cell.value)) for cell in column_cells)
-        ws.column_dimensions[column_cells[0].column_letter].width = length + 2
-
-    # Save to BytesIO
-    excel_output = BytesIO()
-    wb.save(excel_output)
-    excel_output.seek(0)
-
-    # Upload CSV report to GCS
-    report_filename = f"keywords_report_{original_filename.replace('.pdf', '.xlsx')}"
-    report_blob_name = f"reports/{report_filename}"
-    report_stream = BytesIO(excel_output.getvalue())
-    report_stream.seek(0)
-    report_url = upload_to_gcs(report_blob_name, report_stream)
-    if report_url:
-        logging.info(f"CSV report uploaded to GCS: {report_url}")
+    excel_output = generate_csv_report(keyword_occurrences)
+
+    # Upload CSV report to GCS in the background
+    upload_to_gcs(f"reports/{report_filename(original_filename)}", excel_output)
 
     return excel_output
 
@@ -414,9 +530,256 @@ def hide_file_uploader_instructions():
                 """
     st.markdown(hide_ui, unsafe_allow_html=True)
 
+# -------------------------------
+# Background Jobs
+# -------------------------------
+def new_run(job_id, generate_csv, zip_compression, total_files, cache_keys=None, selected_keywords=(),
+            save_mode=SAVE_FULL):
+    """
+    Start the bookkeeping of a run: the ZIP bundles and batch report its results
+    are streamed into, the files of its job already collected, and its messages.
+    job_id is None for a run processed in the script thread. cache_keys maps
+    filenames to the (result cache key, content hash) their results are stored under.
+    """
+    # "Download All" ZIPs are streamed to disk as each result is stored
+    bundles = {}
+    if total_files > 1:
+        bundles["pdfs"] = ZipBundle(result_store.root, zip_compression)
+        if generate_csv:
+            bundles["reports"] = ZipBundle(result_store.root, zip_compression)
+
+    # The consolidated report of a multi-file run gets its rows as each file finishes
+    batch_report = None
+    if generate_csv and total_files > 1:
+        batch_report = BatchReportWriter(new_result_path("batch_report_", ".xlsx"))
+
+    return {
+        "job_id": job_id,
+        "generate_csv": generate_csv,
+        "total_files": total_files,
+        "cache_keys": cache_keys or {},  # filename -> (result cache key, content hash)
+        "selected_keywords": set(selected_keywords),
+        "save_mode": save_mode,
+        "collected": set(),  # Positions of the job files already stored
+        "messages": [],  # (level, message) pairs, shown until the next run
+        "bundles": bundles,
+        "batch_report": batch_report,
+        "started": time.perf_counter(),
+        "finished": False,
+    }
+
+def run_notify(run):
+    """
+    Return a notify callback keeping messages with the run, so they survive page refreshes.
+    """
+    return lambda level, message: run["messages"].append((level, message))
+
+def store_result(run, filename, updated_pdf, keyword_occurrences, page_hits, stats, cached=False):
+    """
+    Keep a file's highlighted PDF and reports for download and log its metrics.
+    """
+    try:
+        store_outputs(run, filename, updated_pdf, keyword_occurrences, page_hits, stats)
+    finally:
+        st.session_state.run_metrics["files"].append(
+            log_metrics("file", filename, stats, cached=cached, processed=bool(updated_pdf))
+        )
+
+def store_outputs(run, filename, updated_pdf, keyword_occurrences, page_hits, stats):
+    notify = run_notify(run)
+    if not updated_pdf:
+        notify("warning", f"⚠️ {filename} could not be processed.")
+        return
+    report_start = time.perf_counter()
+    if run["batch_report"] is not None:
+        run["batch_report"].add_file(filename, page_hits)
+    record_report_time(stats, report_start)
+
+    # Store the updated PDF on disk, even if no keywords are found;
+    # the session state only keeps a handle to it
+    session_id = st.session_state.result_session.session_id
+    st.session_state.updated_pdfs[filename] = result_store.put(session_id, filename, updated_pdf)
+    st.session_state.hit_pages[filename] = hit_pages(keyword_occurrences,
+                                                     excerpt=run["save_mode"] == SAVE_EXCERPT)
+    if "pdfs" in run["bundles"]:
+        run["bundles"]["pdfs"].add(f"highlighted_{filename}", updated_pdf)
+
+    if not keyword_occurrences:
+        notify("warning", f"No keywords found in **{filename}**.")
+        return
+
+    # Generate CSV report if checkbox is selected
+    if run["generate_csv"]:
+        report_start = time.perf_counter()
+        csv_report = generate_and_upload_report(keyword_occurrences, filename)
+        record_report_time(stats, report_start)
+        st.session_state.csv_reports[filename] = result_store.put(session_id, filename, csv_report)
+        if "reports" in run["bundles"]:
+            run["bundles"]["reports"].add(report_filename(filename), csv_report)
+
+def record_report_time(stats, report_start):
+    # The file's statistics were already merged into the run totals
+    elapsed = time.perf_counter() - report_start
+    stats["report_seconds"] += elapsed
+    st.session_state.scan_stats["report_seconds"] += elapsed
+
+def collect_job_results(run):
+    """
+    Store the results of the files of the run's job that finished since the last call.
+    """
+    notify = run_notify(run)
+    for job_file in job_queue.files(run["job_id"], finished_only=True):
+        if job_file.position in run["collected"]:
+            continue
+        run["collected"].add(job_file.position)
+        if job_file.state == FILE_CANCELLED:
+            continue
+        for level, message in job_file.messages:
+            notify(level, message)
+        merge_scan_stats(st.session_state.scan_stats, job_file.scan_stats)
+        if job_file.state != FILE_DONE:
+            if not job_file.messages:
+                notify("error", f"⚠️ Worker process failed on {job_file.filename}: {job_file.error}")
+            store_result(run, job_file.filename, None, None, None, job_file.scan_stats)
+            continue
+
+        if not job_file.cached:
+            upload_highlight_results(job_file.filename, job_file.input_path, job_file.output_path)
+            if job_file.filename in run["cache_keys"]:
+                key, file_hash = run["cache_keys"][job_file.filename]
+                with open(job_file.output_path, "rb") as output_pdf:
+                    result_cache.put(key, output_pdf, job_file.keyword_occurrences, job_file.page_hits,
+                                     selected_keywords=run["selected_keywords"], file_hash=file_hash,
+                                     save_mode=run["save_mode"])
+        with open(job_file.output_path, "rb") as output_pdf:
+            store_result(run, job_file.filename, output_pdf, job_file.keyword_occurrences, job_file.page_hits,
+                         job_file.scan_stats, cached=job_file.cached)
+
+def finish_run(run, wall_seconds):
+    """
+    Finish the run's ZIP bundles and batch report and log its batch metrics.
+    """
+    for kind, bundle in run["bundles"].items():
+        store_bundle(kind, bundle)
+    if run["batch_report"] is not None:
+        report_start = time.perf_counter()
+        store_batch_report(run["batch_report"])
+        st.session_state.scan_stats["report_seconds"] += time.perf_counter() - report_start
+
+    st.session_state.run_metrics["batch"] = log_metrics(
+        "batch", f"{run['total_files']} files", st.session_state.scan_stats,
+        files=run["total_files"], cache_hits=st.session_state.cache_stats["hits"],
+        wall_seconds=wall_seconds,
+    )
+    run["finished"] = True
+    if not st.session_state.updated_pdfs:
+        run_notify(run)("error", "⚠️ No valid PDF files to process.")
+
+def resume_run_from_url():
+    """
+    Pick up the job named in the URL when the page was reloaded and the session state is new.
+    Its finished files are collected again from the job queue.
+    """
+    job_id = st.query_params.get("job")
+    if not job_id or st.session_state.run is not None:
+        return
+    status = job_queue.status(job_id)
+    if status is None:
+        # The job expired from the queue
+        del st.query_params["job"]
+        return
+    st.session_state.scan_stats = new_scan_stats()
+    st.session_state.run_metrics = {"batch": None, "files": [], "profile": None}
+    st.session_state.run = new_run(job_id, st.query_params.get("csv") == "1",
+                                   st.session_state.get("zip_compression", "stored"), status.files_total)
+
+JOB_STATE_LABELS = {
+    FILE_PENDING: "⏳ Waiting",
+    FILE_RUNNING: "⚙️ Processing",
+    FILE_DONE: "✅ Done",
+    FILE_FAILED: "⚠️ Failed",
+    FILE_CANCELLED: "Cancelled",
+}
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(run):
+    """
+    Poll the run's job: store newly finished files, show per-file and per-page
+    progress and offer the finished files for download. The whole page is rerun
+    once the job is done.
+    """
+    status = job_queue.status(run["job_id"])
+    collect_job_results(run)
+    files = job_queue.files(run["job_id"])
+    if status is None:
+        st.error("⚠️ The processing job is no longer available. Please run the highlighter again.")
+        st.session_state.run = None
+        return
+
+    # Files in progress count by the share of their pages already searched
+    finished = status.files_done + status.files_failed
+    partial = sum(f.pages_done / f.pages_total for f in files if f.state == FILE_RUNNING and f.pages_total)
+    st.progress(
+        min(1.0, (finished + partial) / max(1, status.files_total)),
+        text=f"Finished {finished} of {status.files_total} files — {status.pages_done} pages searched",
+    )
+    st.dataframe(
+        [
+            {
+                "File": f.filename,
+                "Status": JOB_STATE_LABELS[f.state],
+                "Pages": f"{f.pages_done} / {f.pages_total}" if f.pages_total else "",
+            }
+            for f in files
+        ],
+        hide_index=True,
+    )
+    for level, message in run["messages"]:
+        show_message(level, message)
+
+    # Finished files can be downloaded while the rest of the job runs
+    for filename, handle in st.session_state.updated_pdfs.items():
+        with result_store.open(handle) as pdf_file:
+            st.download_button(
+                label=f"📄 Download {filename}",
+                data=pdf_file,
+                file_name=f"highlighted_{filename}",
+                mime="application/pdf",
+                key=f"job_download_{filename}"
+            )
+
+    if status.state in (JOB_DONE, JOB_CANCELLED):
+        finish_run(run, time.time() - status.created)
+        st.rerun()
+
+def run_section():
+    """
+    Show the progress of a queued run, or the messages of a finished one.
+    """
+    run = st.session_state.run
+    if run is None:
+        return
+    if not run["finished"]:
+        job_progress(run)
+        return
+    for level, message in run["messages"]:
+        show_message(level, message)
+
 # -------------------------------
 # Main Tool Interface
 # -------------------------------
+ZIP_COMPRESSION_LABELS = {
+    "stored": "Stored (fastest)",
+    "deflated": "Deflated (smaller, slower to build)",
+}
+
+SAVE_MODE_LABELS = {
+    SAVE_FULL: "Full document",
+    SAVE_INCREMENTAL: "Full document, fast save (appends highlights to the original)",
+    SAVE_COMPACT: "Full document, compressed for archiving (slower save)",
+    SAVE_EXCERPT: "Excerpt: only pages with hits",
+}
+
 def keyword_highlighter_page():
     st.title("📄 PDF Keyword Highlighter")
 
@@ -504,140 +867,423 @@ def keyword_highlighter_page():
         # Add a checkbox for optional CSV report
         generate_csv = st.checkbox("📊 Generate CSV Report", value=False, key="generate_csv_report")
 
+        # Number of worker processes used to highlight a batch in parallel
+        max_workers = st.number_input(
+            "⚙️ Parallel workers",
+            min_value=1,
+            max_value=default_worker_count(),
+            value=default_worker_count(),
+            step=1,
+            key="max_workers",
+            help="With more than one worker, a batch is split across processes by file and a single file by page range."
+        )
+
+        # Output format of the highlighted PDFs
+        save_mode = st.selectbox(
+            "💾 Output",
+            options=list(SAVE_MODE_LABELS),
+            format_func=SAVE_MODE_LABELS.get,
+            key="save_mode",
+        )
+
+        # Compression of the "Download All" ZIP bundles
+        zip_compression = st.selectbox(
+            "🗜️ ZIP downloads",
+            options=list(ZIP_COMPRESSION_LABELS),
+            format_func=ZIP_COMPRESSION_LABELS.get,
+            key="zip_compression",
+        )
+
+        # Opt-in cProfile run, shown under "Performance details"
+        profile_run = st.checkbox(
+            "🔬 Profile the run (single file only)",
+            value=False,
+            key="profile_run",
+            help="Runs the highlighter under cProfile and lists the slowest functions. Adds some overhead."
+        )
+
         if st.button("🚀 Highlight Keywords"):
             if not st.session_state.selected_keywords:
                 st.error("⚠️ Please select or add at least one keyword.")
             else:
-                # Validate uploaded files
-                valid_files = []
-                for file in uploaded_files:
-                    # Reset the file pointer before validation
-                    file.seek(0)
-                    if is_valid_pdf(file):
-                        valid_files.append(file)
-                    else:
-                        st.error(f"⚠️ {file.name} is not a valid PDF file.")
-                if not valid_files:
-                    st.error("⚠️ No valid PDF files to process.")
+                # Clear previous results; a previous run still in the queue is cancelled
+                if st.session_state.run is not None and st.session_state.run["job_id"]:
+                    job_queue.cancel(st.session_state.run["job_id"])
+                discard_bundles()
+                discard_batch_report()
+                for handle in [*st.session_state.updated_pdfs.values(), *st.session_state.csv_reports.values()]:
+                    result_store.discard(handle)
+                st.session_state.updated_pdfs = {}
+                st.session_state.hit_pages = {}
+                st.session_state.direct_downloads = {}
+                st.session_state.csv_reports = {}
+                st.session_state.scan_stats = new_scan_stats()
+                st.session_state.cache_stats = {"hits": 0, "misses": 0}
+                st.session_state.run_metrics = {"batch": None, "files": [], "profile": None}
+                st.session_state.run = None
+                selected_keywords = set(st.session_state.selected_keywords)
+
+                # getvalue() shares the uploaded buffer rather than copying it
+                original_contents = {}
+                for uploaded_file in uploaded_files:
+                    file_content = uploaded_file.getvalue()
+                    if not file_content:
+                        st.error(f"⚠️ {uploaded_file.name} is empty after reading.")
+                        continue
+                    original_contents[uploaded_file.name] = file_content
+
+                profiling = profile_run and len(original_contents) == 1
+                if profile_run and not profiling:
+                    st.warning("⚠️ Profiling is only available for a single file; processing without it.")
+
+                if profiling:
+                    # Profiled runs stay in this process, so the profiler sees the highlighting
+                    run = new_run(None, generate_csv, zip_compression, 1)
+                    st.session_state.run = run
+                    (filename, file_content), = original_contents.items()
+                    file_stats = new_scan_stats()
+                    with st.spinner(f"Processing {filename} under the profiler..."):
+                        pdf_document, source_bytes = open_uploaded_pdf(file_content, filename, stats=file_stats)
+                        updated_pdf = keyword_occurrences = None
+                        page_hits = []
+                        if pdf_document is None:
+                            merge_scan_stats(st.session_state.scan_stats, file_stats)
+                        else:
+                            (updated_pdf, keyword_occurrences), profiler = profile_call(
+                                highlight_and_upload, pdf_document, source_bytes, file_content, selected_keywords,
+                                filename, scan_stats=st.session_state.scan_stats, max_workers=1,
+                                doc_hash=content_hash(file_content), save_mode=save_mode, page_hits=page_hits,
+                                stats=file_stats
+                            )
+                            st.session_state.run_metrics["profile"] = profile_summary(profiler)
+                        store_result(run, filename, updated_pdf, keyword_occurrences, page_hits, file_stats)
+                    finish_run(run, time.perf_counter() - run["started"])
                 else:
-                    # Clear previous results
-                    st.session_state.updated_pdfs = {}
-                    st.session_state.csv_reports = {}
-                    
-                    total_files = len(valid_files)
-                    progress_bar = st.progress(0)
-                    status_text = st.empty()
-                    
-                    for idx, uploaded_file in enumerate(valid_files):
-                        # Reset the file pointer before reading
-                        uploaded_file.seek(0)
-                        
-                        # Read the file content once
-                        file_content = uploaded_file.read()
-                        if not file_content:
-                            st.error(f"⚠️ {uploaded_file.name} is empty after reading.")
-                            continue
-                        
-                        # Update status text
-                        status_text.text(f"Processing file {idx + 1} of {total_files}: {uploaded_file.name}")
-                        
-                        # Process each PDF
-                        updated_pdf, keyword_occurrences = highlight_text_in_pdf(
-                            file_content, st.session_state.selected_keywords, uploaded_file.name
-                        )
-
-                        if not updated_pdf:
-                            st.warning(f"⚠️ {uploaded_file.name} could not be processed.")
+                    # Files already highlighted with the same keywords come straight from the result cache;
+                    # files highlighted before with other keywords are re-highlighted for the keywords
+                    # that changed, and the rest are highlighted by the background job queue
+                    cache_keys = {}
+                    completed = []
+                    pending_contents = {}
+                    previous = {}
+                    for filename, file_content in original_contents.items():
+                        file_hash = content_hash(file_content)
+                        key = cache_key(file_hash, selected_keywords, save_mode)
+                        cache_keys[filename] = (key, file_hash)
+                        cached = result_cache.get(key)
+                        if cached is None:
+                            st.session_state.cache_stats["misses"] += 1
+                            pending_contents[filename] = file_content
+                            latest = None
+                            if save_mode in DELTA_SAVE_MODES:
+                                latest = result_cache.latest(file_hash, save_mode)
+                            if latest is not None:
+                                previous[filename] = RehighlightSource(
+                                    None, file_hash, latest.pdf_path, latest.keywords, latest.keyword_occurrences,
+                                    latest.page_hits
+                                )
                             continue
+                        st.session_state.cache_stats["hits"] += 1
+                        result_cache.set_latest(key, file_hash, save_mode)
+                        upload_highlight_results(filename, file_content, cached.pdf_path)
+                        completed.append(FileResult(filename, None, cached.pdf_path, cached.keyword_occurrences,
+                                                    cached.page_hits, new_scan_stats(), [], None))
+
+                    if original_contents:
+                        job_id = job_queue.submit(pending_contents.items(), selected_keywords, save_mode=save_mode,
+                                                  max_workers=max_workers, completed=completed, previous=previous)
+                        run = new_run(job_id, generate_csv, zip_compression, len(original_contents), cache_keys,
+                                      selected_keywords, save_mode)
+                        st.session_state.run = run
+                        # The job ID in the URL lets a reloaded page pick the job up again
+                        st.query_params["job"] = job_id
+                        st.query_params["csv"] = "1" if generate_csv else "0"
+                    else:
+                        st.error("⚠️ No valid PDF files to process.")
 
-                        if not keyword_occurrences:
-                            st.warning(f"No keywords found in **{uploaded_file.name}**.")
-                            # Still store the PDF even if no keywords are found
-                            st.session_state.updated_pdfs[uploaded_file.name] = updated_pdf
-                            continue
+# -------------------------------
+# Download Section
+# -------------------------------
+def drop_expired_results():
+    """
+    Remove handles whose results were evicted from the result store.
+    """
+    result_store.evict()
+    expired = []
+    for results in (st.session_state.updated_pdfs, st.session_state.csv_reports):
+        for filename, handle in list(results.items()):
+            if result_store.path(handle) is None:
+                expired.append(filename)
+                del results[filename]
+    if expired:
+        # The bundles and the batch report no longer match the result set
+        discard_bundles()
+        discard_batch_report()
+        st.warning(f"⚠️ Results for {', '.join(sorted(set(expired)))} have expired. Please run the highlighter again.")
+    elif st.session_state.batch_report is not None and result_store.path(st.session_state.batch_report) is None:
+        st.session_state.batch_report = None
+
+def store_bundle(kind, bundle):
+    """
+    Finish a ZIP bundle and keep it in the result store for the download section.
+    """
+    path = bundle.close()
+    session_id = st.session_state.result_session.session_id
+    handle = result_store.put_file(session_id, f"{kind}.zip", path)
+    st.session_state.bundles[kind] = (bundle.compression, handle)
+    return handle
 
-                        # Store the updated PDF in session state
-                        st.session_state.updated_pdfs[uploaded_file.name] = updated_pdf
+def discard_bundles():
+    """
+    Delete this session's ZIP bundles; called whenever the result set changes.
+    """
+    for _, handle in st.session_state.bundles.values():
+        result_store.discard(handle)
+    st.session_state.bundles = {}
 
-                        # Generate CSV report if checkbox is selected
-                        if generate_csv:
-                            csv_report = generate_csv_report(keyword_occurrences, uploaded_file.name)
-                            st.session_state.csv_reports[uploaded_file.name] = csv_report
+def new_result_path(prefix, suffix):
+    """
+    Return the path of a new empty file in the result store directory.
+    """
+    fd, path = tempfile.mkstemp(dir=result_store.root, prefix=prefix, suffix=suffix)
+    os.close(fd)
+    return path
 
-                        # Update progress bar
-                        progress = (idx + 1) / total_files
-                        progress_bar.progress(progress)
+def store_batch_report(batch_report):
+    """
+    Finish the consolidated batch report and keep it in the result store for the download section.
+    """
+    path = batch_report.close()
+    session_id = st.session_state.result_session.session_id
+    st.session_state.batch_report = result_store.put_file(session_id, "batch_report.xlsx", path)
+
+def discard_batch_report():
+    """
+    Delete this session's batch report; called whenever the result set changes.
+    """
+    if st.session_state.batch_report is not None:
+        result_store.discard(st.session_state.batch_report)
+    st.session_state.batch_report = None
+
+def get_bundle(kind, results, arcname):
+    """
+    Return the handle of the ZIP bundle of results, building it only if it is
+    missing or was built with a different compression.
+    :param results: Mapping of filename to ResultHandle.
+    :param arcname: Function giving the name inside the ZIP for a filename.
+    """
+    compression = st.session_state.get("zip_compression", "stored")
+    cached = st.session_state.bundles.get(kind)
+    if cached and cached[0] == compression and result_store.path(cached[1]) is not None:
+        return cached[1]
+    if cached:
+        result_store.discard(cached[1])
+
+    with ZipBundle(result_store.root, compression) as bundle:
+        for filename, handle in results.items():
+            bundle.add(arcname(filename), result_store.path(handle))
+        return store_bundle(kind, bundle)
+
+STAGE_LABELS = {
+    "open_seconds": "Open (including repair)",
+    "repair_seconds": "Repair with pikepdf",
+    "page_cache_seconds": "Page cache lookups",
+    "prefilter_seconds": "Page pre-filter",
+    "extraction_seconds": "Text extraction",
+    "matching_seconds": "Keyword matching",
+    "annotate_seconds": "Annotation",
+    "save_seconds": "Save",
+    "report_seconds": "Reports",
+}
+
+def performance_details(run_metrics):
+    """
+    Show the stage timings, counters and optional profile of the last run in an expander.
+    """
+    batch = run_metrics["batch"]
+    with st.expander("⏱️ Performance details", expanded=False):
+        st.write(
+            f"**Run:** {batch['files']} files in {batch['wall_seconds']:.2f}s — {batch['pages']} pages, "
+            f"{batch['hits']} hits, {batch['annotations']} annotations, "
+            f"peak memory {batch['peak_memory_bytes'] / (1024 * 1024):.0f} MB"
+        )
+        st.table([
+            {"Stage": label, "Seconds": f"{batch[key]:.3f}"}
+            for key, label in STAGE_LABELS.items()
+        ])
+        if upload_queue is not None:
+            st.write(
+                f"**Uploads (since server start):** {upload_queue.uploaded_count} uploaded, "
+                f"{upload_queue.skipped_count} skipped, {upload_queue.uploaded_bytes / (1024 * 1024):.1f} MB "
+                f"in {upload_queue.upload_seconds:.1f}s of background time"
+            )
+        if signed_url_cache is not None:
+            st.write(
+                f"**Signed URLs (since server start):** {signed_url_cache.signed} signed "
+                f"in {signed_url_cache.sign_seconds:.2f}s, {signed_url_cache.hits} reused"
+            )
+        if run_metrics["files"]:
+            st.write("**Per file:**")
+            st.dataframe(run_metrics["files"], hide_index=True)
+        if run_metrics["profile"]:
+            st.write("**Profile (cumulative time):**")
+            st.code(run_metrics["profile"], language=None)
 
-# -------------------------------
-# Download Section
-# -------------------------------
 def download_section():
+    if st.session_state.run is not None and not st.session_state.run["finished"]:
+        # Finished files of a running job are offered in the progress section
+        return
+    drop_expired_results()
     if st.session_state.updated_pdfs:
         st.success("✅ Processing complete!")
+
+        # Page pre-filter summary
+        stats = st.session_state.scan_stats
+        if stats and stats["pages"]:
+            st.write(
+                f"📑 **Pages scanned:** {stats['pages']} — {stats['pages_with_hits']} with hits, "
+                f"{stats['pages_skipped']} skipped (no keywords), "
+                f"{stats['pages_without_text']} without a text layer. "
+                f"Estimated time saved: {estimate_seconds_saved(stats):.1f}s"
+            )
+            hit_rate = page_cache_hit_rate(stats)
+            if hit_rate is not None:
+                st.write(
+                    f"🧩 **Page cache:** {stats['page_cache_hits']} of "
+                    f"{stats['page_cache_hits'] + stats['page_cache_misses']} pages seen before ({hit_rate:.0%} hit rate)"
+                )
+            st.write(
+                f"💾 **Output:** {stats['output_bytes'] / (1024 * 1024):.1f} MB written "
+                f"in {stats['save_seconds']:.1f}s"
+            )
+
+        # Result cache summary
+        cache_stats = st.session_state.cache_stats
+        st.write(
+            f"🗄️ **Result cache:** {cache_stats['hits']} hits, {cache_stats['misses']} misses this run "
+            f"({result_cache.hits} hits, {result_cache.misses} misses since server start)"
+        )
+
+        # Background upload failures and progress
+        report_upload_status()
+
+        if st.session_state.run_metrics and st.session_state.run_metrics["batch"]:
+            performance_details(st.session_state.run_metrics)
+
         num_pdfs = len(st.session_state.updated_pdfs)
         
         if num_pdfs > 1:
             # More than one PDF, provide "Download All PDFs as ZIP"
             st.write("📥 **Download All Updated PDFs:**")
-            # Create a zip file of all updated PDFs
-            zip_buffer = BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-                for filename, pdf in st.session_state.updated_pdfs.items():
-                    zip_file.writestr(f"highlighted_{filename}", pdf.getvalue())
-            zip_buffer.seek(0)
-            st.download_button(
-                label="📄 Download All PDFs as ZIP",
-                data=zip_buffer,
-                file_name="highlighted_pdfs.zip",
-                mime="application/zip",
-                key="download_all_pdfs"
+            # The ZIP is built once per result set and served from disk
+            bundle_handle = get_bundle(
+                "pdfs", st.session_state.updated_pdfs, lambda filename: f"highlighted_{filename}"
             )
+            download_result(bundle_handle, "📄 Download All PDFs as ZIP", "highlighted_pdfs.zip", "application/zip",
+                            key="download_all_pdfs")
         else:
              # Only one PDF in updated_pdfs
             st.write("📥 **Download Updated PDF:**")
             # Extract the single PDF from the dictionary
-            (filename, pdf_stream) = list(st.session_state.updated_pdfs.items())[0]
+            (filename, handle) = list(st.session_state.updated_pdfs.items())[0]
 
-            # Provide a direct download button
-            st.download_button(
-                label=f"📄 Download {filename}",
-                data=pdf_stream.getvalue(),            # The PDF bytes in memory
-                file_name=f"highlighted_{filename}",   # Name to show in "Save As..."
-                mime="application/pdf"
-            )
+            # Large PDFs are linked from storage, others are served from the stored file
+            download_result(handle, f"📄 Download {filename}", f"highlighted_{filename}", "application/pdf")
         
         # CSV Reports
         if st.session_state.csv_reports:
             if len(st.session_state.csv_reports) > 1:
                 st.write("📊 **Download All CSV Reports:**")
-                # Create a zip file of all CSV reports
-                zip_buffer = BytesIO()
-                with zipfile.ZipFile(zip_buffer, 'w') as zip_file:
-                    for filename, csv_report in st.session_state.csv_reports.items():
-                        report_filename = f"keywords_report_{filename.replace('.pdf', '.xlsx')}"
-                        zip_file.writestr(report_filename, csv_report.getvalue())
-                zip_buffer.seek(0)
-                st.download_button(
-                    label="📄 Download All Reports as ZIP",
-                    data=zip_buffer,
-                    file_name="keywords_reports.zip",
-                    mime="application/zip",
-                    key="download_all_reports"
-                )
+                bundle_handle = get_bundle("reports", st.session_state.csv_reports, report_filename)
+                download_result(bundle_handle, "📄 Download All Reports as ZIP", "keywords_reports.zip",
+                                "application/zip", key="download_all_reports")
+                if st.session_state.batch_report is not None:
+                    download_result(
+                        st.session_state.batch_report,
+                        "📄 Download Batch Report (all files, one row per keyword and page)",
+                        "keywords_batch_report.xlsx",
+                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        key="download_batch_report",
+                    )
             else:
                 st.write("📊 **Download CSV Report:**")
                 # Single report, provide individual download button
-                for filename, csv_report in st.session_state.csv_reports.items():
-                    signed_url = generate_signed_url(f"reports/{filename.replace('.pdf', '.xlsx')}")
+                for filename in st.session_state.csv_reports:
+                    signed_url = generate_signed_url(f"reports/{report_filename(filename)}")
                     if signed_url:
                         st.markdown(f"🔗 [Download {filename} Report](<{signed_url}>)")
 
+# -------------------------------
+# Preview Section
+# -------------------------------
+def preview_document_hash(filename, path):
+    """
+    Return the content hash of a stored highlighted PDF, hashed once per session and file.
+    """
+    cached = st.session_state.preview_hashes.get(filename)
+    if cached is None or cached[0] != path:
+        cached = (path, file_content_hash(path))
+        st.session_state.preview_hashes[filename] = cached
+    return cached[1]
+
+@st.fragment
+def preview_section():
+    """
+    Show low-resolution previews of the pages with hits, a screen at a time.
+    Only this section reruns while paging; the next screen is rendered in the background.
+    """
+    if st.session_state.run is not None and not st.session_state.run["finished"]:
+        return
+    filenames = [filename for filename in st.session_state.updated_pdfs if st.session_state.hit_pages.get(filename)]
+    if not filenames:
+        return
+
+    st.write("🔍 **Preview Pages with Hits:**")
+    filename = st.selectbox("File", filenames, key="preview_file")
+    zoom = st.checkbox("Zoom to highlights", value=False, key="preview_zoom")
+    path = result_store.path(st.session_state.updated_pdfs[filename])
+    if path is None:
+        st.warning(f"⚠️ Results for {filename} have expired. Please run the highlighter again.")
+        return
+
+    pages = st.session_state.hit_pages[filename]
+    screens = -(-len(pages) // PREVIEWS_PER_SCREEN)
+    screen = 1
+    if screens > 1:
+        screen = st.number_input(f"Screen (of {screens}, {len(pages)} pages with hits)", min_value=1,
+                                 max_value=screens, value=1, key=f"preview_screen_{filename}")
+    start = (screen - 1) * PREVIEWS_PER_SCREEN
+    visible = pages[start:start + PREVIEWS_PER_SCREEN]
+    dpi = ZOOMED_PREVIEW_DPI if zoom else PREVIEW_DPI
+
+    doc_hash = preview_document_hash(filename, path)
+    with st.spinner("Rendering previews..."):
+        previews = preview_renderer.render(doc_hash, path, [output_page for _, output_page in visible], dpi=dpi,
+                                           clip_to_hits=zoom)
+    following = pages[start + PREVIEWS_PER_SCREEN:start + 2 * PREVIEWS_PER_SCREEN]
+    preview_renderer.prefetch(doc_hash, path, [output_page for _, output_page in following], dpi=dpi,
+                              clip_to_hits=zoom)
+
+    columns = st.columns(PREVIEW_COLUMNS)
+    for index, (page_num, output_page) in enumerate(visible):
+        with columns[index % PREVIEW_COLUMNS]:
+            if output_page in previews:
+                st.image(previews[output_page], caption=f"Page {page_num}", use_column_width=True)
+            else:
+                st.caption(f"Page {page_num}: preview unavailable")
+
 # -------------------------------
 # Main Function
 # -------------------------------
 def main():
+    resume_run_from_url()
     keyword_highlighter_page()
+    run_section()
     download_section()
+    preview_section()
 
-# Execute the main function
-main()
+# Execute the main function. Spawned worker processes import this script as
+# __mp_main__ and must neither render the page nor start a second dispatcher.
+if __name__ == "__main__":
+    job_queue.start()
+    main()
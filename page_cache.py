@@ -0,0 +1,234 @@
+"""
+Persistent cache of per-page search results, shared across documents.
+
+Agenda packs, minutes and reports attach the same planning scheme extracts,
+maps and boilerplate pages again and again. Pages are identified by a digest
+of what determines their text: their content streams and the resources those
+draw with (fonts, form XObjects; image data is left out), resolved through
+indirect references so the same page has the same digest in any document.
+For each page digest and keyword set, the cache keeps the outcome of the
+search and its hits with their highlight rectangles, so a page already
+searched with the same keywords skips extraction and matching. It also keeps
+the extracted character stream and glyph boxes of each page (see
+highlighter.page_chars), so adding a known page to the document index needs
+no extraction either.
+
+Entries live in a SQLite database on local disk; the least recently used
+beyond max_pages are deleted.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import zlib
+
+from highlighter import HIGHLIGHTER_VERSION
+
+# Bump whenever the page digest or the stored entries change; a cache file
+# with an older schema is recreated
+PAGE_CACHE_VERSION = "1"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_hits (
+    key TEXT PRIMARY KEY,
+    outcome TEXT NOT NULL,
+    hits BLOB NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS page_hits_by_use ON page_hits (last_used);
+CREATE TABLE IF NOT EXISTS page_text (
+    digest TEXT PRIMARY KEY,
+    width REAL NOT NULL,
+    height REAL NOT NULL,
+    text TEXT NOT NULL,
+    boxes BLOB NOT NULL,
+    last_used REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS page_text_by_use ON page_text (last_used);
+"""
+
+# SQLite limits the number of parameters of a statement
+QUERY_CHUNK_SIZE = 500
+
+_REFERENCE = re.compile(r"\b(\d+) (\d+) R\b")
+_IMAGE = re.compile(r"/Subtype\s*/Image\b")
+
+
+def _object_digest(pdf_document, xref, memo):
+    """
+    Return the digest of an object, with indirect references replaced by the
+    digests of the objects they point to. Image streams are not read: their
+    pixels do not affect the page text. memo holds the digests of the
+    document's objects computed so far.
+    """
+    if xref in memo:
+        return memo[xref] or b"cycle"
+    memo[xref] = None
+    source = pdf_document.xref_object(xref, compressed=True)
+    digest = hashlib.sha256(_resolve(pdf_document, source, memo))
+    if pdf_document.xref_is_stream(xref) and not _IMAGE.search(source):
+        digest.update(pdf_document.xref_stream_raw(xref) or b"")
+    memo[xref] = digest.digest()
+    return memo[xref]
+
+
+def _resolve(pdf_document, source, memo):
+    """
+    Return object source text as bytes with its indirect references replaced by object digests.
+    """
+    return _REFERENCE.sub(
+        lambda match: _object_digest(pdf_document, int(match.group(1)), memo).hex(), source
+    ).encode("utf-8")
+
+
+def _resources_source(pdf_document, xref):
+    """
+    Return the source of a page's resource dictionary, which may be inherited from the page tree.
+    """
+    seen = set()
+    while xref and xref not in seen:
+        seen.add(xref)
+        kind, value = pdf_document.xref_get_key(xref, "Resources")
+        if kind != "null":
+            return value
+        kind, value = pdf_document.xref_get_key(xref, "Parent")
+        xref = int(value.split()[0]) if kind == "xref" else 0
+    return ""
+
+
+def page_digests(pdf_document, page_numbers):
+    """
+    Return a {page_num: digest} map of the given pages' content and resources (see module docstring).
+    """
+    memo = {}
+    digests = {}
+    for page_num in page_numbers:
+        page = pdf_document.load_page(page_num)
+        digest = hashlib.sha256(repr((tuple(page.rect), page.rotation, tuple(page.mediabox))).encode("utf-8"))
+        for xref in page.get_contents():
+            digest.update(_object_digest(pdf_document, xref, memo))
+        digest.update(_resolve(pdf_document, _resources_source(pdf_document, page.xref), memo))
+        digests[page_num] = digest.hexdigest()
+    return digests
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), QUERY_CHUNK_SIZE):
+        yield items[start:start + QUERY_CHUNK_SIZE]
+
+
+class PageCache:
+    """
+    SQLite-backed cache of page search results and page text, keyed by page digest.
+    Connections are opened per call and instances hold no open resources, so
+    one cache can be shared by Streamlit session threads and passed to worker
+    processes.
+    """
+
+    def __init__(self, path, max_pages=200000):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_pages = max_pages
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            if connection.execute("PRAGMA user_version").fetchone()[0] != int(PAGE_CACHE_VERSION):
+                connection.executescript("DROP TABLE IF EXISTS page_hits; DROP TABLE IF EXISTS page_text;")
+                connection.execute(f"PRAGMA user_version = {int(PAGE_CACHE_VERSION)}")
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @staticmethod
+    def digests(pdf_document, page_numbers):
+        """
+        Return a {page_num: digest} map for the given pages (see page_digests).
+        """
+        return page_digests(pdf_document, page_numbers)
+
+    @staticmethod
+    def _hits_keys(digests, keywords):
+        keyword_hash = hashlib.sha256(json.dumps([HIGHLIGHTER_VERSION, sorted(keywords)]).encode("utf-8")).hexdigest()
+        return {hashlib.sha256(f"{digest}:{keyword_hash}".encode("utf-8")).hexdigest(): digest for digest in digests}
+
+    def get_hits(self, digests, keywords):
+        """
+        Return {digest: (outcome, hits)} for the pages searched before with exactly these keywords.
+        outcome is the scan statistics counter of the page ("pages_with_hits",
+        "pages_skipped" or "pages_without_text") and hits a list of
+        (keyword, rect, snippet) tuples, as found by highlighter.find_page_highlights.
+        """
+        keys = self._hits_keys(digests, keywords)
+        found = {}
+        with self._connect() as connection:
+            for chunk in _chunks(keys):
+                placeholders = ", ".join("?" * len(chunk))
+                for key, outcome, hits in connection.execute(
+                    f"SELECT key, outcome, hits FROM page_hits WHERE key IN ({placeholders})", chunk
+                ):
+                    found[keys[key]] = (outcome, [
+                        (keyword, tuple(rect), snippet) for keyword, rect, snippet in json.loads(zlib.decompress(hits))
+                    ])
+                connection.execute(
+                    f"UPDATE page_hits SET last_used = ? WHERE key IN ({placeholders})", [time.time(), *chunk]
+                )
+        return found
+
+    def put_hits(self, entries, keywords):
+        """
+        Store {digest: (outcome, hits)} search results for a keyword set (see get_hits).
+        """
+        keys = self._hits_keys(entries, keywords)
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO page_hits VALUES (?, ?, ?, ?)", [
+                (key, entries[digest][0], zlib.compress(json.dumps(entries[digest][1]).encode("utf-8")), now)
+                for key, digest in keys.items()
+            ])
+        self.prune()
+
+    def get_text(self, digests):
+        """
+        Return {digest: (width, height, text, boxes)} for known pages; boxes is the
+        zlib-compressed array as stored in the document index.
+        """
+        found = {}
+        with self._connect() as connection:
+            for chunk in _chunks(digests):
+                placeholders = ", ".join("?" * len(chunk))
+                for digest, *row in connection.execute(
+                    f"SELECT digest, width, height, text, boxes FROM page_text WHERE digest IN ({placeholders})", chunk
+                ):
+                    found[digest] = tuple(row)
+                connection.execute(
+                    f"UPDATE page_text SET last_used = ? WHERE digest IN ({placeholders})", [time.time(), *chunk]
+                )
+        return found
+
+    def put_text(self, entries):
+        """
+        Store {digest: (width, height, text, boxes)} page text (see get_text).
+        """
+        now = time.time()
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO page_text VALUES (?, ?, ?, ?, ?, ?)", [
+                (digest, *row, now) for digest, row in entries.items()
+            ])
+        self.prune()
+
+    def prune(self):
+        """
+        Delete the least recently used entries beyond max_pages from each table.
+        """
+        with self._connect() as connection:
+            for table, key in (("page_hits", "key"), ("page_text", "digest")):
+                connection.execute(
+                    f"DELETE FROM {table} WHERE {key} IN "
+                    f"(SELECT {key} FROM {table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_pages,),
+                )
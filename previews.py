@@ -0,0 +1,170 @@
+"""
+Low-resolution previews of the pages with hits.
+
+Pages are rendered on demand with page.get_pixmap in a background process
+pool, optionally clipped to the region of the page's highlights. Each worker
+keeps its most recently used documents open, so paging through the hits of a
+large PDF parses it once, and the rendered PNGs are kept in a size-bounded
+LRU cache keyed by document hash, page, resolution and clipping, so a page is
+never rendered twice while it stays in the cache.
+"""
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+
+from batch import default_worker_count
+from highlighter import ANNOTATION_AUTHOR
+
+PREVIEW_DPI = 40  # Whole-page thumbnails
+ZOOMED_PREVIEW_DPI = 96  # Previews clipped to the highlights
+CLIP_MARGIN = 24  # Points of context kept around the highlights of a clipped preview
+
+# Render processes at most, by default; a screen of previews and the next are rendered at once
+MAX_PREVIEW_WORKERS = 4
+# Documents each worker process keeps open
+MAX_OPEN_DOCUMENTS = 4
+
+# Worker-process state: pdf_path -> open fitz.Document, least recently used first
+_open_documents = OrderedDict()
+
+
+def hit_pages(keyword_occurrences, excerpt=False):
+    """
+    Return (page_num, output_page_num) pairs, 1-based and in page order, for the
+    pages with any hit. page_num is the page of the original document and
+    output_page_num the page of the highlighted output that shows it; with
+    excerpt, the output keeps only the pages with hits (see highlighter.SAVE_EXCERPT).
+    """
+    pages = sorted({page for pages in (keyword_occurrences or {}).values() for page in pages})
+    if excerpt:
+        return list(zip(pages, range(1, len(pages) + 1)))
+    return list(zip(pages, pages))
+
+
+def _document(pdf_path):
+    pdf_document = _open_documents.pop(pdf_path, None)
+    if pdf_document is None:
+        pdf_document = fitz.open(pdf_path)
+        while len(_open_documents) >= MAX_OPEN_DOCUMENTS:
+            _open_documents.popitem(last=False)[1].close()
+    _open_documents[pdf_path] = pdf_document
+    return pdf_document
+
+
+def highlight_region(page):
+    """
+    Return the area around the page's highlights (see highlighter.apply_highlights), or None if it has none.
+    """
+    region = fitz.Rect()
+    for annot in page.annots(types=[fitz.PDF_ANNOT_HIGHLIGHT]):
+        if annot.info["title"] == ANNOTATION_AUTHOR:
+            region |= annot.rect
+    if region.is_empty:
+        return None
+    return (region + (-CLIP_MARGIN, -CLIP_MARGIN, CLIP_MARGIN, CLIP_MARGIN)) & page.rect
+
+
+def render_preview(pdf_path, page_num, dpi=PREVIEW_DPI, clip_to_hits=False):
+    """
+    Worker-process entry point: return a PNG of a page (1-based page_num) with its annotations.
+    With clip_to_hits, only the region around the highlights is rendered.
+    """
+    page = _document(pdf_path).load_page(page_num - 1)
+    clip = highlight_region(page) if clip_to_hits else None
+    return page.get_pixmap(dpi=dpi, clip=clip, annots=True).tobytes("png")
+
+
+class PreviewRenderer:
+    """
+    Background renderer with a size-bounded LRU cache of preview PNGs.
+    Keys are (doc_hash, page_num, dpi, clip_to_hits); doc_hash identifies the
+    content of the PDF at pdf_path. Thread-safe, so one renderer can serve all
+    Streamlit sessions. max_workers defaults to one render process per CPU, up
+    to MAX_PREVIEW_WORKERS.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 ** 2, max_workers=None):
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers or min(default_worker_count(), MAX_PREVIEW_WORKERS)
+        self.total_bytes = 0
+        self.rendered = 0  # Previews rendered, cache hits excluded
+        self._cache = OrderedDict()  # key -> PNG bytes, least recently used first
+        self._pending = {}  # key -> Future of a render in progress
+        self._pool = None
+        # Reentrant: a render finishing before its callback is added runs the callback at once
+        self._lock = threading.RLock()
+
+    def _submit_locked(self, key, pdf_path):
+        if self._pool is None:
+            # Spawn rather than fork: the Streamlit server process is multi-threaded
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        _, page_num, dpi, clip_to_hits = key
+        try:
+            future = self._pool.submit(render_preview, pdf_path, page_num, dpi, clip_to_hits)
+        except BrokenProcessPool:
+            self._pool = None
+            return self._submit_locked(key, pdf_path)
+        self._pending[key] = future
+        future.add_done_callback(lambda done: self._finished(key, done))
+        return future
+
+    def _finished(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+            try:
+                png = future.result()
+            except Exception as e:
+                logging.error(f"Failed to render preview of page {key[1]} of {key[0][:12]}: {e}")
+                if isinstance(e, BrokenProcessPool):
+                    self._pool = None
+                return
+            self.rendered += 1
+            self._cache[key] = png
+            self.total_bytes += len(png)
+            while self.total_bytes > self.max_bytes and len(self._cache) > 1:
+                self.total_bytes -= len(self._cache.popitem(last=False)[1])
+
+    def request(self, doc_hash, pdf_path, page_num, dpi=PREVIEW_DPI, clip_to_hits=False):
+        """
+        Return the PNG of a preview if it is cached; otherwise start rendering it,
+        unless that is already under way, and return the Future of the PNG.
+        """
+        key = (doc_hash, page_num, dpi, clip_to_hits)
+        with self._lock:
+            png = self._cache.get(key)
+            if png is not None:
+                self._cache.move_to_end(key)
+                return png
+            return self._pending.get(key) or self._submit_locked(key, pdf_path)
+
+    def render(self, doc_hash, pdf_path, page_numbers, dpi=PREVIEW_DPI, clip_to_hits=False, timeout=None):
+        """
+        Return {page_num: PNG} for the given pages, rendering the missing ones in
+        parallel and waiting for them. Pages that could not be rendered are left out.
+        """
+        requests = {
+            page_num: self.request(doc_hash, pdf_path, page_num, dpi, clip_to_hits) for page_num in page_numbers
+        }
+        previews = {}
+        for page_num, request in requests.items():
+            if isinstance(request, bytes):
+                previews[page_num] = request
+                continue
+            try:
+                previews[page_num] = request.result(timeout)
+            except Exception:
+                continue  # Logged by _finished
+        return previews
+
+    def prefetch(self, doc_hash, pdf_path, page_numbers, dpi=PREVIEW_DPI, clip_to_hits=False):
+        """
+        Start rendering the given pages in the background, e.g. the next screen of previews.
+        """
+        for page_num in page_numbers:
+            self.request(doc_hash, pdf_path, page_num, dpi, clip_to_hits)
@@ -0,0 +1,238 @@
+"""
+Isolated, resource-limited repair of damaged PDFs.
+
+When MuPDF cannot open a file, the pikepdf fallback may spend minutes of CPU
+or exhaust memory on a pathological upload. PdfRepairer runs the repair in a
+separate, lower-priority process under CPU-time and address-space limits and
+a wall-clock timeout, so a bad file only fails itself. Repaired output, and
+the failures pikepdf reports, are cached by content hash, so the same file is
+never repaired twice. Timeouts and killed repairs are not cached: they may be
+caused by the load of the server rather than by the file.
+
+apply_limits is also used to put the same kind of limits on whole per-file
+jobs in batch worker processes (see batch.highlight_files_parallel).
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+from collections import namedtuple
+
+from result_cache import content_hash
+
+# Limits for one process; None disables a limit.
+# wall_seconds only applies where the parent can kill the process on its own.
+ResourceLimits = namedtuple("ResourceLimits", ["cpu_seconds", "memory_bytes", "wall_seconds"])
+
+DEFAULT_REPAIR_LIMITS = ResourceLimits(cpu_seconds=120, memory_bytes=4 * 1024 ** 3, wall_seconds=180)
+
+REPAIR_NICENESS = 10  # Repairs yield the CPU to highlighting jobs of other users
+
+# Exit codes of a process killed at its soft (SIGXCPU) or hard (SIGKILL) CPU time limit
+_CPU_LIMIT_EXIT_CODES = {-signal.SIGXCPU, -signal.SIGKILL} if hasattr(signal, "SIGXCPU") else set()
+
+
+def file_limits(cpu_seconds=None, memory_bytes=None):
+    """
+    Return (limits, repair_limits) for per-file CPU time and memory caps: the
+    ResourceLimits of each file's worker process (None without caps) and
+    DEFAULT_REPAIR_LIMITS lowered to the caps where those are stricter.
+    """
+    if not cpu_seconds and not memory_bytes:
+        return None, DEFAULT_REPAIR_LIMITS
+    return ResourceLimits(cpu_seconds, memory_bytes, None), ResourceLimits(
+        min(filter(None, [cpu_seconds, DEFAULT_REPAIR_LIMITS.cpu_seconds])),
+        min(filter(None, [memory_bytes, DEFAULT_REPAIR_LIMITS.memory_bytes])),
+        DEFAULT_REPAIR_LIMITS.wall_seconds,
+    )
+
+
+def apply_limits(cpu_seconds=None, memory_bytes=None, niceness=0):
+    """
+    Limit the CPU time and address space of the current process and lower its priority.
+    A process over its CPU time gets SIGXCPU; allocations beyond its address
+    space fail with MemoryError. Limits are skipped where the platform has none.
+    """
+    if niceness:
+        try:
+            os.nice(niceness)
+        except (AttributeError, OSError):
+            pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    if cpu_seconds:
+        # The hard limit leaves a few seconds to exit after SIGXCPU before SIGKILL
+        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_seconds), int(cpu_seconds) + 5))
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (int(memory_bytes), int(memory_bytes)))
+
+
+def _repair_worker(input_path, output_path, error_path, cpu_seconds, memory_bytes):
+    """
+    Child-process entry point: rewrite input_path with pikepdf into output_path.
+    The reason for a failure is written to error_path.
+    """
+    apply_limits(cpu_seconds, memory_bytes, REPAIR_NICENESS)
+    try:
+        import pikepdf
+
+        with pikepdf.open(input_path) as pdf:
+            pdf.save(output_path)
+    except MemoryError:
+        _write_text(error_path, "exceeded the memory limit")
+        raise SystemExit(1)
+    except Exception as e:
+        _write_text(error_path, f"pikepdf could not repair it: {str(e).replace(input_path + ': ', '')}")
+        raise SystemExit(1)
+
+
+def _write_text(path, text):
+    with open(path, "w", encoding="utf-8") as text_file:
+        text_file.write(text)
+
+
+def _read_text(path):
+    try:
+        with open(path, encoding="utf-8") as text_file:
+            return text_file.read()
+    except OSError:
+        return None
+
+
+class PdfRepairer:
+    """
+    Callable repairing PDF bytes in a resource-limited child process, for the
+    repair argument of highlighter.open_pdf_source. Returns the repaired bytes,
+    or None if the file could not be repaired within the limits.
+    At most max_concurrent repairs run at once per process; instances can be
+    passed to worker processes.
+    """
+
+    def __init__(self, cache_dir=None, limits=DEFAULT_REPAIR_LIMITS, max_concurrent=1, max_cached=200):
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.limits = limits
+        self.max_concurrent = max_concurrent
+        self.max_cached = max_cached
+        self.repairs = 0  # Repairs actually run by this instance, cache hits excluded
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_slots"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+
+    def __call__(self, file_content, notify=None):
+        key = content_hash(file_content)
+        cached = self._cached(key)
+        if cached is not None:
+            repaired, reason = cached
+            logging.info(f"Repair of {key[:12]} answered from the repair cache.")
+        else:
+            with self._slots:
+                repaired, reason, cacheable = self._repair(file_content)
+            self.repairs += 1
+            if cacheable:
+                self._store(key, repaired, reason)
+
+        if repaired is None:
+            logging.error(f"Repair of {key[:12]} failed: {reason}")
+            if notify:
+                notify("error", f"⚠️ Failed to repair the PDF: {reason}")
+        return repaired
+
+    def _repair(self, file_content):
+        """
+        Run the repair in a child process; return (repaired_bytes, None, True) or
+        (None, reason, cacheable). Only failures the repair itself reported, which
+        recur for the same file, are cacheable.
+        """
+        with tempfile.TemporaryDirectory(prefix="pdf_repair_", dir=self.cache_dir) as work_dir:
+            input_path = os.path.join(work_dir, "input.pdf")
+            output_path = os.path.join(work_dir, "output.pdf")
+            error_path = os.path.join(work_dir, "error.txt")
+            with open(input_path, "wb") as input_file:
+                input_file.write(file_content)
+
+            process = multiprocessing.get_context("spawn").Process(
+                target=_repair_worker,
+                args=(input_path, output_path, error_path, self.limits.cpu_seconds, self.limits.memory_bytes),
+                name="pdf-repair",
+            )
+            process.start()
+            process.join(self.limits.wall_seconds)
+            if process.is_alive():
+                process.kill()
+                process.join()
+                return None, f"timed out after {self.limits.wall_seconds}s", False
+            if process.exitcode in _CPU_LIMIT_EXIT_CODES:
+                return None, f"exceeded the CPU time limit of {self.limits.cpu_seconds}s", False
+            if process.exitcode != 0:
+                reason = _read_text(error_path)
+                if reason is None:
+                    return None, f"repair process exited with code {process.exitcode}", False
+                return None, reason, True
+            with open(output_path, "rb") as output_file:
+                return output_file.read(), None, True
+
+    def _paths(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf"), os.path.join(self.cache_dir, f"{key}.failed")
+
+    def _cached(self, key):
+        if not self.cache_dir:
+            return None
+        pdf_path, failed_path = self._paths(key)
+        try:
+            with open(pdf_path, "rb") as pdf_file:
+                repaired = pdf_file.read()
+            os.utime(pdf_path)
+            return repaired, None
+        except FileNotFoundError:
+            pass
+        reason = _read_text(failed_path)
+        return (None, reason) if reason is not None else None
+
+    def _store(self, key, repaired, reason):
+        if not self.cache_dir:
+            return
+        pdf_path, failed_path = self._paths(key)
+        path = pdf_path if repaired is not None else failed_path
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if repaired is not None:
+                with open(temp_path, "wb") as pdf_file:
+                    pdf_file.write(repaired)
+            else:
+                _write_text(temp_path, reason)
+            os.replace(temp_path, path)
+            self._prune()
+        except OSError as e:
+            # A full or read-only cache directory must not fail the run
+            logging.error(f"Failed to store repair result in cache: {e}")
+
+    def _prune(self):
+        """
+        Delete the least recently used entries beyond max_cached.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith((".pdf", ".failed")):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except FileNotFoundError:
+                    continue
+        for _, path in sorted(entries, reverse=True)[self.max_cached:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
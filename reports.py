@@ -0,0 +1,143 @@
+"""
+Keyword report generation, independent of the Streamlit UI.
+
+generate_csv_report builds the small per-file workbook in memory.
+BatchReportWriter streams the consolidated report of a whole batch to disk,
+one row per file, keyword and page, as each file completes.
+"""
+import csv
+import os
+import tempfile
+from io import BytesIO
+
+BATCH_REPORT_COLUMNS = ["File", "Keyword", "Page", "Hits", "Context"]
+BATCH_REPORT_FORMATS = ("xlsx", "csv")
+MAX_COLUMN_WIDTH = 100
+
+
+def report_filename(original_filename):
+    """
+    Return the report file name used for a given PDF file name.
+    """
+    return f"keywords_report_{original_filename.replace('.pdf', '.xlsx')}"
+
+
+def generate_csv_report(keyword_occurrences):
+    """
+    Generate a CSV report from keyword occurrences and return it as a BytesIO workbook.
+    """
+    import openpyxl  # Imported on first use to keep start-up fast
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Keywords Report"
+
+    # Write header
+    ws.append(["Keyword", "Occurrences (Page Numbers)"])
+
+    # Write keyword occurrences
+    for keyword, pages in keyword_occurrences.items():
+        if pages:
+            ws.append([keyword, ", ".join(map(str, pages))])
+
+    # Auto-size columns
+    for column_cells in ws.columns:
+        length = max(len(str(cell.value)) for cell in column_cells)
+        ws.column_dimensions[column_cells[0].column_letter].width = length + 2
+
+    # Save to BytesIO
+    excel_output = BytesIO()
+    wb.save(excel_output)
+    excel_output.seek(0)
+    return excel_output
+
+
+class BatchReportWriter:
+    """
+    Consolidated keyword report of a batch, written row by row.
+    "csv" reports are streamed straight to path. "xlsx" reports use an openpyxl
+    write-only workbook, which needs the column widths before its first row:
+    rows are spooled to a temporary CSV file next to path while the running
+    maximum width of each column is tracked, then streamed into the workbook
+    by close(). Memory use does not grow with the number of rows either way.
+    Used as a context manager, the report is deleted if the block fails.
+    """
+
+    def __init__(self, path, report_format=None):
+        self.path = path
+        self.report_format = report_format or os.path.splitext(path)[1].lstrip(".").lower()
+        if self.report_format not in BATCH_REPORT_FORMATS:
+            raise ValueError(f"Unknown report format: {self.report_format}")
+        self.rows = 0
+        self.widths = [len(name) for name in BATCH_REPORT_COLUMNS]
+        if self.report_format == "csv":
+            self._target = path
+        else:
+            fd, self._target = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix="report_", suffix=".csv")
+            os.close(fd)
+        self._file = open(self._target, "w", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(BATCH_REPORT_COLUMNS)
+
+    def add_file(self, filename, page_hits):
+        """
+        Append the rows of one file from its [keyword, page, count, snippet]
+        summaries (see highlighter.collect_page_hits).
+        """
+        for keyword, page, count, snippet in page_hits:
+            row = [filename, keyword, page, count, snippet]
+            for column, value in enumerate(row):
+                self.widths[column] = max(self.widths[column], len(str(value)))
+            self._csv.writerow(row)
+            self.rows += 1
+        self._file.flush()
+
+    def close(self):
+        """
+        Finish the report and return its path.
+        """
+        self._file.close()
+        if self.report_format == "xlsx":
+            try:
+                self._write_workbook()
+            finally:
+                os.remove(self._target)
+        return self.path
+
+    def _write_workbook(self):
+        import openpyxl  # Imported on first use to keep start-up fast
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+        from openpyxl.utils import get_column_letter
+
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("Batch Report")
+        for column, width in enumerate(self.widths, start=1):
+            ws.column_dimensions[get_column_letter(column)].width = min(width + 2, MAX_COLUMN_WIDTH)
+        ws.freeze_panes = "A2"
+
+        with open(self._target, encoding="utf-8", newline="") as spool:
+            rows = csv.reader(spool)
+            ws.append(next(rows))
+            for filename, keyword, page, count, snippet in rows:
+                # Control characters extracted from PDFs are not allowed in worksheets
+                ws.append([filename, keyword, int(page), int(count), ILLEGAL_CHARACTERS_RE.sub("", snippet)])
+        wb.save(self.path)
+
+    def discard(self):
+        """
+        Abandon the report and delete its files.
+        """
+        self._file.close()
+        for path in {self._target, self.path}:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+        return False
@@ -0,0 +1,272 @@
+"""
+Content-addressed cache of highlighting results.
+
+Entries are keyed by a hash of the PDF bytes, the normalized keyword set, the
+save mode and the highlighter version, so the same document highlighted with the same
+keywords is never processed twice, whoever uploads it and under whatever file
+name. A hit returns the stored highlighted PDF, occurrence map and report
+rows without opening the document.
+
+The cache also remembers the latest result of each document and save mode,
+whatever its keywords, so a new selection on a known document can be
+re-highlighted from it (see highlighter.rehighlight_document).
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from highlighter import HIGHLIGHTER_VERSION, SAVE_FULL
+
+# A cache hit: path of the stored highlighted PDF, its keyword occurrences
+# (None when no keyword was found, as returned by highlight_text_in_pdf), its
+# report rows (see highlighter.collect_page_hits) and the keywords it was
+# highlighted with (None for entries stored without them)
+CachedResult = namedtuple("CachedResult", ["pdf_path", "keyword_occurrences", "page_hits", "keywords"],
+                          defaults=(None,))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(file_content):
+    """
+    Return the SHA-256 hex digest of PDF bytes.
+    """
+    digest = hashlib.sha256()
+    view = memoryview(file_content)
+    for start in range(0, len(view), HASH_CHUNK_SIZE):
+        digest.update(view[start:start + HASH_CHUNK_SIZE])
+    return digest.hexdigest()
+
+
+def file_content_hash(path):
+    """
+    Return the SHA-256 hex digest of a file, read in chunks; equal to content_hash of its bytes.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as content_file:
+        for chunk in iter(lambda: content_file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_keywords(selected_keywords):
+    """
+    Return the keyword set in a canonical, order-independent form.
+    """
+    return sorted({keyword.strip() for keyword in selected_keywords if keyword.strip()})
+
+
+def cache_key(file_hash, selected_keywords, save_mode=SAVE_FULL):
+    """
+    Return the cache key for a document hash, keyword selection and save mode.
+    """
+    payload = json.dumps([HIGHLIGHTER_VERSION, file_hash, normalize_keywords(selected_keywords), save_mode])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def latest_key(file_hash, save_mode=SAVE_FULL):
+    """
+    Return the alias under which the latest result of a document hash and save mode is recorded.
+    """
+    payload = json.dumps([HIGHLIGHTER_VERSION, file_hash, save_mode, "latest"])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LocalDirectoryBackend:
+    """
+    Cache backend storing each entry as <key>.pdf and <key>.json in one directory,
+    and each alias as <alias>.alias holding the key it points to.
+    Entries are evicted least-recently-used first once max_bytes is exceeded;
+    access times are kept in the file modification times, so the order
+    survives restarts.
+    """
+
+    def __init__(self, root, max_bytes=20 * 1024 ** 3):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._lock = threading.Lock()
+
+        existing = []
+        for name in os.listdir(root):
+            if name.endswith(".json"):
+                key = name[:-len(".json")]
+                try:
+                    stat = os.stat(self._pdf_path(key))
+                except FileNotFoundError:
+                    continue
+                existing.append((stat.st_mtime, key, stat.st_size))
+        for _, key, size in sorted(existing):
+            self._entries[key] = size
+            self.total_bytes += size
+        for name in os.listdir(root):
+            if name.endswith(".alias") and self.get_alias(name[:-len(".alias")]) is None:
+                self._remove_alias(name[:-len(".alias")])
+
+    def _pdf_path(self, key):
+        return os.path.join(self.root, f"{key}.pdf")
+
+    def _meta_path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def get(self, key):
+        """
+        Return (pdf_path, metadata) for a key, or None if it is not cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._meta_path(key), encoding="utf-8") as meta_file:
+                metadata = json.load(meta_file)
+            os.utime(self._pdf_path(key))
+        except (FileNotFoundError, ValueError):
+            # Removed or damaged by another process sharing the directory
+            with self._lock:
+                self._remove_locked(key)
+            return None
+        return self._pdf_path(key), metadata
+
+    def put(self, key, pdf_data, metadata):
+        """
+        Store PDF data (bytes or a binary file object) and JSON-serializable metadata.
+        """
+        pdf_path = self._pdf_path(key)
+        temp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(pdf_path + temp_suffix, "wb") as pdf_file:
+            if isinstance(pdf_data, (bytes, bytearray, memoryview)):
+                pdf_file.write(pdf_data)
+            else:
+                pdf_data.seek(0)
+                shutil.copyfileobj(pdf_data, pdf_file)
+        with open(self._meta_path(key) + temp_suffix, "w", encoding="utf-8") as meta_file:
+            json.dump(metadata, meta_file)
+        # Publish the PDF before its metadata: an entry only counts once the .json exists
+        os.replace(pdf_path + temp_suffix, pdf_path)
+        os.replace(self._meta_path(key) + temp_suffix, self._meta_path(key))
+
+        size = os.path.getsize(pdf_path)
+        with self._lock:
+            self.total_bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            for old_key in list(self._entries):
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if old_key != key:
+                    self._remove_locked(old_key)
+
+    def get_alias(self, alias):
+        """
+        Return the key an alias points to, or None if the alias or its entry is gone.
+        """
+        try:
+            with open(self._alias_path(alias), encoding="utf-8") as alias_file:
+                key = alias_file.read().strip()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            return key if key in self._entries else None
+
+    def set_alias(self, alias, key):
+        """
+        Point an alias at the key of a stored entry.
+        """
+        temp_path = f"{self._alias_path(alias)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as alias_file:
+            alias_file.write(key)
+        os.replace(temp_path, self._alias_path(alias))
+
+    def _alias_path(self, alias):
+        return os.path.join(self.root, f"{alias}.alias")
+
+    def _remove_alias(self, alias):
+        try:
+            os.remove(self._alias_path(alias))
+        except FileNotFoundError:
+            pass
+
+    def _remove_locked(self, key):
+        size = self._entries.pop(key, None)
+        if size is None:
+            return
+        self.total_bytes -= size
+        for path in (self._meta_path(key), self._pdf_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class ResultCache:
+    """
+    Highlighting result cache with hit/miss counters.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Return a CachedResult for a cache key, or None on a miss.
+        """
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._result(entry)
+
+    @staticmethod
+    def _result(entry):
+        pdf_path, metadata = entry
+        return CachedResult(pdf_path, metadata["keyword_occurrences"], metadata.get("page_hits") or [],
+                            metadata.get("keywords"))
+
+    def put(self, key, pdf_data, keyword_occurrences, page_hits=None, selected_keywords=None, file_hash=None,
+            save_mode=SAVE_FULL):
+        """
+        Store a highlighted PDF, its keyword occurrences and report rows under a cache key.
+        With the keywords and the document's hash, the entry also becomes the
+        document's latest result for its save mode (see latest).
+        """
+        metadata = {"keyword_occurrences": keyword_occurrences, "page_hits": page_hits or [], "stored_at": time.time()}
+        if selected_keywords is not None:
+            metadata["keywords"] = normalize_keywords(selected_keywords)
+        try:
+            self.backend.put(key, pdf_data, metadata)
+            if selected_keywords is not None and file_hash:
+                self.backend.set_alias(latest_key(file_hash, save_mode), key)
+        except OSError as e:
+            # A full or read-only cache directory must not fail the run
+            logging.error(f"Failed to store result in cache: {e}")
+
+    def set_latest(self, key, file_hash, save_mode=SAVE_FULL):
+        """
+        Make a stored entry the document's latest result for its save mode, e.g. after a cache hit.
+        """
+        try:
+            self.backend.set_alias(latest_key(file_hash, save_mode), key)
+        except OSError as e:
+            logging.error(f"Failed to record latest result in cache: {e}")
+
+    def latest(self, file_hash, save_mode=SAVE_FULL):
+        """
+        Return the CachedResult most recently stored or used for a document hash and
+        save mode, whatever its keywords, or None. Hit and miss counters are not changed.
+        """
+        key = self.backend.get_alias(latest_key(file_hash, save_mode))
+        entry = self.backend.get(key) if key else None
+        if entry is None:
+            return None
+        result = self._result(entry)
+        return result if result.keywords is not None else None
@@ -0,0 +1,163 @@
+"""
+Disk-backed storage for highlighted PDFs and reports.
+
+Results are written to files under one local directory shared by all sessions
+in the process. Sessions keep only lightweight ResultHandles. The store has a
+total size budget, evicts least-recently-used results beyond it, expires
+results that have not been accessed within a TTL, and deletes a session's
+results when the session goes away.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, namedtuple
+
+# Reference to a stored result; safe to keep in st.session_state
+ResultHandle = namedtuple("ResultHandle", ["key", "name", "size"])
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class ResultStore:
+    """
+    Size-bounded, TTL-evicting store of result files on local disk.
+    All methods are thread-safe, since Streamlit runs each session in its own thread.
+    """
+
+    def __init__(self, root=None, max_bytes=10 * 1024 ** 3, ttl_seconds=6 * 3600):
+        if root is None:
+            root = tempfile.mkdtemp(prefix="pdf_highlighter_results_")
+            # Remove the whole directory when the process exits
+            weakref.finalize(self, shutil.rmtree, root, ignore_errors=True)
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> [session_id, path, size, last_access], oldest first
+        self._lock = threading.Lock()
+
+    def put(self, session_id, name, data):
+        """
+        Write data (bytes or a binary file object) to disk and return its ResultHandle.
+        May evict older results to stay within the size budget.
+        """
+        key = uuid.uuid4().hex
+        path = os.path.join(self.root, key)
+        with open(path, "wb") as result_file:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                result_file.write(data)
+            else:
+                data.seek(0)
+                shutil.copyfileobj(data, result_file, COPY_CHUNK_SIZE)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            self._entries[key] = [session_id, path, size, time.monotonic()]
+            self.total_bytes += size
+            self._evict_locked(keep=key)
+        return ResultHandle(key, name, size)
+
+    def put_file(self, session_id, name, path):
+        """
+        Move an existing file (on the same file system, e.g. created under root)
+        into the store and return its ResultHandle.
+        """
+        key = uuid.uuid4().hex
+        stored_path = os.path.join(self.root, key)
+        os.replace(path, stored_path)
+        size = os.path.getsize(stored_path)
+
+        with self._lock:
+            self._entries[key] = [session_id, stored_path, size, time.monotonic()]
+            self.total_bytes += size
+            self._evict_locked(keep=key)
+        return ResultHandle(key, name, size)
+
+    def path(self, handle):
+        """
+        Return the file path for a handle and mark it as recently used,
+        or None if the result has been evicted.
+        """
+        with self._lock:
+            entry = self._entries.get(handle.key)
+            if entry is None:
+                return None
+            entry[3] = time.monotonic()
+            self._entries.move_to_end(handle.key)
+            return entry[1]
+
+    def open(self, handle):
+        """
+        Open a stored result for reading, or return None if it has been evicted.
+        """
+        path = self.path(handle)
+        if path is None:
+            return None
+        try:
+            return open(path, "rb")
+        except FileNotFoundError:
+            return None
+
+    def discard(self, handle):
+        """
+        Delete a single result.
+        """
+        with self._lock:
+            self._remove_locked(handle.key)
+
+    def release_session(self, session_id):
+        """
+        Delete every result that belongs to a session.
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == session_id]:
+                self._remove_locked(key)
+        logging.info(f"Released stored results for session {session_id}.")
+
+    def evict(self):
+        """
+        Apply TTL expiry and the size budget now.
+        """
+        with self._lock:
+            self._evict_locked()
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.total_bytes -= entry[2]
+        try:
+            os.remove(entry[1])
+        except FileNotFoundError:
+            pass
+
+    def _evict_locked(self, keep=None):
+        expired_before = time.monotonic() - self.ttl_seconds
+        for key in [key for key, entry in self._entries.items() if entry[3] < expired_before]:
+            self._remove_locked(key)
+
+        # Least recently used first, but never the result that was just added
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key != keep:
+                logging.info(f"Evicting stored result {key} to stay within the size budget.")
+                self._remove_locked(key)
+
+
+class ResultSession:
+    """
+    Identifies one user session's results in a ResultStore.
+    Keep it in st.session_state: when the session ends and its state is
+    garbage collected, the session's results are deleted from the store.
+    """
+
+    def __init__(self, store):
+        self.session_id = uuid.uuid4().hex
+        self._finalizer = weakref.finalize(self, store.release_session, self.session_id)
@@ -0,0 +1,103 @@
+"""
+Cache of signed download URLs.
+
+Signing a GCS URL is an RSA operation, and the download section signs a URL
+for every stored result on every rerun. SignedUrlCache keeps each URL by blob
+name and content hash and signs again only when the URL is within
+refresh_margin seconds of expiring, so reruns normally sign nothing and a
+link handed out is always valid for at least refresh_margin seconds. A blob
+re-uploaded with different content gets a new URL.
+
+sign is any callable sign(blob_name, expiration_seconds) returning a URL,
+such as the signed_url method of the storage backends in uploads.py.
+FakeSigner stands in for GCS in tests and benchmarks.
+"""
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+
+class SignedUrlCache:
+    """
+    Thread-safe LRU cache of signed URLs, shared by all Streamlit sessions.
+    :param sign: Callable sign(blob_name, expiration_seconds) returning a signed URL.
+    :param expiration: Lifetime in seconds of the URLs signed.
+    :param refresh_margin: URLs with less than this many seconds left are signed again.
+    :param max_entries: Least recently used URLs beyond this are dropped.
+    :param clock: Returns the current time in seconds since the epoch.
+    """
+
+    def __init__(self, sign, expiration=3600, refresh_margin=600, max_entries=10000, clock=time.time):
+        if refresh_margin >= expiration:
+            raise ValueError("refresh_margin must be shorter than expiration")
+        self.sign = sign
+        self.expiration = expiration
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.signed = 0  # URLs signed, cache hits excluded
+        self.sign_seconds = 0.0
+        self._urls = OrderedDict()  # (blob_name, content_hash) -> (url, expires), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, blob_name, content_hash=None):
+        """
+        Return a signed URL of blob_name valid for at least refresh_margin seconds.
+        content_hash identifies the blob's content; a URL cached for other content is not reused.
+        """
+        key = (blob_name, content_hash)
+        now = self.clock()
+        with self._lock:
+            cached = self._urls.get(key)
+            if cached is not None and now < cached[1] - self.refresh_margin:
+                self._urls.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+
+        # Signed outside the lock; two sessions signing the same blob at once both get a valid URL
+        started = time.perf_counter()
+        url = self.sign(blob_name, self.expiration)
+        elapsed = time.perf_counter() - started
+        logging.info(f"Signed a URL for {blob_name} in {elapsed * 1000:.1f} ms.")
+        with self._lock:
+            self.signed += 1
+            self.sign_seconds += elapsed
+            self._urls[key] = (url, now + self.expiration)
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+        return url
+
+    def invalidate(self, blob_name):
+        """
+        Drop the cached URLs of a blob, e.g. after it was deleted.
+        """
+        with self._lock:
+            for key in [key for key in self._urls if key[0] == blob_name]:
+                del self._urls[key]
+
+
+class FakeSigner:
+    """
+    Stand-in for GCS URL signing in tests and benchmarks. It returns
+    deterministic URLs under base_url, signed with an HMAC of the blob name and
+    expiry time, and counts its calls in the calls attribute.
+    """
+
+    def __init__(self, base_url="http://127.0.0.1:4443/pdf-highlighter-upload", key=b"fake-signing-key",
+                 clock=time.time):
+        self.base_url = base_url.rstrip("/")
+        self.key = key
+        self.clock = clock
+        self.calls = 0
+
+    def __call__(self, blob_name, expiration=3600):
+        self.calls += 1
+        expires = int(self.clock()) + int(expiration)
+        signature = hmac.new(self.key, f"{blob_name}\n{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+        return f"{self.base_url}/{quote(blob_name)}?Expires={expires}&Signature={signature}"
@@ -0,0 +1,237 @@
+"""
+Background uploads of originals, highlighted PDFs and reports.
+
+UploadQueue runs uploads on a bounded thread pool so highlighting continues
+while files are transferred. Before transferring, an upload compares the MD5
+of the data with the object already stored under the same name and skips it
+when they match, so re-uploading the same document is free. Storage backends
+are pluggable: GCSStorage wraps a google.cloud.storage bucket, LocalStorage
+keeps objects in a local directory and stands in for GCS in tests and
+offline runs.
+"""
+import base64
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from instrumentation import log_metrics
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Objects larger than this are sent as chunked, resumable uploads
+RESUMABLE_THRESHOLD = 8 * 1024 * 1024
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024  # Must be a multiple of 256 KB
+
+
+def _hash_source(source, digest):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), HASH_CHUNK_SIZE):
+            digest.update(view[start:start + HASH_CHUNK_SIZE])
+    else:
+        with open(source, "rb") as source_file:
+            for chunk in iter(lambda: source_file.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest
+
+
+def md5_base64(source):
+    """
+    Return the base64-encoded MD5 digest (the format GCS reports) of bytes or a file path.
+    """
+    return base64.b64encode(_hash_source(source, hashlib.md5()).digest()).decode("ascii")
+
+
+def sha256_hex(source):
+    """
+    Return the SHA-256 hex digest of bytes or a file path, as result_cache.content_hash does.
+    """
+    return _hash_source(source, hashlib.sha256()).hexdigest()
+
+
+def _open_source(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return BytesIO(source)  # Shares bytes, no copy
+    return open(source, "rb")
+
+
+def _source_size(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).nbytes
+    return os.path.getsize(source)
+
+
+class GCSStorage:
+    """
+    Storage backend for a Google Cloud Storage bucket.
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def stored_md5(self, blob_name):
+        """
+        Return the MD5 of the stored object, or None if it does not exist.
+        """
+        blob = self.bucket.get_blob(blob_name)
+        return blob.md5_hash if blob is not None else None
+
+    def upload(self, blob_name, source):
+        """
+        Upload bytes or a file path; large objects use a resumable upload in chunks.
+        """
+        blob = self.bucket.blob(blob_name)
+        size = _source_size(source)
+        if size > RESUMABLE_THRESHOLD:
+            # A failed chunk is retried on its own instead of restarting the upload
+            blob.chunk_size = RESUMABLE_CHUNK_SIZE
+        with _open_source(source) as source_file:
+            blob.upload_from_file(source_file, size=size, checksum="md5")
+
+    def signed_url(self, blob_name, expiration=3600):
+        return self.bucket.blob(blob_name).generate_signed_url(expiration=expiration)
+
+
+class LocalStorage:
+    """
+    Storage backend keeping objects as files under a local directory.
+    """
+
+    def __init__(self, root):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+
+    def _path(self, blob_name):
+        return os.path.join(self.root, *blob_name.split("/"))
+
+    def stored_md5(self, blob_name):
+        path = self._path(blob_name)
+        return md5_base64(path) if os.path.exists(path) else None
+
+    def upload(self, blob_name, source):
+        path = self._path(blob_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with _open_source(source) as source_file, open(temp_path, "wb") as target_file:
+            shutil.copyfileobj(source_file, target_file, HASH_CHUNK_SIZE)
+        os.replace(temp_path, path)
+
+    def signed_url(self, blob_name, expiration=3600):
+        return Path(os.path.abspath(self._path(blob_name))).as_uri()
+
+
+class UploadQueue:
+    """
+    Bounded background upload pool shared by all sessions.
+    submit() blocks once max_pending uploads are queued, which bounds the
+    memory held by data waiting to be uploaded.
+    """
+
+    def __init__(self, storage, max_workers=4, max_pending=32):
+        self.storage = storage
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._uploaded = {}  # blob_name -> MD5 of the data this process last stored there
+        self._blob_locks = {}  # blob_name -> Lock, so uploads to one name run one at a time
+        self.uploaded_count = 0
+        self.skipped_count = 0
+        self.uploaded_bytes = 0
+        self.upload_seconds = 0.0  # Summed over uploads, including the MD5 comparison
+
+    def submit(self, blob_name, data):
+        """
+        Queue an upload of data (bytes, a BytesIO or a file path) to blob_name.
+        Returns a Future resolving to True if the data was transferred and
+        False if an identical object was already stored.
+        """
+        if hasattr(data, "getvalue"):
+            # Upload a snapshot: the caller may keep reading and seeking the stream
+            data = data.getvalue()
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._upload, blob_name, data)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def submit_by_content(self, blob_name_for, data):
+        """
+        Queue an upload of data to a blob named after its content. The SHA-256 of
+        the data is computed in the background, then uploaded to
+        blob_name_for(content_hash). Returns a Future resolving to
+        (blob_name, content_hash) once the data is stored.
+        """
+        if hasattr(data, "getvalue"):
+            data = data.getvalue()
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._upload_by_content, blob_name_for, data)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def uploaded_md5(self, blob_name):
+        """
+        Return the MD5 of the data this process last stored at blob_name, or None.
+        """
+        with self._lock:
+            return self._uploaded.get(blob_name)
+
+    def _upload(self, blob_name, data):
+        with self._lock:
+            blob_lock = self._blob_locks.setdefault(blob_name, threading.Lock())
+        # A second upload of the same data waits for the first and is then skipped
+        with blob_lock:
+            return self._upload_locked(blob_name, data)
+
+    def _upload_by_content(self, blob_name_for, data):
+        content_hash = sha256_hex(data)
+        blob_name = blob_name_for(content_hash)
+        self._upload(blob_name, data)
+        return blob_name, content_hash
+
+    def _upload_locked(self, blob_name, data):
+        started = time.perf_counter()
+        try:
+            md5 = md5_base64(data)
+            with self._lock:
+                known = self._uploaded.get(blob_name) == md5
+            if known or self.storage.stored_md5(blob_name) == md5:
+                logging.info(f"Skipped upload of {blob_name}: identical object already stored.")
+                self._record(blob_name, started, 0)
+                with self._lock:
+                    self._uploaded[blob_name] = md5
+                    self.skipped_count += 1
+                return False
+            self.storage.upload(blob_name, data)
+        except Exception as e:
+            logging.error(f"Failed to upload {blob_name}: {e}")
+            raise
+        size = _source_size(data)
+        self._record(blob_name, started, size)
+        with self._lock:
+            self._uploaded[blob_name] = md5
+            self.uploaded_count += 1
+            self.uploaded_bytes += size
+        logging.info(f"Uploaded {blob_name}.")
+        return True
+
+    def _record(self, blob_name, started, size):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.upload_seconds += elapsed
+        log_metrics("upload", blob_name, {"upload_seconds": elapsed, "uploaded_bytes": size})
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)